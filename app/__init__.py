@@ -2,21 +2,75 @@ from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 import os
 from dotenv import load_dotenv
+from app.database import configure_sqlite, engine_options_from_env, sqlite_settings_from_env
+from app.logs import configure_logging
+from app.sites import SiteSession, sites
 
 load_dotenv()
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': SiteSession})
 
-def create_app():
+def create_app(run_migrations=True, use_spool=False):
+    configure_logging(os.getenv('LOG_LEVEL', 'INFO'), os.getenv('LOG_FORMAT', 'text'))
     app = Flask(__name__, template_folder='../templates', static_folder='../static')
     
     app.config['SECRET_KEY'] = os.getenv('FLASK_SECRET_KEY', 'dev-key')
     basedir = os.path.abspath(os.path.dirname(os.path.dirname(__file__)))
-    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{os.path.join(basedir, "data", "temperatures.db")}'
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv(
+        'DATABASE_URL', f'sqlite:///{os.path.join(basedir, "data", "temperatures.db")}'
+    )
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options_from_env(app.config['SQLALCHEMY_DATABASE_URI'])
+    app.config['RESPONSE_CACHE_TTL'] = int(os.getenv('RESPONSE_CACHE_TTL', 300))
+    app.config['RESPONSE_CACHE_MAX_ENTRIES'] = int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', 256))
+    app.config['SQLITE_SETTINGS'] = sqlite_settings_from_env()
+    app.config['STORAGE_BACKEND'] = os.getenv('STORAGE_BACKEND', 'sql')
+    app.config['COLUMNAR_STORAGE_PATH'] = os.getenv(
+        'COLUMNAR_STORAGE_PATH', os.path.join(basedir, 'data', 'columnar')
+    )
+    app.config['SSE_POLL_SECONDS'] = float(os.getenv('SSE_POLL_SECONDS', 2))
+    app.config['SSE_KEEPALIVE_SECONDS'] = float(os.getenv('SSE_KEEPALIVE_SECONDS', 15))
+    # Each open stream holds a server thread; keep the other half for API requests
+    app.config['SSE_MAX_SUBSCRIBERS'] = int(os.getenv(
+        'SSE_MAX_SUBSCRIBERS', max(1, int(os.getenv('WEB_THREADS', 8)) // 2)
+    ))
+    app.config['STATS_ENGINE'] = os.getenv('STATS_ENGINE', 'true').lower() in ('1', 'true', 'yes')
+    app.config['SITES_FILE'] = os.getenv('SITES_FILE')
+    from app.spool import default_spool_path
+    # Only collecting processes write to the spool; web workers never create it
+    app.config['SPOOL_PATH'] = (
+        os.getenv('SPOOL_PATH', default_spool_path(app.config['SQLALCHEMY_DATABASE_URI'])) if use_spool else None
+    )
+    app.config['SPOOL_REPLAY_SECONDS'] = float(os.getenv('SPOOL_REPLAY_SECONDS', 5))
+    app.config['ANALYTICS_MAX_GAP_SECONDS'] = float(os.getenv('ANALYTICS_MAX_GAP_SECONDS', 900))
+    app.config['ANALYTICS_CACHE_BUCKETS'] = int(os.getenv('ANALYTICS_CACHE_BUCKETS', 50000))
     
+    # Registers a bind per sharded site, so it has to come before db.init_app
+    sites.init_app(app)
     db.init_app(app)
     
+    from app import metrics
+    metrics.init_app(app)
+    
+    from app.cache import response_cache
+    response_cache.init_app(app)
+    
+    from app.storage import storage
+    storage.init_app(app)
+    
+    from app.live import broadcaster
+    broadcaster.init_app(app)
+    
+    from app.stats_engine import stats_engine
+    stats_engine.init_app(app)
+    
+    from app.analytics import analytics
+    analytics.init_app(app)
+    
+    from app.spool import spool, spool_replayer
+    spool.init_app(app)
+    spool_replayer.init_app(app)
+    
     from app.routes import main
     app.register_blueprint(main)
     
@@ -24,6 +78,10 @@ def create_app():
     init_swagger(app)
     
     with app.app_context():
-        db.create_all()
+        # The main database plus one per sharded site, all with the same schema
+        from app.migrations import prepare
+        for engine in db.engines.values():
+            configure_sqlite(engine, app.config['SQLITE_SETTINGS'])
+            prepare(engine, db.metadata, run_migrations)
     
     return app
\ No newline at end of file
@@ -0,0 +1,391 @@
+"""Per-device HVAC and thermal analytics over a time window.
+
+For each device the window yields:
+
+- heating/cooling runtime, duty cycle (share of the covered time the HVAC
+  was running), cycle count and average cycle length
+- heat-up and cool-down rates: how fast the indoor temperature moves while
+  heating or cooling
+- a first-order thermal model fitted by least squares over the intervals
+  the HVAC was off: ``dT/dt = gain - loss * (indoor - outside)``. ``loss``
+  (per hour) and its inverse, the time constant, describe the insulation;
+  the heating and cooling power are what the HVAC adds on top while running.
+
+Every consecutive pair of readings of a device is an interval, with the
+HVAC state of its first reading. Pairs further apart than
+``ANALYTICS_MAX_GAP_SECONDS`` are gaps and count towards nothing. The
+readings are loaded into column arrays and each quantity is a weighted sum
+over intervals (``np.bincount`` by device and hour), so the work is a
+handful of vectorized passes however long the window is.
+
+The sums are additive, so they are kept per device and hourly rollup
+bucket and a window adds up its buckets. A cached bucket is reused while
+the hourly rollups of it and its neighbours (whose readings open and close
+its intervals) still have the same count and temperature sum, so only the
+current hour and buckets that got late readings are read back from
+storage. Windows are rounded out to whole hours. The columnar backend has
+no rollups to check against and computes every window from its arrays.
+
+Hours before the first raw reading of the window, i.e. past the raw
+retention, are estimated from the hourly rollups instead: each bucket
+with readings counts as a covered hour, and its share of heating and
+cooling readings as runtime. Those hours go into the covered hours,
+runtime and duty cycles, and are reported as ``estimated_hours``. Cycles,
+rates and the thermal model need consecutive readings and come from the
+raw readings only. ``source`` says which of the two a window used.
+"""
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import numpy as np
+from sqlalchemy import func
+from app import db
+from app.models import ReadingRollup
+from app.rollups import EPOCH, HOUR, bucket_floor
+from app.sites import current_site_id
+from app.storage import storage
+
+ANALYTICS_FIELDS = ('timestamp', 'device_name', 'temperature_c', 'outside_temperature_c', 'hvac_state')
+
+# Sums kept per device and hour; *_hours, *_x, *_y, *_xx, *_xy and *_yy are
+# the least-squares sums of rate (y, °C/h) against indoor - outside (x, °C)
+# weighted by interval length in hours
+SUMS = (
+    'seconds', 'heating_seconds', 'cooling_seconds', 'heating_cycles', 'cooling_cycles',
+    'heating_change', 'cooling_change',
+    'idle_hours', 'idle_x', 'idle_y', 'idle_xx', 'idle_xy', 'idle_yy',
+    'heating_hours', 'heating_x', 'heating_y',
+    'cooling_hours', 'cooling_x', 'cooling_y',
+)
+
+
+def _epoch_seconds(timestamp):
+    return (timestamp - EPOCH).total_seconds()
+
+
+def column_arrays(rows):
+    """Readings of ``ANALYTICS_FIELDS`` as arrays sorted by device, then time.
+
+    Returns (device names, device index per reading, epoch seconds,
+    temperature, outside temperature, heating, cooling); missing
+    temperatures are NaN.
+    """
+    rows = list(rows)
+    if not rows:
+        return None
+    timestamps, devices, temperatures, outside, states = zip(*rows)
+    seconds = (np.array(timestamps, dtype='datetime64[us]') - np.datetime64(EPOCH, 'us')).astype('int64') / 1e6
+    names, device = np.unique(np.array(devices, dtype=object).astype(str), return_inverse=True)
+    states = np.array(states, dtype=object)
+    order = np.lexsort((seconds, device))
+    return (
+        names.tolist(),
+        device[order],
+        seconds[order],
+        np.array(temperatures, dtype=float)[order],
+        np.array(outside, dtype=float)[order],
+        (states == 'HEATING')[order],
+        (states == 'COOLING')[order],
+    )
+
+
+def bucket_sums(columns, start, end, max_gap):
+    """``SUMS`` per device and hourly bucket for intervals starting in [start, end).
+
+    ``start`` and ``end`` are epoch seconds on hour boundaries; the readings
+    should reach ``max_gap`` either side so the edge intervals are whole.
+    Returns an array of shape (devices, hours, len(SUMS)).
+    """
+    names, device, seconds, temperature, outside, heating, cooling = columns
+    hours = int((end - start) // HOUR)
+    groups = len(names) * hours
+
+    dt = np.diff(seconds)
+    # Interval i runs from reading i to reading i + 1 in reading i's state
+    joined = (device[1:] == device[:-1]) & (dt > 0) & (dt <= max_gap)
+    begins = seconds[:-1]
+    valid = joined & ~np.isnan(temperature[:-1]) & ~np.isnan(temperature[1:]) & (begins >= start) & (begins < end)
+    group = device[:-1] * hours + ((begins - start) // HOUR).astype('int64')
+    group, dt = group[valid], dt[valid]
+    change = np.diff(temperature)[valid]
+    running_heat, running_cool = heating[:-1][valid], cooling[:-1][valid]
+    idle = ~running_heat & ~running_cool
+
+    weight = dt / 3600
+    rate = change / weight
+    x = (temperature[:-1] - outside[:-1])[valid]
+    fitted = ~np.isnan(x)
+    x = np.where(fitted, x, 0.0)
+
+    # A cycle starts at a running reading not joined to a running one before it
+    in_range = (seconds >= start) & (seconds < end)
+    after_heating = np.concatenate(([False], joined & heating[:-1]))
+    after_cooling = np.concatenate(([False], joined & cooling[:-1]))
+    row_group = device * hours + ((seconds - start) // HOUR).astype('int64')
+
+    def total(values, mask=None):
+        if mask is None:
+            return np.bincount(group, weights=values, minlength=groups)
+        return np.bincount(group[mask], weights=values[mask], minlength=groups)
+
+    def starts(running, after_running):
+        mask = running & ~after_running & in_range
+        return np.bincount(row_group[mask], minlength=groups).astype(float)
+
+    idle_fit, heating_fit, cooling_fit = idle & fitted, running_heat & fitted, running_cool & fitted
+    sums = [
+        total(dt),
+        total(dt, running_heat),
+        total(dt, running_cool),
+        starts(heating, after_heating),
+        starts(cooling, after_cooling),
+        total(change, running_heat),
+        total(change, running_cool),
+        total(weight, idle_fit),
+        total(weight * x, idle_fit),
+        total(change, idle_fit),
+        total(weight * x * x, idle_fit),
+        total(change * x, idle_fit),
+        total(change * rate, idle_fit),
+        total(weight, heating_fit),
+        total(weight * x, heating_fit),
+        total(change, heating_fit),
+        total(weight, cooling_fit),
+        total(weight * x, cooling_fit),
+        total(change, cooling_fit),
+    ]
+    return np.stack(sums, axis=1).reshape(len(names), hours, len(SUMS))
+
+
+def _ratio(numerator, denominator, scale=1.0, digits=3):
+    return round(numerator / denominator * scale, digits) if denominator else None
+
+
+def thermal_model(sums):
+    """Loss coefficient, time constant, gains and fit quality from ``SUMS`` totals"""
+    w, sx, sy, sxx, sxy, syy = (sums[name] for name in (
+        'idle_hours', 'idle_x', 'idle_y', 'idle_xx', 'idle_xy', 'idle_yy'))
+    spread = w * sxx - sx * sx
+    model = {
+        'loss_per_hour': None,
+        'time_constant_hours': None,
+        'internal_gain_c_per_hour': None,
+        'heating_power_c_per_hour': None,
+        'cooling_power_c_per_hour': None,
+        'r_squared': None,
+        'idle_hours': round(w, 2),
+    }
+    # Needs the indoor-outside difference to have varied while idle
+    if w <= 0 or spread <= 1e-9 * w * w:
+        return model
+    slope = (w * sxy - sx * sy) / spread
+    intercept = (sy - slope * sx) / w
+    total = syy - sy * sy / w
+    residual = syy - intercept * sy - slope * sxy
+    model.update({
+        'loss_per_hour': round(-slope, 4),
+        'time_constant_hours': round(-1 / slope, 1) if slope < 0 else None,
+        'internal_gain_c_per_hour': round(intercept, 3),
+        'r_squared': round(1 - residual / total, 3) if total > 0 else None,
+    })
+    # What the HVAC adds on top of the idle model while it runs
+    if sums['heating_hours'] > 0:
+        model['heating_power_c_per_hour'] = round(
+            (sums['heating_y'] - intercept * sums['heating_hours'] - slope * sums['heating_x'])
+            / sums['heating_hours'], 3)
+    if sums['cooling_hours'] > 0:
+        model['cooling_power_c_per_hour'] = round(
+            -(sums['cooling_y'] - intercept * sums['cooling_hours'] - slope * sums['cooling_x'])
+            / sums['cooling_hours'], 3)
+    return model
+
+
+def summarize(device_name, totals, estimated=(0.0, 0.0, 0.0)):
+    """The per-device analytics for a window from its summed ``SUMS``.
+
+    ``estimated`` is (hours, heating hours, cooling hours) from the hourly
+    rollups of the part of the window without raw readings.
+    """
+    sums = dict(zip(SUMS, totals.tolist()))
+    heating_cycles, cooling_cycles = int(sums['heating_cycles']), int(sums['cooling_cycles'])
+    estimated_hours, estimated_heating, estimated_cooling = estimated
+    covered = sums['seconds'] + estimated_hours * 3600
+    heating = sums['heating_seconds'] + estimated_heating * 3600
+    cooling = sums['cooling_seconds'] + estimated_cooling * 3600
+    return {
+        'device_name': device_name,
+        'covered_hours': round(covered / 3600, 2),
+        'estimated_hours': round(estimated_hours, 2),
+        'heating_hours': round(heating / 3600, 2),
+        'cooling_hours': round(cooling / 3600, 2),
+        'heating_duty_cycle': _ratio(heating, covered),
+        'cooling_duty_cycle': _ratio(cooling, covered),
+        'heating_cycles': heating_cycles,
+        'cooling_cycles': cooling_cycles,
+        'avg_heating_cycle_minutes': _ratio(sums['heating_seconds'], heating_cycles, 1 / 60, 1),
+        'avg_cooling_cycle_minutes': _ratio(sums['cooling_seconds'], cooling_cycles, 1 / 60, 1),
+        'heat_up_c_per_hour': _ratio(sums['heating_change'], sums['heating_seconds'], 3600),
+        'cool_down_c_per_hour': _ratio(-sums['cooling_change'], sums['cooling_seconds'], 3600),
+        'thermal_model': thermal_model(sums),
+    }
+
+
+class Analytics:
+    """Window analytics with per-bucket sums cached across requests and sites"""
+    def __init__(self, max_gap=900, max_buckets=50000):
+        self.max_gap = max_gap
+        self.max_buckets = max_buckets
+        # (site id, device name, bucket start) -> (fingerprint, sums)
+        self.buckets = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def init_app(self, app):
+        self.max_gap = app.config.get('ANALYTICS_MAX_GAP_SECONDS', self.max_gap)
+        self.max_buckets = app.config.get('ANALYTICS_CACHE_BUCKETS', self.max_buckets)
+        self.clear()
+
+    def clear(self):
+        with self.lock:
+            self.buckets.clear()
+
+    def compute(self, start, end, device=None):
+        """(device names, ``bucket_sums``) read from storage for hours in [start, end)"""
+        margin = timedelta(seconds=self.max_gap)
+        columns = column_arrays(storage.readings(start - margin, ANALYTICS_FIELDS, until=end + margin, device=device))
+        if columns is None:
+            return [], np.zeros((0, 0, len(SUMS)))
+        return columns[0], bucket_sums(columns, _epoch_seconds(start), _epoch_seconds(end), self.max_gap)
+
+    def fingerprints(self, start, end, device=None):
+        """{(device, bucket start): fingerprint} for the hourly buckets with readings in [start, end)"""
+        r = ReadingRollup
+        query = db.session.query(r.device_name, r.bucket_start, r.count, r.temperature_sum).filter(
+            r.site_id == current_site_id(),
+            r.resolution == HOUR,
+            r.bucket_start >= start - timedelta(seconds=HOUR),
+            r.bucket_start < end + timedelta(seconds=HOUR),
+        )
+        if device is not None:
+            query = query.filter(r.device_name == device)
+        buckets = {(name, bucket): (count, total) for name, bucket, count, total in query}
+        hour = timedelta(seconds=HOUR)
+        return {
+            (name, bucket): (buckets.get((name, bucket - hour), (0,))[0], own, buckets.get((name, bucket + hour), (0,))[0])
+            for (name, bucket), own in buckets.items()
+            if start <= bucket < end
+        }
+
+    def cached_sums(self, start, end, device=None):
+        """{device name: summed ``SUMS``} over [start, end), reusing unchanged buckets"""
+        site_id = current_site_id()
+        fingerprints = self.fingerprints(start, end, device)
+        totals = {}
+        dirty = set()
+        with self.lock:
+            for (name, bucket), fingerprint in fingerprints.items():
+                entry = self.buckets.get((site_id, name, bucket))
+                if entry is not None and entry[0] == fingerprint:
+                    self.buckets.move_to_end((site_id, name, bucket))
+                    totals[name] = totals.get(name, 0) + entry[1]
+                else:
+                    dirty.add((name, bucket))
+            self.hits += len(fingerprints) - len(dirty)
+            self.misses += len(dirty)
+
+        hour = timedelta(seconds=HOUR)
+        for run_start, run_end in _runs(sorted({bucket for _, bucket in dirty}), hour):
+            names, sums = self.compute(run_start, run_end, device)
+            entries = []
+            for i, name in enumerate(names):
+                for j in range(sums.shape[1]):
+                    bucket = run_start + j * hour
+                    if (name, bucket) in dirty:
+                        totals[name] = totals.get(name, 0) + sums[i, j]
+                        # A copy, so the cache doesn't pin the whole run's array
+                        entries.append(((site_id, name, bucket), (fingerprints[name, bucket], sums[i, j].copy())))
+            self.store(entries)
+        return totals
+
+    def store(self, entries):
+        if self.max_buckets <= 0:
+            return
+        with self.lock:
+            for key, value in entries:
+                self.buckets[key] = value
+                self.buckets.move_to_end(key)
+            while len(self.buckets) > self.max_buckets:
+                self.buckets.popitem(last=False)
+
+    def raw_from(self, start, end, device=None):
+        """Start of the hour of the first raw reading in [start, end), or ``end`` if there is none"""
+        first = next(iter(storage.readings(start, ('timestamp',), until=end, device=device)), None)
+        return max(start, bucket_floor(first.timestamp, HOUR)) if first else end
+
+    def estimates(self, start, end, device=None):
+        """{device name: (hours, heating hours, cooling hours)} from hourly rollups in [start, end)"""
+        r = ReadingRollup
+        query = db.session.query(
+            r.device_name,
+            func.count(),
+            func.sum(r.heating_count * 1.0 / r.count),
+            func.sum(r.cooling_count * 1.0 / r.count),
+        ).filter(
+            r.site_id == current_site_id(),
+            r.resolution == HOUR,
+            r.bucket_start >= start,
+            r.bucket_start < end,
+            r.count > 0,
+        ).group_by(r.device_name)
+        if device is not None:
+            query = query.filter(r.device_name == device)
+        return {name: (float(hours), heating or 0.0, cooling or 0.0) for name, hours, heating, cooling in query}
+
+    def window(self, hours, device=None, now=None):
+        """Analytics per device over the last ``hours`` hours (rounded out to whole hours)"""
+        now = now or datetime.utcnow()
+        start = bucket_floor(now - timedelta(hours=hours), HOUR)
+        end = bucket_floor(now, HOUR) + timedelta(seconds=HOUR)
+        estimates = {}
+        if storage.supports_rollups:
+            # Raw readings past the retention are gone; their rollups remain
+            raw_from = self.raw_from(start, end, device)
+            if raw_from > start:
+                estimates = self.estimates(start, raw_from, device)
+            totals = self.cached_sums(raw_from, end, device) if raw_from < end else {}
+        else:
+            raw_from = start
+            names, sums = self.compute(start, end, device)
+            totals = dict(zip(names, sums.sum(axis=1)))
+
+        empty = np.zeros(len(SUMS))
+        names = sorted(set(totals) | set(estimates))
+        if not estimates:
+            source = 'raw'
+        else:
+            source = 'rollups' if not totals else 'raw+rollups'
+        return {
+            'period_hours': hours,
+            'from': start.isoformat(),
+            'to': end.isoformat(),
+            'source': source,
+            'raw_from': raw_from.isoformat() if raw_from < end else None,
+            'devices': [
+                summarize(name, totals.get(name, empty), estimates.get(name, (0.0, 0.0, 0.0))) for name in names
+            ],
+        }
+
+
+def _runs(buckets, step):
+    """Contiguous [start, end) ranges covering sorted bucket starts ``step`` apart"""
+    runs = []
+    for bucket in buckets:
+        if runs and runs[-1][1] == bucket:
+            runs[-1][1] = bucket + step
+        else:
+            runs.append([bucket, bucket + step])
+    return runs
+
+
+analytics = Analytics()
@@ -0,0 +1,112 @@
+"""In-process TTL + LRU cache for read endpoint responses.
+
+Entries are tagged with the data generation they were built from. The
+collector bumps the generation in the same transaction as new readings, so
+the first request after a collection cycle misses and rebuilds instead of
+waiting out the TTL. The generation lives in the database because the web
+and collector run as separate processes.
+"""
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import Response, make_response, request
+from sqlalchemy import text
+from app import db
+from app.models import DataGeneration
+
+
+class ResponseCache:
+    def __init__(self, max_entries=256, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def init_app(self, app):
+        self.max_entries = app.config.get('RESPONSE_CACHE_MAX_ENTRIES', self.max_entries)
+        self.ttl = app.config.get('RESPONSE_CACHE_TTL', self.ttl)
+
+    def get(self, key, generation):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] != generation or entry[1] < time.monotonic():
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def set(self, key, generation, value):
+        if self.ttl <= 0 or self.max_entries <= 0:
+            return
+        with self.lock:
+            self.entries[key] = (generation, time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 3) if lookups else None,
+                'entries': len(self.entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl
+            }
+
+
+response_cache = ResponseCache()
+
+
+def current_generation():
+    generation = db.session.query(DataGeneration.generation).filter_by(id=1).scalar()
+    return generation or 0
+
+
+def bump_generation():
+    """Advance the data generation in the current session; the caller commits"""
+    db.session.execute(text(
+        "INSERT INTO data_generation (id, generation) VALUES (1, 1) "
+        "ON CONFLICT(id) DO UPDATE SET generation = generation + 1"
+    ))
+
+
+def cache_key(req):
+    """Path plus query parameters in sorted order, ignoring empty values"""
+    params = sorted((k, v) for k, v in req.args.items(multi=True) if v != '')
+    accept = req.accept_mimetypes.best_match(['application/json', 'application/x-ndjson'])
+    return (req.path, tuple(params), accept)
+
+
+def cached_response(view):
+    """Serve a view from ``response_cache`` until its TTL expires or new data arrives"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = cache_key(request)
+        generation = current_generation()
+        hit = response_cache.get(key, generation)
+        if hit is not None:
+            body, status, mimetype, headers = hit
+            response = Response(body, status=status, mimetype=mimetype, headers=headers)
+            response.headers['X-Cache'] = 'HIT'
+            return response
+
+        response = make_response(view(*args, **kwargs))
+        if response.status_code == 200 and not response.is_streamed:
+            # Keep headers set by the view (e.g. cursors); Response recomputes the rest
+            headers = [(k, v) for k, v in response.headers.items() if k not in ('Content-Type', 'Content-Length')]
+            response_cache.set(key, generation, (response.get_data(), response.status_code, response.mimetype, headers))
+        response.headers['X-Cache'] = 'MISS'
+        return response
+
+    return wrapper
@@ -0,0 +1,116 @@
+"""Resident collector that runs collection cycles on a schedule.
+
+Replaces starting a fresh Python process from cron every few minutes: the
+Flask app (and its schema check), the HTTP sessions and the Nest access
+token are created once and reused for every cycle. Each cycle collects
+every site, up to ``COLLECT_MAX_SITES`` of them at a time. With the spool
+enabled, cycles only append to it and a replayer thread stores the
+readings, starting with anything a previous run left behind.
+"""
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from apscheduler.schedulers.blocking import BlockingScheduler
+from apscheduler.triggers.interval import IntervalTrigger
+from app.http_client import http_client
+from app.metrics import cycle_duration, serve_metrics
+from app.nest_client import NestClient, collect_temperature_data
+from app.retention import compact
+from app.sites import sites
+from app.spool import spool, spool_replayer
+from app.weather_client import WeatherClient
+
+logger = logging.getLogger(__name__)
+
+
+class Collector:
+    def __init__(self, app=None, interval=None, jitter=None, compact_interval=None):
+        if app is None:
+            from app import create_app
+            app = create_app(use_spool=True)
+        self.app = app
+        # Long-lived clients per site, so each keeps its session and access token
+        self.clients = {site.id: (NestClient.for_site(site), WeatherClient.for_site(site)) for site in sites}
+        self.max_sites = int(os.getenv('COLLECT_MAX_SITES', 4))
+        self.interval = interval or int(os.getenv('COLLECT_INTERVAL_SECONDS', 300))
+        self.jitter = jitter if jitter is not None else int(os.getenv('COLLECT_JITTER_SECONDS', 15))
+        self.compact_interval = (
+            compact_interval if compact_interval is not None
+            else int(os.getenv('COMPACT_INTERVAL_SECONDS', 86400))
+        )
+        self.metrics_port = int(os.getenv('COLLECTOR_METRICS_PORT', 9101))
+        self.cycles = 0
+
+    def collect_site(self, site_id):
+        """Collect one site; a failure is logged and doesn't affect the other sites"""
+        client, weather_client = self.clients[site_id]
+        try:
+            return collect_temperature_data(self.app, client, weather_client, site_id)
+        except Exception:
+            logger.exception("Collection failed", extra={'site': site_id})
+            return 0
+
+    def run_cycle(self):
+        """Collect every site once and report the cycle's wall time, CPU time and Nest API calls"""
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        calls_start = sum(client.api_calls for client, _ in self.clients.values())
+        with ThreadPoolExecutor(max_workers=self.max_sites) as pool:
+            stored = sum(pool.map(self.collect_site, self.clients))
+        wall = time.perf_counter() - wall_start
+        cpu = time.process_time() - cpu_start
+        api_calls = sum(client.api_calls for client, _ in self.clients.values()) - calls_start
+        self.cycles += 1
+        cycle_duration.observe(wall)
+        fields = {
+            'cycle': self.cycles, 'readings': stored, 'sites': len(self.clients), 'nest_api_calls': api_calls,
+            'wall_seconds': round(wall, 3), 'cpu_seconds': round(cpu, 3),
+        }
+        if spool.enabled:
+            pending = spool.pending()
+            fields.update(spool_segments=pending['segments'], spool_bytes=pending['bytes'])
+        logger.info("Cycle finished", extra=fields)
+        logger.debug("HTTP since start: %s", http_client.summary())
+        return wall, cpu
+
+    def run_compaction(self):
+        """Apply the retention policy; failures are logged and retried next interval"""
+        try:
+            with self.app.app_context():
+                return compact()
+        except Exception:
+            logger.exception("Compaction failed")
+            return None
+
+    def start(self):
+        """Run the first cycle immediately, then every ``interval`` ± ``jitter`` seconds"""
+        scheduler = BlockingScheduler()
+        scheduler.add_job(
+            self.run_cycle,
+            IntervalTrigger(seconds=self.interval, jitter=self.jitter),
+            next_run_time=datetime.now(),
+            max_instances=1,
+            coalesce=True,
+        )
+        # Compaction waits a full interval so a restart loop can't keep vacuuming
+        if self.compact_interval > 0:
+            scheduler.add_job(
+                self.run_compaction,
+                IntervalTrigger(seconds=self.compact_interval),
+                max_instances=1,
+                coalesce=True,
+            )
+        spool_replayer.start()
+        if self.metrics_port:
+            serve_metrics(self.metrics_port)
+        logger.info("Collector started", extra={
+            'interval_seconds': self.interval, 'jitter_seconds': self.jitter, 'metrics_port': self.metrics_port,
+        })
+        try:
+            scheduler.start()
+        except (KeyboardInterrupt, SystemExit):
+            pass
+        finally:
+            spool_replayer.stop()
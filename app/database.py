@@ -0,0 +1,59 @@
+"""SQLite connection tuning shared by the web app, collector and benchmarks.
+
+The web and collector processes open the same database file. WAL lets
+dashboard reads proceed while the collector commits, and the busy timeout
+makes writers wait for each other instead of failing with "database is
+locked".
+"""
+import os
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+
+def sqlite_settings_from_env():
+    return {
+        'journal_mode': os.getenv('SQLITE_JOURNAL_MODE', 'WAL'),
+        'busy_timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', 5000)),
+        'synchronous': os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL'),
+        'mmap_size': int(os.getenv('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+        'auto_vacuum': os.getenv('SQLITE_AUTO_VACUUM', 'INCREMENTAL'),
+    }
+
+
+def engine_options_from_env(uri):
+    """Connection pool sizing for each process's engine.
+
+    Under gunicorn every worker has its own pool (see ``post_fork`` in
+    gunicorn.conf.py), so size it for one worker's threads plus the SSE and
+    statistics background work. In-memory SQLite uses a static pool that
+    takes no sizing.
+    """
+    url = make_url(uri)
+    if url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:'):
+        return {}
+    return {
+        'pool_size': int(os.getenv('DB_POOL_SIZE', 10)),
+        'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', 10)),
+    }
+
+
+def configure_sqlite(engine, settings):
+    """Apply ``settings`` as PRAGMAs on every new connection of a SQLite engine"""
+    if engine.dialect.name != 'sqlite':
+        return
+
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            # busy_timeout first so switching journal mode also waits on locks
+            cursor.execute(f"PRAGMA busy_timeout = {int(settings['busy_timeout'])}")
+            # Only takes effect on a new database; existing ones need a VACUUM
+            # (python migrate.py --incremental-vacuum)
+            if settings.get('auto_vacuum'):
+                cursor.execute(f"PRAGMA auto_vacuum = {settings['auto_vacuum']}")
+            cursor.execute(f"PRAGMA journal_mode = {settings['journal_mode']}")
+            cursor.execute(f"PRAGMA synchronous = {settings['synchronous']}")
+            cursor.execute(f"PRAGMA mmap_size = {int(settings['mmap_size'])}")
+        finally:
+            cursor.close()
@@ -0,0 +1,131 @@
+"""Server-side downsampling of chart series.
+
+Both methods pick a subset of the original rows rather than synthesising new
+points, so every returned reading is a real one. HVAC state changes are not
+kept as extra rows: ``hvac_bands`` reports the heating/cooling runs of the
+full series as intervals instead, so the dashboard's bands start and end at
+the right place however few points are plotted.
+"""
+from collections import defaultdict
+import numpy as np
+
+METHODS = ('lttb', 'minmax')
+
+
+def _bucket_bounds(n, buckets):
+    """Split the interior points 1..n-2 into ``buckets`` contiguous ranges"""
+    every = (n - 2) / buckets
+    bounds = np.floor(np.arange(buckets + 1) * every).astype(np.int64) + 1
+    bounds[-1] = n - 1
+    return bounds
+
+
+def even_indices(n, threshold):
+    """About ``threshold`` evenly spaced indices, for budgets too small to bucket"""
+    if threshold >= n:
+        return np.arange(n)
+    if threshold <= 0:
+        return np.arange(0)
+    return np.unique(np.linspace(0, n - 1, threshold).round().astype(np.int64))
+
+
+def lttb_indices(x, y, threshold):
+    """Largest-Triangle-Three-Buckets selection of ``threshold`` indices"""
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return even_indices(n, threshold)
+
+    buckets = threshold - 2
+    bounds = _bucket_bounds(n, buckets)
+    sizes = np.diff(bounds)
+    avg_x = np.add.reduceat(x[:-1], bounds[:-1]) / sizes
+    avg_y = np.add.reduceat(y[:-1], bounds[:-1]) / sizes
+    # Each bucket is compared against the average of the bucket after it
+    next_x = np.append(avg_x[1:], x[-1])
+    next_y = np.append(avg_y[1:], y[-1])
+
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    a = 0
+    for i in range(buckets):
+        start, end = bounds[i], bounds[i + 1]
+        area = np.abs(
+            (x[a] - next_x[i]) * (y[start:end] - y[a])
+            - (x[a] - x[start:end]) * (next_y[i] - y[a])
+        )
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+def minmax_indices(x, y, threshold):
+    """Keep the lowest and highest point of each bucket, plus both endpoints"""
+    n = len(x)
+    if threshold >= n or threshold < 4:
+        return even_indices(n, threshold)
+
+    buckets = (threshold - 2) // 2
+    bounds = _bucket_bounds(n, buckets)
+    interior = np.arange(1, n - 1)
+    bucket_ids = np.repeat(np.arange(buckets), np.diff(bounds))
+    order = interior[np.lexsort((y[1:-1], bucket_ids))]
+    starts = bounds[:-1] - 1
+    ends = bounds[1:] - 2
+    return np.unique(np.concatenate(([0, n - 1], order[starts], order[ends])))
+
+
+def hvac_bands(readings):
+    """Runs of HEATING or COOLING per device, ordered by start.
+
+    Each band is a dict of ``device_name``, ``state``, ``start`` (the first
+    reading of the run) and ``end`` (the first reading after it, or the
+    run's last reading if it reaches the end of the series).
+    """
+    by_device = defaultdict(list)
+    for reading in readings:
+        by_device[reading.device_name].append(reading)
+
+    bands = []
+    for device_name, series in by_device.items():
+        states = np.array([r.hvac_state for r in series], dtype=object)
+        starts = np.concatenate(([0], np.flatnonzero(states[1:] != states[:-1]) + 1))
+        ends = np.append(starts[1:], len(series) - 1)
+        running = np.isin(states[starts], ('HEATING', 'COOLING'))
+        bands.extend(
+            {
+                'device_name': device_name,
+                'state': states[start],
+                'start': series[start].timestamp,
+                'end': series[end].timestamp,
+            }
+            for start, end in zip(starts[running].tolist(), ends[running].tolist())
+        )
+    bands.sort(key=lambda band: band['start'])
+    return bands
+
+
+def downsample_readings(readings, max_points, method='lttb', value=lambda r: r.temperature_c):
+    """Reduce the series to at most ``max_points`` rows in total.
+
+    ``readings`` must be ordered by timestamp. The budget is split evenly
+    between devices, and the result keeps the input order.
+    """
+    select = lttb_indices if method == 'lttb' else minmax_indices
+    by_device = defaultdict(list)
+    for position, reading in enumerate(readings):
+        by_device[reading.device_name].append(position)
+
+    share = max_points // len(by_device) if by_device else 0
+    keep = []
+    for positions in by_device.values():
+        if len(positions) <= share:
+            keep.extend(positions)
+            continue
+        series = [readings[p] for p in positions]
+        x = np.array([r.timestamp.timestamp() for r in series], dtype=np.float64)
+        y = np.array([value(r) for r in series], dtype=np.float64)
+        keep.extend(positions[i] for i in select(x, y, share))
+
+    keep.sort()
+    return [readings[p] for p in keep]
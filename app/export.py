@@ -0,0 +1,159 @@
+"""Bulk export of readings as CSV, Parquet or Arrow IPC streams.
+
+Rows come off the storage cursor ``EXPORT_BATCH_SIZE`` at a time and each
+batch is encoded and sent before the next is read, so memory stays flat for
+any range. pyarrow (Parquet/Arrow) and zstandard (zstd) are imported only
+when an export asks for them.
+"""
+import csv
+import io
+import zlib
+
+# Content type and file extension per format
+EXPORT_FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+    'arrow': ('application/vnd.apache.arrow.stream', 'arrows'),
+}
+
+# Content type and file extension per compression of the whole response.
+# Parquet compresses its column chunks instead and keeps its own type.
+COMPRESSIONS = {
+    'gzip': ('application/gzip', 'gz'),
+    'zstd': ('application/zstd', 'zst'),
+}
+
+EXPORT_BATCH_SIZE = 50000
+
+INTEGER_COLUMNS = {'id'}
+STRING_COLUMNS = {'device_name', 'hvac_mode', 'hvac_state'}
+
+
+def batches(rows, size=EXPORT_BATCH_SIZE):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def csv_chunks(rows, columns):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerow(columns)
+    timestamp = columns.index('timestamp') if 'timestamp' in columns else None
+    for batch in batches(rows):
+        if timestamp is not None:
+            batch = [row[:timestamp] + (row[timestamp].isoformat(),) + row[timestamp + 1:] for row in batch]
+        writer.writerows(batch)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def arrow_schema(columns):
+    import pyarrow as pa
+
+    def column_type(name):
+        if name == 'timestamp':
+            return pa.timestamp('us')
+        if name in INTEGER_COLUMNS:
+            return pa.int64()
+        if name in STRING_COLUMNS:
+            return pa.string()
+        return pa.float64()
+
+    return pa.schema([(name, column_type(name)) for name in columns])
+
+
+class ChunkSink:
+    """Write-only file object that hands back what pyarrow wrote since the last take()"""
+    def __init__(self):
+        self.chunks = []
+        self.closed = False
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def arrow_chunks(rows, columns, writer_factory):
+    import pyarrow as pa
+
+    schema = arrow_schema(columns)
+    sink = ChunkSink()
+    writer = writer_factory(sink, schema)
+    for batch in batches(rows):
+        arrays = [pa.array(values, type=field.type) for values, field in zip(zip(*batch), schema)]
+        writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+        yield sink.take()
+    writer.close()
+    yield sink.take()
+
+
+def compress_chunks(chunks, compression):
+    if compression == 'gzip':
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    else:
+        import zstandard
+        compressor = zstandard.ZstdCompressor().compressobj()
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_chunks(rows, columns, fmt, compression=None):
+    """Encoded ``rows`` of ``columns`` as an iterable of bytes"""
+    if fmt == 'csv':
+        chunks = csv_chunks(rows, columns)
+    elif fmt == 'arrow':
+        import pyarrow as pa
+        chunks = arrow_chunks(rows, columns, pa.ipc.new_stream)
+    else:
+        import pyarrow.parquet as pq
+        # Each batch becomes a row group; compression applies per column chunk
+        codec = compression or 'snappy'
+        return arrow_chunks(rows, columns, lambda sink, schema: pq.ParquetWriter(sink, schema, compression=codec))
+    return compress_chunks(chunks, compression) if compression else chunks
+
+
+def export_type(fmt, compression=None):
+    """(content type, file extension) of an export"""
+    content_type, extension = EXPORT_FORMATS[fmt]
+    if compression and fmt != 'parquet':
+        compressed_type, suffix = COMPRESSIONS[compression]
+        return compressed_type, f'{extension}.{suffix}'
+    return content_type, extension
+
+
+def missing_dependency(fmt, compression=None):
+    """Name of a package the export needs but can't import, or None"""
+    needed = []
+    if fmt in ('parquet', 'arrow'):
+        needed.append('pyarrow')
+    if compression == 'zstd' and fmt != 'parquet':
+        needed.append('zstandard')
+    for module in needed:
+        try:
+            __import__(module)
+        except ImportError:
+            return module
+    return None
@@ -0,0 +1,298 @@
+"""Shared HTTP client for the external APIs (Google OAuth, Smart Device
+Management and OpenWeatherMap).
+
+Every call goes through one pooled, keep-alive ``requests.Session`` per
+process, so connections are reused across clients, sites and cycles.
+Endpoints are named ``<dependency>.<call>`` (e.g. ``sdm.devices.list``) and
+each dependency has its own timeout. Connection errors, timeouts, truncated
+chunked responses, 429s and 5xx responses are retried with exponential backoff and full jitter,
+honouring ``Retry-After``. Once a dependency has failed
+``HTTP_BREAKER_FAILURES`` calls in a row, its circuit breaker opens and
+calls fail fast with ``CircuitOpenError`` for ``HTTP_BREAKER_COOLDOWN_SECONDS``.
+After that, one trial call decides whether the circuit closes again.
+
+Latency of every attempt is recorded in a per-endpoint histogram
+(``http_client.stats()``).
+"""
+import os
+import random
+import threading
+import time
+from bisect import bisect_left
+import requests
+from requests.adapters import HTTPAdapter
+
+RETRY_STATUSES = frozenset((429, 500, 502, 503, 504))
+
+# Transport errors worth another attempt; any other RequestException fails the call at once
+RETRY_ERRORS = (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError)
+
+# Histogram bucket upper bounds in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float('inf'))
+
+# Read timeout per dependency in seconds
+DEFAULT_TIMEOUTS = {
+    'oauth': float(os.getenv('OAUTH_REQUEST_TIMEOUT', 10)),
+    'sdm': float(os.getenv('NEST_REQUEST_TIMEOUT', 10)),
+    'openweathermap': float(os.getenv('WEATHER_REQUEST_TIMEOUT', 10)),
+}
+
+
+class CircuitOpenError(requests.RequestException):
+    """A call was skipped because its dependency's circuit breaker is open"""
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        # Seconds until the breaker lets a trial call through
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=5, cooldown=60):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0
+        self.lock = threading.Lock()
+
+    def allow(self):
+        """Whether a call may go out; after the cooldown one trial call is let through"""
+        with self.lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.cooldown:
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def retry_after(self):
+        """Seconds left of the cooldown; 0 unless the breaker is open"""
+        with self.lock:
+            if self.state != self.OPEN:
+                return 0
+            return max(0.0, self.cooldown - (time.monotonic() - self.opened_at))
+
+    def snapshot(self):
+        with self.lock:
+            return {'state': self.state, 'consecutive_failures': self.failures}
+
+
+class LatencyHistogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, seconds):
+        with self.lock:
+            self.counts[bisect_left(self.buckets, seconds)] += 1
+            self.count += 1
+            self.sum += seconds
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the ``q`` quantile, or None without samples"""
+        with self.lock:
+            if not self.count:
+                return None
+            rank = q * self.count
+            seen = 0
+            for bound, count in zip(self.buckets, self.counts):
+                seen += count
+                if seen >= rank:
+                    return bound
+            return self.buckets[-1]
+
+    def snapshot(self):
+        with self.lock:
+            cumulative = []
+            seen = 0
+            for bound, count in zip(self.buckets, self.counts):
+                seen += count
+                cumulative.append(('+Inf' if bound == float('inf') else bound, seen))
+            count, total = self.count, self.sum
+        return {
+            'count': count,
+            'sum_seconds': total,
+            'buckets': cumulative,
+            'p50_seconds': self.quantile(0.5),
+            'p95_seconds': self.quantile(0.95),
+            'p99_seconds': self.quantile(0.99),
+        }
+
+
+class EndpointStats:
+    def __init__(self):
+        self.latency = LatencyHistogram()
+        self.requests = 0
+        self.retries = 0
+        self.failures = 0
+        self.short_circuited = 0
+        # Calls come from the collector's pool threads
+        self.lock = threading.Lock()
+
+    def count(self, name):
+        with self.lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def snapshot(self):
+        with self.lock:
+            counts = dict(
+                requests=self.requests,
+                retries=self.retries,
+                failures=self.failures,
+                short_circuited=self.short_circuited,
+            )
+        return dict(self.latency.snapshot(), **counts)
+
+
+class HttpClient:
+    def __init__(self, pool_size=10, retries=3, backoff_base=0.5, backoff_max=8.0, connect_timeout=3.05,
+                 timeouts=None, failure_threshold=5, cooldown=60):
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.connect_timeout = connect_timeout
+        self.timeouts = dict(DEFAULT_TIMEOUTS, **(timeouts or {}))
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.session = requests.Session()
+        # Retries are done here, with backoff and the breaker, not by urllib3
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.breakers = {}
+        self.endpoints = {}
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            pool_size=int(os.getenv('HTTP_POOL_SIZE', 10)),
+            retries=int(os.getenv('HTTP_RETRIES', 3)),
+            backoff_base=float(os.getenv('HTTP_BACKOFF_SECONDS', 0.5)),
+            backoff_max=float(os.getenv('HTTP_BACKOFF_MAX_SECONDS', 8)),
+            connect_timeout=float(os.getenv('HTTP_CONNECT_TIMEOUT', 3.05)),
+            failure_threshold=int(os.getenv('HTTP_BREAKER_FAILURES', 5)),
+            cooldown=float(os.getenv('HTTP_BREAKER_COOLDOWN_SECONDS', 60)),
+        )
+
+    def breaker(self, dependency):
+        with self.lock:
+            breaker = self.breakers.get(dependency)
+            if breaker is None:
+                breaker = self.breakers[dependency] = CircuitBreaker(self.failure_threshold, self.cooldown)
+            return breaker
+
+    def endpoint_stats(self, endpoint):
+        with self.lock:
+            stats = self.endpoints.get(endpoint)
+            if stats is None:
+                stats = self.endpoints[endpoint] = EndpointStats()
+            return stats
+
+    def backoff(self, attempt, response=None):
+        """Seconds to wait before retry ``attempt`` (0-based): full jitter, or the server's Retry-After"""
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after:
+            try:
+                return min(float(retry_after), self.backoff_max)
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def request(self, method, url, endpoint, **kwargs):
+        """Send a request for ``endpoint``, retrying transient failures.
+
+        Returns the final response, which may still be an error status for
+        the caller to handle. Raises ``CircuitOpenError`` without sending
+        anything while the dependency's breaker is open, and re-raises the
+        last transport error once retries are exhausted. Any other request
+        error is raised at once and counts as a failed call.
+        """
+        dependency = endpoint.split('.', 1)[0]
+        breaker = self.breaker(dependency)
+        stats = self.endpoint_stats(endpoint)
+        if not breaker.allow():
+            stats.count('short_circuited')
+            raise CircuitOpenError(f"{dependency} circuit is open; skipping {endpoint}",
+                                   retry_after=breaker.retry_after())
+
+        kwargs.setdefault('timeout', (self.connect_timeout, self.timeouts.get(dependency, 10)))
+        response = error = None
+        try:
+            for attempt in range(self.retries + 1):
+                if attempt:
+                    stats.count('retries')
+                    time.sleep(self.backoff(attempt - 1, response))
+                stats.count('requests')
+                started = time.perf_counter()
+                try:
+                    response = self.session.request(method, url, **kwargs)
+                    error = None
+                except RETRY_ERRORS as e:
+                    response, error = None, e
+                finally:
+                    stats.latency.observe(time.perf_counter() - started)
+                if error is None and response.status_code not in RETRY_STATUSES:
+                    breaker.record_success()
+                    return response
+        except BaseException:
+            # Every call has to settle the breaker, or a half-open one never lets another through
+            stats.count('failures')
+            breaker.record_failure()
+            raise
+
+        stats.count('failures')
+        breaker.record_failure()
+        if error is not None:
+            raise error
+        return response
+
+    def get(self, url, endpoint, **kwargs):
+        return self.request('GET', url, endpoint, **kwargs)
+
+    def post(self, url, endpoint, **kwargs):
+        return self.request('POST', url, endpoint, **kwargs)
+
+    def summary(self):
+        """One line of per-endpoint call counts and latency for logs"""
+        def ms(seconds):
+            return 'inf' if seconds == float('inf') else f'{seconds * 1000:g}ms'
+
+        parts = []
+        for name, stats in self.stats()['endpoints'].items():
+            part = f"{name} {stats['requests']} calls p50<={ms(stats['p50_seconds'])} p95<={ms(stats['p95_seconds'])}"
+            if stats['retries'] or stats['failures'] or stats['short_circuited']:
+                part += f" ({stats['retries']} retries, {stats['failures']} failed, {stats['short_circuited']} skipped)"
+            parts.append(part)
+        return '; '.join(parts)
+
+    def stats(self):
+        with self.lock:
+            endpoints = dict(self.endpoints)
+            breakers = dict(self.breakers)
+        return {
+            'endpoints': {name: stats.snapshot() for name, stats in sorted(endpoints.items())},
+            'breakers': {name: breaker.snapshot() for name, breaker in sorted(breakers.items())},
+        }
+
+
+http_client = HttpClient.from_env()
@@ -0,0 +1,166 @@
+"""Server-Sent Events fan-out of newly collected readings.
+
+The collector runs in another process, so one broadcaster thread per web
+process watches the data generation (a primary-key lookup) and, when it
+changes, reads the new readings and the statistics for each site and
+window that subscribers are watching. Those queries run once per collection cycle and
+the encoded events are shared by every open dashboard, so server cost
+follows the write rate rather than the number of tabs. With the sql backend
+the new readings are those stored after the last published id, so late and
+spool-replayed readings are pushed too; backends without ids fall back to
+readings newer than the last published timestamp.
+
+Each open stream still holds a worker thread, so a process accepts at most
+``SSE_MAX_SUBSCRIBERS`` of them (default: half of ``WEB_THREADS``) and the
+rest of its threads stay free for API requests. Dashboards turned away get
+a 503 and poll ``/api/temperatures`` with a cursor instead.
+"""
+import logging
+import queue
+import threading
+from datetime import datetime, timedelta
+from app.cache import current_generation
+from app.queries import READING_FIELDS
+from app.serialization import dumps
+from app.sites import use_site
+from app.storage import storage
+
+logger = logging.getLogger(__name__)
+
+
+def format_event(event, data, event_id=None):
+    lines = [f'id: {event_id}'] if event_id is not None else []
+    lines += [f'event: {event}', f'data: {dumps(data).decode()}']
+    return ('\n'.join(lines) + '\n\n').encode()
+
+
+class Subscription:
+    def __init__(self, site_id, hours, max_events):
+        self.site_id = site_id
+        self.hours = hours
+        self.events = queue.Queue(max_events)
+        self.closed = False
+
+    def send(self, event):
+        """Queue an event; a subscriber that has fallen this far behind is dropped"""
+        try:
+            self.events.put_nowait(event)
+        except queue.Full:
+            self.closed = True
+
+    def get(self, timeout):
+        return self.events.get(timeout=timeout)
+
+
+class Broadcaster:
+    def __init__(self, poll_interval=2, keepalive=15, max_events=32, max_subscribers=4):
+        self.poll_interval = poll_interval
+        self.keepalive = keepalive
+        self.max_events = max_events
+        self.max_subscribers = max_subscribers
+        self.app = None
+        self.subscriptions = set()
+        self.lock = threading.Lock()
+        self.thread = None
+        self.stopped = threading.Event()
+        # Per site: data generation and the cursor (reading id, or timestamp
+        # without ids) of the newest reading already published
+        self.generation = {}
+        self.cursor = {}
+
+    def init_app(self, app):
+        self.app = app
+        self.poll_interval = app.config.get('SSE_POLL_SECONDS', self.poll_interval)
+        self.keepalive = app.config.get('SSE_KEEPALIVE_SECONDS', self.keepalive)
+        self.max_subscribers = app.config.get('SSE_MAX_SUBSCRIBERS', self.max_subscribers)
+
+    def subscribe(self, site_id, hours):
+        """A new subscription, or None if this process already has ``max_subscribers``"""
+        subscription = Subscription(site_id, hours, self.max_events)
+        with self.lock:
+            if len(self.subscriptions) >= self.max_subscribers:
+                return None
+            self.subscriptions.add(subscription)
+            if self.thread is None or not self.thread.is_alive():
+                self.stopped.clear()
+                self.thread = threading.Thread(target=self.run, name='sse-broadcaster', daemon=True)
+                self.thread.start()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            self.subscriptions.discard(subscription)
+
+    def stop(self):
+        self.stopped.set()
+
+    def run(self):
+        while not self.stopped.wait(self.poll_interval):
+            try:
+                with self.lock:
+                    site_ids = {s.site_id for s in self.subscriptions}
+                for site_id in site_ids:
+                    with self.app.app_context(), use_site(site_id):
+                        self.poll(site_id)
+            except Exception:
+                logger.exception("Live stream poll failed")
+
+    def poll(self, site_id):
+        """Publish events if the collector has committed for the current site since the last poll"""
+        generation = current_generation()
+        if site_id not in self.generation:
+            # Subscribers loaded the current data themselves; only send what comes after
+            self.generation[site_id] = generation
+            self.cursor[site_id] = self.current_cursor()
+            return
+        if generation == self.generation[site_id]:
+            return
+        self.generation[site_id] = generation
+        self.publish(site_id, generation)
+
+    def publish(self, site_id, generation):
+        from app.routes import statistics_payload
+
+        with self.lock:
+            subscriptions = [s for s in self.subscriptions if not s.closed and s.site_id == site_id]
+
+        events = []
+        readings = self.new_readings(site_id, max((s.hours for s in subscriptions), default=0))
+        if readings:
+            events.append(format_event('readings', readings, generation))
+
+        statistics = {
+            hours: format_event('statistics', statistics_payload(hours), generation)
+            for hours in {s.hours for s in subscriptions}
+        }
+        for subscription in subscriptions:
+            for event in events:
+                subscription.send(event)
+            subscription.send(statistics[subscription.hours])
+
+    @staticmethod
+    def current_cursor():
+        if storage.supports_ids:
+            return storage.last_id() or 0
+        latest = storage.latest(('timestamp',))
+        return latest.timestamp if latest else None
+
+    def new_readings(self, site_id, hours):
+        """Readings stored since the site's cursor that fall in the last ``hours``, oldest first"""
+        cursor = self.cursor.get(site_id)
+        if storage.supports_ids:
+            # Read the cursor first so a reading committed meanwhile waits for the next poll
+            last_id = self.current_cursor()
+            window = datetime.utcnow() - timedelta(hours=hours)
+            rows = [row for row in storage.readings_after_id(cursor or 0, READING_FIELDS, since=window)
+                    if row.id <= last_id]
+            self.cursor[site_id] = last_id
+            rows.sort(key=lambda row: row.timestamp)
+        else:
+            since = self.current_cursor() if cursor is None else cursor + timedelta(microseconds=1)
+            rows = list(storage.readings(since, READING_FIELDS)) if since is not None else []
+            if rows:
+                self.cursor[site_id] = rows[-1].timestamp
+        return [dict(zip(READING_FIELDS, row)) for row in rows]
+
+broadcaster = Broadcaster()
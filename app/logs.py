@@ -0,0 +1,67 @@
+"""Leveled, structured logging for the web app and collector.
+
+``LOG_LEVEL`` (``INFO``) sets the level and ``LOG_FORMAT`` the output:
+``text`` writes one line per record with its fields as ``key=value``, and
+``json`` writes one object per line. Fields are passed as ``extra``::
+
+    logger.info("Collection finished", extra={'site': site.id, 'readings': 3})
+
+Per-device and per-response detail is logged at ``DEBUG``. At the default
+level those records are dropped before they are formatted.
+"""
+import json
+import logging
+import sys
+from datetime import datetime, timezone
+
+# Attributes every LogRecord has; anything else on a record came from ``extra``
+RECORD_ATTRIBUTES = frozenset(vars(logging.makeLogRecord({}))) | {'message', 'asctime', 'taskName'}
+
+
+def record_fields(record):
+    return {name: value for name, value in vars(record).items() if name not in RECORD_ATTRIBUTES}
+
+
+def _timestamp(record):
+    return datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds')
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record):
+        line = f"{_timestamp(record)} {record.levelname} {record.name}: {record.getMessage()}"
+        fields = record_fields(record)
+        if fields:
+            line += ' ' + ' '.join(f'{name}={value}' for name, value in fields.items())
+        if record.exc_info:
+            line += '\n' + self.formatException(record.exc_info)
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'time': _timestamp(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        entry.update(record_fields(record))
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+FORMATTERS = {'text': TextFormatter, 'json': JsonFormatter}
+
+
+def configure_logging(level='INFO', fmt='text'):
+    """Send the ``app`` loggers' records at ``level`` and above to stderr in ``fmt``"""
+    if fmt not in FORMATTERS:
+        raise ValueError(f"Unknown LOG_FORMAT: {fmt} (expected one of {', '.join(FORMATTERS)})")
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(FORMATTERS[fmt]())
+    logger = logging.getLogger('app')
+    logger.handlers[:] = [handler]
+    logger.setLevel(level.upper())
+    logger.propagate = False
+    return logger
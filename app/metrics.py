@@ -0,0 +1,314 @@
+"""Prometheus metrics for the web app and collector.
+
+``/metrics`` serves them in the Prometheus text format; the collector
+daemon serves its own on ``COLLECTOR_METRICS_PORT``. Metrics are kept per
+process, so behind several gunicorn workers each scrape sees the worker
+that answered it.
+
+Recorded as they happen:
+
+- request latency per route, method and status
+- SQL statement time and affected rows per database and statement type
+- rows read from and written to storage
+- collection cycle time and each phase of it (token, device list,
+  per-device fetch, weather, commit, spool replay)
+
+Read when scraped: external API latency, retries and circuit breakers from
+``app.http_client``; hit ratios of the response, weather observation,
+access token and analytics bucket caches; and the spool backlog.
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from flask import g, request
+from sqlalchemy import event
+from app.http_client import LATENCY_BUCKETS, LatencyHistogram, http_client
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+
+def _format_value(value):
+    if value is None:
+        return 'NaN'
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Family:
+    """Samples of one metric: (name suffix, labels, value) tuples"""
+    def __init__(self, name, kind, help_text, samples=None):
+        self.name = name
+        self.kind = kind
+        self.help = help_text
+        self.samples = samples or []
+
+    def add(self, value, suffix='', **labels):
+        self.samples.append((suffix, labels, value))
+
+    def add_histogram(self, snapshot, **labels):
+        """Add a ``LatencyHistogram.snapshot()``"""
+        for bound, count in snapshot['buckets']:
+            self.add(count, '_bucket', **labels, le='+Inf' if bound == '+Inf' else repr(float(bound)))
+        self.add(snapshot['count'], '_count', **labels)
+        self.add(snapshot['sum_seconds'], '_sum', **labels)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        for suffix, labels, value in self.samples:
+            lines.append(f'{self.name}{suffix}{_format_labels(labels)} {_format_value(value)}')
+        return '\n'.join(lines)
+
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.label_names)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def collect(self):
+        family = Family(self.name, 'counter', self.help)
+        with self.lock:
+            values = sorted(self.values.items())
+        for key, value in values:
+            family.add(value, **dict(zip(self.label_names, key)))
+        return family
+
+
+class Histogram:
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self.buckets = buckets
+        self.children = {}
+        self.lock = threading.Lock()
+
+    def child(self, **labels):
+        key = tuple(labels[name] for name in self.label_names)
+        histogram = self.children.get(key)
+        if histogram is None:
+            with self.lock:
+                histogram = self.children.setdefault(key, LatencyHistogram(self.buckets))
+        return histogram
+
+    def observe(self, seconds, **labels):
+        self.child(**labels).observe(seconds)
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def collect(self):
+        family = Family(self.name, 'histogram', self.help)
+        with self.lock:
+            children = sorted(self.children.items())
+        for key, histogram in children:
+            family.add_histogram(histogram.snapshot(), **dict(zip(self.label_names, key)))
+        return family
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+        # Callables returning Families built when scraped
+        self.collectors = []
+
+    def counter(self, name, help_text, labels=()):
+        metric = Counter(name, help_text, labels)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        metric = Histogram(name, help_text, labels, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def collector(self, collect):
+        self.collectors.append(collect)
+        return collect
+
+    def render(self):
+        families = [metric.collect() for metric in self.metrics]
+        for collect in self.collectors:
+            families.extend(collect())
+        return '\n'.join(family.render() for family in families if family.samples) + '\n'
+
+
+registry = Registry()
+
+request_duration = registry.histogram(
+    'http_request_duration_seconds', 'Time to build a response, per route', ('method', 'route', 'status'))
+db_query_duration = registry.histogram(
+    'db_query_duration_seconds', 'SQL statement execution time', ('database', 'statement'))
+db_rows = registry.counter(
+    'db_rows_total', 'Rows inserted, updated or deleted by SQL statements', ('database', 'statement'))
+storage_rows = registry.counter(
+    'storage_rows_total', 'Readings read from or written to storage', ('backend', 'operation'))
+cycle_duration = registry.histogram(
+    'collector_cycle_duration_seconds', 'Wall time of a collection cycle over every site')
+phase_duration = registry.histogram(
+    'collector_phase_duration_seconds', 'Wall time of each collection phase, per site', ('phase',))
+readings_collected = registry.counter(
+    'collector_readings_total', 'Readings collected', ('site',))
+
+
+@registry.collector
+def external_api_metrics():
+    stats = http_client.stats()
+    latency = Family('external_api_request_duration_seconds', 'histogram',
+                     'Latency of each external API attempt, including retries')
+    counters = {
+        name: Family(f'external_api_{name}_total', 'counter', help_text)
+        for name, help_text in (
+            ('requests', 'External API attempts'),
+            ('retries', 'External API attempts that were retries'),
+            ('failures', 'External API calls that failed after retries'),
+            ('short_circuited', 'External API calls skipped by an open circuit breaker'),
+        )
+    }
+    for endpoint, snapshot in stats['endpoints'].items():
+        latency.add_histogram(snapshot, endpoint=endpoint)
+        for name, family in counters.items():
+            family.add(snapshot[name], endpoint=endpoint)
+    breakers = Family('external_api_circuit_open', 'gauge', '1 while a dependency\'s circuit breaker is not closed')
+    for dependency, breaker in stats['breakers'].items():
+        breakers.add(int(breaker['state'] != 'closed'), dependency=dependency)
+    return [latency, *counters.values(), breakers]
+
+
+@registry.collector
+def cache_metrics():
+    from app.analytics import analytics
+    from app.cache import response_cache
+    from app.token_cache import token_cache
+    from app.weather import observation_cache
+
+    lookups = {
+        'response': (response_cache.hits, response_cache.misses),
+        'weather_observation': (observation_cache.hits, observation_cache.fetches),
+        'access_token': (token_cache.hits, token_cache.refreshes),
+        'analytics_bucket': (analytics.hits, analytics.misses),
+    }
+    requests_family = Family('cache_requests_total', 'counter', 'Cache lookups by result')
+    ratio = Family('cache_hit_ratio', 'gauge', 'Share of cache lookups that were hits')
+    for cache, (hits, misses) in lookups.items():
+        requests_family.add(hits, cache=cache, result='hit')
+        requests_family.add(misses, cache=cache, result='miss')
+        ratio.add(hits / (hits + misses) if hits + misses else None, cache=cache)
+    return [requests_family, ratio]
+
+
+@registry.collector
+def spool_metrics():
+    from app.spool import spool
+
+    if not spool.enabled or not os.path.isdir(spool.path):
+        return []
+    pending = spool.pending()
+    return [
+        Family('spool_pending_segments', 'gauge', 'Spool segments awaiting replay', [('', {}, pending['segments'])]),
+        Family('spool_pending_bytes', 'gauge', 'Spooled bytes awaiting replay', [('', {}, pending['bytes'])]),
+    ]
+
+
+def count_rows(rows, backend, operation):
+    """Iterate ``rows``, adding how many there were to ``storage_rows_total`` once done"""
+    count = 0
+    try:
+        for row in rows:
+            count += 1
+            yield row
+    finally:
+        storage_rows.inc(count, backend=backend, operation=operation)
+
+
+def _statement_type(statement):
+    return statement.lstrip().split(None, 1)[0].upper() if statement.strip() else 'OTHER'
+
+
+def instrument_engine(engine, database):
+    """Time every statement ``engine`` runs and count the rows it changes"""
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_started'].pop()
+        kind = _statement_type(statement)
+        db_query_duration.observe(elapsed, database=database, statement=kind)
+        if kind in ('INSERT', 'UPDATE', 'DELETE') and cursor.rowcount > 0:
+            db_rows.inc(cursor.rowcount, database=database, statement=kind)
+
+    @event.listens_for(engine, 'handle_error')
+    def handle_error(context):
+        started = context.connection.info.get('query_started') if context.connection is not None else None
+        if started:
+            started.pop()
+
+
+def init_app(app):
+    from app import db
+
+    @app.before_request
+    def start_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        started = g.pop('request_started', None)
+        if started is not None:
+            route = request.url_rule.rule if request.url_rule else 'unmatched'
+            request_duration.observe(
+                time.perf_counter() - started, method=request.method, route=route, status=response.status_code)
+        return response
+
+    with app.app_context():
+        for bind_key, engine in db.engines.items():
+            database = os.path.basename(engine.url.database or '') or (bind_key or 'main')
+            instrument_engine(engine, database)
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = registry.render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_metrics(port, host='0.0.0.0'):
+    """Serve ``/metrics`` from a daemon thread, for processes without the web app (the collector)"""
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+    return server
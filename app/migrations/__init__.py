@@ -0,0 +1,163 @@
+"""Versioned schema migrations for the temperature database.
+
+Each migration is a module in this package named ``vNNN_<description>.py``
+that defines ``VERSION``, ``DESCRIPTION`` and ``upgrade(conn)``. Applied
+versions are recorded in the ``schema_version`` table so every migration
+runs exactly once per database. Migrations spell out their DDL in SQL
+instead of creating tables from ``app.models``, so each keeps building the
+schema of its own version as the models move on.
+
+A new database is created from the models and stamped with every version
+instead of replaying the migrations. ``prepare`` holds a lock file next to
+the database while it creates or upgrades it, so the web server and the
+collector starting together don't run the same migration twice.
+"""
+import fcntl
+import importlib
+import logging
+import os
+import pkgutil
+from contextlib import contextmanager
+from datetime import datetime
+from sqlalchemy import inspect, text
+
+logger = logging.getLogger(__name__)
+
+
+def discover_migrations():
+    """Return all migration modules in this package, ordered by version"""
+    modules = []
+    for info in pkgutil.iter_modules(__path__):
+        if not info.name.startswith('v'):
+            continue
+        modules.append(importlib.import_module(f'{__name__}.{info.name}'))
+
+    modules.sort(key=lambda m: m.VERSION)
+    versions = [m.VERSION for m in modules]
+    if len(versions) != len(set(versions)):
+        raise RuntimeError(f"Duplicate migration versions: {versions}")
+    return modules
+
+
+def ensure_version_table(conn):
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_version ("
+        "version INTEGER PRIMARY KEY, "
+        "description VARCHAR(200) NOT NULL, "
+        "applied_at DATETIME NOT NULL)"
+    ))
+
+
+def column_names(conn, table):
+    """Return the set of column names currently defined on ``table``"""
+    rows = conn.execute(text(f"PRAGMA table_info({table})")).fetchall()
+    return {row[1] for row in rows}
+
+
+def current_version(conn):
+    """Return the highest applied migration version, or 0 for a new database"""
+    ensure_version_table(conn)
+    version = conn.execute(text("SELECT MAX(version) FROM schema_version")).scalar()
+    return version or 0
+
+
+def latest_version():
+    migrations = discover_migrations()
+    return migrations[-1].VERSION if migrations else 0
+
+
+def schema_is_current(engine):
+    """Whether every migration has been applied, so the tables already match the models"""
+    with engine.begin() as conn:
+        return current_version(conn) >= latest_version()
+
+
+def pending_migrations(conn):
+    applied = current_version(conn)
+    return [m for m in discover_migrations() if m.VERSION > applied]
+
+
+def record_version(conn, migration):
+    conn.execute(
+        text(
+            "INSERT OR IGNORE INTO schema_version (version, description, applied_at) "
+            "VALUES (:version, :description, :applied_at)"
+        ),
+        {
+            'version': migration.VERSION,
+            'description': migration.DESCRIPTION,
+            'applied_at': datetime.utcnow(),
+        },
+    )
+
+
+def stamp(conn):
+    """Mark every migration applied, for a schema just created from the models"""
+    ensure_version_table(conn)
+    for migration in discover_migrations():
+        record_version(conn, migration)
+
+
+@contextmanager
+def migration_lock(engine):
+    """Hold an exclusive lock on ``<database>.migrate.lock`` for file databases"""
+    database = engine.url.database
+    if engine.dialect.name != 'sqlite' or not database or database == ':memory:':
+        yield
+        return
+    with open(f'{os.path.abspath(database)}.migrate.lock', 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def prepare(engine, metadata, run_migrations=True):
+    """Bring ``engine``'s database to the current schema.
+
+    A database without ``temperature_reading`` is new: its tables are created
+    from ``metadata`` and every migration is stamped as applied. An older
+    database gets its pending migrations (unless ``run_migrations`` is
+    false), then any tables the migrations don't create. Returns the
+    versions that were applied.
+    """
+    with migration_lock(engine):
+        # Another process may have finished while we waited for the lock
+        if schema_is_current(engine):
+            return []
+
+        with engine.connect() as conn:
+            fresh = not inspect(conn).has_table('temperature_reading')
+        if fresh:
+            metadata.create_all(engine)
+            with engine.begin() as conn:
+                stamp(conn)
+            logger.info("Created schema at version %03d", latest_version())
+            return []
+
+        if not run_migrations:
+            return []
+        applied = upgrade(engine)
+        metadata.create_all(engine)
+        return applied
+
+
+def upgrade(engine):
+    """Apply every pending migration, each in its own transaction.
+
+    Returns the list of versions that were applied. Call it through
+    ``prepare``, which holds the migration lock and skips new databases.
+    """
+    applied = []
+    with engine.begin() as conn:
+        pending = pending_migrations(conn)
+
+    for migration in pending:
+        with engine.begin() as conn:
+            migration.upgrade(conn)
+            record_version(conn, migration)
+        logger.info("Applied migration %03d: %s", migration.VERSION, migration.DESCRIPTION)
+        applied.append(migration.VERSION)
+
+    return applied
@@ -0,0 +1,13 @@
+"""Add outside temperature columns to temperature_reading."""
+from sqlalchemy import text
+from app.migrations import column_names
+
+VERSION = 1
+DESCRIPTION = 'add outside temperature columns'
+
+
+def upgrade(conn):
+    existing = column_names(conn, 'temperature_reading')
+    for column in ('outside_temperature_c', 'outside_temperature_f'):
+        if column not in existing:
+            conn.execute(text(f"ALTER TABLE temperature_reading ADD COLUMN {column} REAL"))
@@ -0,0 +1,19 @@
+"""Index temperature_reading for time-range and latest-reading queries."""
+from sqlalchemy import text
+
+VERSION = 2
+DESCRIPTION = 'add timestamp/device_name indexes to temperature_reading'
+
+
+def upgrade(conn):
+    # Range scans in /api/temperatures and /api/statistics
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_temperature_reading_timestamp_device "
+        "ON temperature_reading (timestamp, device_name)"
+    ))
+    # ORDER BY timestamp DESC LIMIT 1 in /api/current
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_temperature_reading_timestamp_desc "
+        "ON temperature_reading (timestamp DESC)"
+    ))
+    conn.execute(text("ANALYZE temperature_reading"))
@@ -0,0 +1,30 @@
+"""Create reading_rollup and backfill it from existing raw readings."""
+from sqlalchemy import text
+
+VERSION = 3
+DESCRIPTION = 'create and backfill reading_rollup'
+
+
+def upgrade(conn):
+    # The table as of this version; v005 recreates it with site_id
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS reading_rollup ("
+        "id INTEGER NOT NULL, "
+        "resolution INTEGER NOT NULL, "
+        "bucket_start DATETIME NOT NULL, "
+        "device_name VARCHAR(100) NOT NULL, "
+        "count INTEGER NOT NULL, "
+        "temperature_sum FLOAT, temperature_min FLOAT, temperature_max FLOAT, "
+        "humidity_count INTEGER NOT NULL, humidity_sum FLOAT, humidity_min FLOAT, humidity_max FLOAT, "
+        "outside_count INTEGER NOT NULL, outside_sum FLOAT, outside_min FLOAT, outside_max FLOAT, "
+        "target_count INTEGER NOT NULL, target_sum FLOAT, "
+        "heating_count INTEGER NOT NULL, cooling_count INTEGER NOT NULL, "
+        "PRIMARY KEY (id), "
+        "CONSTRAINT uq_reading_rollup_bucket UNIQUE (resolution, device_name, bucket_start))"
+    ))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_reading_rollup_resolution_bucket "
+        "ON reading_rollup (resolution, bucket_start)"
+    ))
+    # The backfill happens in v005, which rebuilds every rollup once
+    # temperature_reading has its site_id column
@@ -0,0 +1,12 @@
+"""Create data_generation, which earlier databases only got from db.create_all()."""
+from sqlalchemy import text
+
+VERSION = 4
+DESCRIPTION = 'create data_generation'
+
+
+def upgrade(conn):
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS data_generation ("
+        "id INTEGER NOT NULL, generation INTEGER NOT NULL, PRIMARY KEY (id))"
+    ))
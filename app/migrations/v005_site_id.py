@@ -0,0 +1,47 @@
+"""Add site_id to readings and rollups, with site-leading indexes."""
+from sqlalchemy import text
+from app.migrations import column_names
+from app.rollups import rebuild_rollups
+from app.sites import DEFAULT_SITE_ID
+
+VERSION = 5
+DESCRIPTION = 'add site_id to temperature_reading and reading_rollup'
+
+
+def upgrade(conn):
+    if 'site_id' not in column_names(conn, 'temperature_reading'):
+        conn.execute(text(
+            f"ALTER TABLE temperature_reading ADD COLUMN site_id VARCHAR(64) NOT NULL DEFAULT '{DEFAULT_SITE_ID}'"
+        ))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_temperature_reading_site_timestamp "
+        "ON temperature_reading (site_id, timestamp, device_name)"
+    ))
+    # Superseded by the site-leading index
+    conn.execute(text("DROP INDEX IF EXISTS ix_temperature_reading_timestamp_device"))
+
+    # Rollups are derived data: recreate the table with site_id in its key
+    # instead of rebuilding it column by column
+    conn.execute(text("DROP TABLE IF EXISTS reading_rollup"))
+    conn.execute(text(
+        "CREATE TABLE reading_rollup ("
+        "id INTEGER NOT NULL, "
+        "resolution INTEGER NOT NULL, "
+        f"site_id VARCHAR(64) DEFAULT '{DEFAULT_SITE_ID}' NOT NULL, "
+        "bucket_start DATETIME NOT NULL, "
+        "device_name VARCHAR(100) NOT NULL, "
+        "count INTEGER NOT NULL, "
+        "temperature_sum FLOAT, temperature_min FLOAT, temperature_max FLOAT, "
+        "humidity_count INTEGER NOT NULL, humidity_sum FLOAT, humidity_min FLOAT, humidity_max FLOAT, "
+        "outside_count INTEGER NOT NULL, outside_sum FLOAT, outside_min FLOAT, outside_max FLOAT, "
+        "target_count INTEGER NOT NULL, target_sum FLOAT, "
+        "heating_count INTEGER NOT NULL, cooling_count INTEGER NOT NULL, "
+        "PRIMARY KEY (id), "
+        "CONSTRAINT uq_reading_rollup_bucket UNIQUE (resolution, site_id, device_name, bucket_start))"
+    ))
+    conn.execute(text(
+        "CREATE INDEX ix_reading_rollup_site_resolution_bucket "
+        "ON reading_rollup (site_id, resolution, bucket_start)"
+    ))
+    rebuild_rollups(conn)
+    conn.execute(text("ANALYZE temperature_reading"))
@@ -0,0 +1,54 @@
+"""Move outside temperatures out of temperature_reading into weather_observation."""
+import sqlite3
+from sqlalchemy import text
+from app.migrations import column_names
+
+VERSION = 6
+DESCRIPTION = 'link readings to weather observations'
+
+
+def upgrade(conn):
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS weather_observation ("
+        "id INTEGER NOT NULL, "
+        "latitude FLOAT, longitude FLOAT, "
+        "observed_at DATETIME NOT NULL, fetched_at DATETIME NOT NULL, "
+        "temperature_c FLOAT, temperature_f FLOAT, humidity FLOAT, wind_speed FLOAT, "
+        "description VARCHAR(100), "
+        "PRIMARY KEY (id), "
+        "CONSTRAINT uq_weather_observation_location_time UNIQUE (latitude, longitude, observed_at))"
+    ))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_weather_observation_fetched_at ON weather_observation (fetched_at)"
+    ))
+    columns = column_names(conn, 'temperature_reading')
+    if 'weather_observation_id' not in columns:
+        conn.execute(text(
+            "ALTER TABLE temperature_reading ADD COLUMN weather_observation_id INTEGER "
+            "REFERENCES weather_observation (id)"
+        ))
+    if 'outside_temperature_c' not in columns:
+        return
+
+    # Every device row of a collection cycle copied the same values, so each
+    # distinct (timestamp, value) becomes one observation. The location
+    # wasn't recorded, so these observations have none.
+    conn.execute(text(
+        "INSERT INTO weather_observation (observed_at, fetched_at, temperature_c, temperature_f) "
+        "SELECT timestamp, timestamp, outside_temperature_c, outside_temperature_f "
+        "FROM temperature_reading WHERE outside_temperature_c IS NOT NULL "
+        "GROUP BY timestamp, outside_temperature_c, outside_temperature_f"
+    ))
+    conn.execute(text(
+        "UPDATE temperature_reading SET weather_observation_id = ("
+        "SELECT w.id FROM weather_observation w "
+        "WHERE w.latitude IS NULL AND w.longitude IS NULL "
+        "AND w.observed_at = temperature_reading.timestamp "
+        "AND w.temperature_c = temperature_reading.outside_temperature_c "
+        "AND w.temperature_f IS temperature_reading.outside_temperature_f) "
+        "WHERE outside_temperature_c IS NOT NULL AND weather_observation_id IS NULL"
+    ))
+    # DROP COLUMN needs SQLite 3.35; older versions keep the unused columns
+    if sqlite3.sqlite_version_info >= (3, 35, 0):
+        for column in ('outside_temperature_c', 'outside_temperature_f'):
+            conn.execute(text(f"ALTER TABLE temperature_reading DROP COLUMN {column}"))
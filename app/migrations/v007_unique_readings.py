@@ -0,0 +1,22 @@
+"""Make (site_id, timestamp, device_name) unique so spool replays are idempotent."""
+from sqlalchemy import text
+from app.rollups import rebuild_rollups
+
+VERSION = 7
+DESCRIPTION = 'unique reading per site, timestamp and device'
+
+
+def upgrade(conn):
+    # Keep the first copy of any reading stored twice; the rollups counted
+    # the copies too, so they are rebuilt if anything was removed
+    deleted = conn.execute(text(
+        "DELETE FROM temperature_reading WHERE id NOT IN ("
+        "SELECT MIN(id) FROM temperature_reading GROUP BY site_id, timestamp, device_name)"
+    )).rowcount
+    if deleted:
+        rebuild_rollups(conn)
+    conn.execute(text("DROP INDEX IF EXISTS ix_temperature_reading_site_timestamp"))
+    conn.execute(text(
+        "CREATE UNIQUE INDEX ix_temperature_reading_site_timestamp "
+        "ON temperature_reading (site_id, timestamp, device_name)"
+    ))
@@ -1,8 +1,10 @@
 from app import db
+from app.sites import DEFAULT_SITE_ID
 from datetime import datetime
 
 class TemperatureReading(db.Model):
     id = db.Column(db.Integer, primary_key=True)
+    site_id = db.Column(db.String(64), nullable=False, default=DEFAULT_SITE_ID, server_default=DEFAULT_SITE_ID)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     device_name = db.Column(db.String(100), nullable=False)
     temperature_c = db.Column(db.Float, nullable=False)
@@ -12,9 +14,26 @@ class TemperatureReading(db.Model):
     target_temperature_f = db.Column(db.Float)
     hvac_mode = db.Column(db.String(50))
     hvac_state = db.Column(db.String(50))
-    outside_temperature_c = db.Column(db.Float)
-    outside_temperature_f = db.Column(db.Float)
+    # Outside conditions are stored once per observation, not copied into every device's row
+    weather_observation_id = db.Column(db.Integer, db.ForeignKey('weather_observation.id'))
+    weather_observation = db.relationship('WeatherObservation', lazy='joined')
+
+    __table_args__ = (
+        # Every dashboard query is for one site's time range; unique so a
+        # replayed spool batch can never store a reading twice
+        db.Index('ix_temperature_reading_site_timestamp', 'site_id', 'timestamp', 'device_name', unique=True),
+        # Retention deletes by age across all sites
+        db.Index('ix_temperature_reading_timestamp_desc', timestamp.desc()),
+    )
     
+    @property
+    def outside_temperature_c(self):
+        return self.weather_observation.temperature_c if self.weather_observation else None
+
+    @property
+    def outside_temperature_f(self):
+        return self.weather_observation.temperature_f if self.weather_observation else None
+
     def to_dict(self):
         return {
             'id': self.id,
@@ -29,4 +48,115 @@ class TemperatureReading(db.Model):
             'hvac_state': self.hvac_state,
             'outside_temperature_c': self.outside_temperature_c,
             'outside_temperature_f': self.outside_temperature_f
-        }
\ No newline at end of file
+        }
+
+
+class WeatherObservation(db.Model):
+    """Current conditions at one location as reported by OpenWeatherMap"""
+    id = db.Column(db.Integer, primary_key=True)
+    # Rounded like app.weather.location_key; NULL for observations carried over
+    # from readings that stored their outside temperature inline
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
+    observed_at = db.Column(db.DateTime, nullable=False)
+    fetched_at = db.Column(db.DateTime, nullable=False)
+    temperature_c = db.Column(db.Float)
+    temperature_f = db.Column(db.Float)
+    humidity = db.Column(db.Float)
+    wind_speed = db.Column(db.Float)
+    description = db.Column(db.String(100))
+
+    __table_args__ = (
+        # One row per report, however many sites or cycles fetched it
+        db.UniqueConstraint('latitude', 'longitude', 'observed_at', name='uq_weather_observation_location_time'),
+        # Retention deletes by age
+        db.Index('ix_weather_observation_fetched_at', 'fetched_at'),
+    )
+
+
+class ReadingRollup(db.Model):
+    """Count/sum/min/max of one device's readings over a fixed time bucket"""
+    id = db.Column(db.Integer, primary_key=True)
+    resolution = db.Column(db.Integer, nullable=False)  # bucket size in seconds
+    site_id = db.Column(db.String(64), nullable=False, default=DEFAULT_SITE_ID, server_default=DEFAULT_SITE_ID)
+    bucket_start = db.Column(db.DateTime, nullable=False)
+    device_name = db.Column(db.String(100), nullable=False)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    temperature_sum = db.Column(db.Float)
+    temperature_min = db.Column(db.Float)
+    temperature_max = db.Column(db.Float)
+    humidity_count = db.Column(db.Integer, nullable=False, default=0)
+    humidity_sum = db.Column(db.Float)
+    humidity_min = db.Column(db.Float)
+    humidity_max = db.Column(db.Float)
+    outside_count = db.Column(db.Integer, nullable=False, default=0)
+    outside_sum = db.Column(db.Float)
+    outside_min = db.Column(db.Float)
+    outside_max = db.Column(db.Float)
+    target_count = db.Column(db.Integer, nullable=False, default=0)
+    target_sum = db.Column(db.Float)
+    heating_count = db.Column(db.Integer, nullable=False, default=0)
+    cooling_count = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.UniqueConstraint('resolution', 'site_id', 'device_name', 'bucket_start', name='uq_reading_rollup_bucket'),
+        db.Index('ix_reading_rollup_site_resolution_bucket', 'site_id', 'resolution', 'bucket_start'),
+    )
+
+    # Bucket averages, named like the TemperatureReading columns they summarise
+    @property
+    def timestamp(self):
+        return self.bucket_start
+
+    @property
+    def temperature_c(self):
+        return self.temperature_sum / self.count if self.count else None
+
+    @property
+    def humidity(self):
+        return self.humidity_sum / self.humidity_count if self.humidity_count else None
+
+    @property
+    def outside_temperature_c(self):
+        return self.outside_sum / self.outside_count if self.outside_count else None
+
+    @property
+    def target_temperature_c(self):
+        return self.target_sum / self.target_count if self.target_count else None
+
+    @property
+    def hvac_state(self):
+        """The HVAC state that was active for most of the bucket"""
+        if self.heating_count and self.heating_count * 2 >= self.count:
+            return 'HEATING'
+        if self.cooling_count and self.cooling_count * 2 >= self.count:
+            return 'COOLING'
+        return 'OFF'
+
+    def to_dict(self):
+        """Shape the bucket like TemperatureReading.to_dict() using bucket averages"""
+        temperature_c = self.temperature_c
+        outside_c = self.outside_temperature_c
+        target_c = self.target_temperature_c
+        return {
+            'timestamp': self.bucket_start.isoformat(),
+            'device_name': self.device_name,
+            'temperature_c': temperature_c,
+            'temperature_f': temperature_c * 9/5 + 32 if temperature_c is not None else None,
+            'humidity': self.humidity,
+            'target_temperature_c': target_c,
+            'target_temperature_f': target_c * 9/5 + 32 if target_c is not None else None,
+            'hvac_mode': None,
+            'hvac_state': self.hvac_state,
+            'outside_temperature_c': outside_c,
+            'outside_temperature_f': outside_c * 9/5 + 32 if outside_c is not None else None,
+            'temperature_min': self.temperature_min,
+            'temperature_max': self.temperature_max,
+            'samples': self.count,
+            'resolution': self.resolution
+        }
+
+class DataGeneration(db.Model):
+    """Single-row counter bumped whenever new readings are committed"""
+    id = db.Column(db.Integer, primary_key=True)
+    generation = db.Column(db.Integer, nullable=False, default=0)
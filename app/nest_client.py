@@ -1,24 +1,58 @@
+import logging
 import os
-import requests
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from app import db
-from app.models import TemperatureReading
+from app.cache import bump_generation
+from app.http_client import http_client
+from app.metrics import phase_duration, readings_collected
+from app.sites import sites, use_site
+from app.spool import spool, spool_replayer, store_batches
+from app.token_cache import token_cache, token_key
+from app.traits import extract_reading, has_required_traits
 from app.weather_client import WeatherClient
 
+# Upper bound on concurrent API requests during a collection cycle
+MAX_WORKERS = int(os.getenv('COLLECT_MAX_WORKERS', 4))
+
+logger = logging.getLogger(__name__)
+
 class NestClient:
-    def __init__(self):
-        self.client_id = os.getenv('NEST_CLIENT_ID')
-        self.client_secret = os.getenv('NEST_CLIENT_SECRET')
-        self.project_id = os.getenv('NEST_PROJECT_ID')
-        self.refresh_token = os.getenv('NEST_REFRESH_TOKEN')
+    def __init__(self, client_id=None, client_secret=None, project_id=None, refresh_token=None):
+        self.client_id = client_id or os.getenv('NEST_CLIENT_ID')
+        self.client_secret = client_secret or os.getenv('NEST_CLIENT_SECRET')
+        self.project_id = project_id or os.getenv('NEST_PROJECT_ID')
+        self.refresh_token = refresh_token or os.getenv('NEST_REFRESH_TOKEN')
+        self.token_url = os.getenv('NEST_TOKEN_URL', 'https://www.googleapis.com/oauth2/v4/token')
+        self.api_url = os.getenv('NEST_API_URL', 'https://smartdevicemanagement.googleapis.com/v1')
+        self.api_calls = 0
+        # Device fetches run on the collector's pool threads
+        self.calls_lock = threading.Lock()
         self.access_token = None
+    
+    @classmethod
+    def for_site(cls, site):
+        return cls(**site.nest)
+    
+    def count_call(self):
+        with self.calls_lock:
+            self.api_calls += 1
+    
+    def token_key(self):
+        return token_key(self.client_id, self.refresh_token)
         
     def get_access_token(self):
+        """Return an access token from the shared cache, refreshing it if needed"""
         if not self.refresh_token:
-            print("No refresh token available")
+            logger.warning("No refresh token available")
             return None
-            
-        url = "https://www.googleapis.com/oauth2/v4/token"
+        
+        self.access_token = token_cache.get(self.token_key(), self.request_access_token)
+        return self.access_token
+    
+    def request_access_token(self):
+        """Exchange the refresh token for a new access token"""
         data = {
             'client_id': self.client_id,
             'client_secret': self.client_secret,
@@ -26,114 +60,142 @@ class NestClient:
             'grant_type': 'refresh_token'
         }
         
-        response = requests.post(url, data=data)
+        response = http_client.post(self.token_url, 'oauth.token', data=data)
         if response.status_code == 200:
-            self.access_token = response.json()['access_token']
-            return self.access_token
+            return response.json()
         else:
-            print(f"Failed to get access token: {response.status_code}")
-            print(f"Error response: {response.text}")
+            logger.warning("Failed to get access token",
+                           extra={'status': response.status_code, 'response': response.text[:500]})
             return None
     
     def get_devices(self):
-        if not self.access_token:
-            self.get_access_token()
-            
-        if not self.access_token:
+        if not self.get_access_token():
             return None
             
-        url = f"https://smartdevicemanagement.googleapis.com/v1/enterprises/{self.project_id}/devices"
+        url = f"{self.api_url}/enterprises/{self.project_id}/devices"
         headers = {
             'Authorization': f'Bearer {self.access_token}',
             'Content-Type': 'application/json'
         }
         
-        response = requests.get(url, headers=headers)
+        self.count_call()
+        response = http_client.get(url, 'sdm.devices.list', headers=headers)
+        if response.status_code == 401:
+            token_cache.invalidate(self.token_key())
         if response.status_code == 200:
             return response.json().get('devices', [])
         else:
-            print(f"Failed to get devices: {response.status_code}")
+            logger.warning("Failed to get devices", extra={'status': response.status_code})
             return None
     
     def get_thermostat_data(self, device_id):
-        if not self.access_token:
-            self.get_access_token()
-            
-        if not self.access_token:
+        if not self.get_access_token():
             return None
             
-        url = f"https://smartdevicemanagement.googleapis.com/v1/{device_id}"
+        url = f"{self.api_url}/{device_id}"
         headers = {
             'Authorization': f'Bearer {self.access_token}',
             'Content-Type': 'application/json'
         }
         
-        response = requests.get(url, headers=headers)
+        self.count_call()
+        response = http_client.get(url, 'sdm.devices.get', headers=headers)
+        if response.status_code == 401:
+            token_cache.invalidate(self.token_key())
         if response.status_code == 200:
             data = response.json()
-            print(f"Raw API response: {data}")
+            logger.debug("Raw API response for %s: %s", device_id, data)
             return data
         else:
-            print(f"Failed to get thermostat data: {response.status_code}")
-            print(f"Error response: {response.text}")
+            logger.warning("Failed to get thermostat data",
+                           extra={'device': device_id, 'status': response.status_code, 'response': response.text[:500]})
             return None
 
-def collect_temperature_data():
-    from app import create_app
-    app = create_app()
+def _timed(phase, fetch, *args):
+    with phase_duration.time(phase=phase):
+        return fetch(*args)
+
+def _result(future, label):
+    """Return a fetch result, logging and skipping it if the request failed"""
+    try:
+        return future.result()
+    except Exception as e:
+        logger.warning("Failed to fetch %s: %s", label, e)
+        return None
+
+def collect_temperature_data(app=None, client=None, weather_client=None, site_id=None):
+    """Run one collection cycle for a site and return the number of readings collected.
+
+    The collector daemon passes in long-lived objects so the app and access
+    token are reused between cycles; HTTP connections are pooled by
+    ``app.http_client``. ``site_id``
+    defaults to the default site.
+
+    With the spool enabled (``app.spool``) the readings are appended to it
+    and stored by the replayer; otherwise they are written directly.
+    """
+    if app is None:
+        from app import create_app
+        app = create_app(use_spool=True)
+    site = sites.get(site_id or sites.default_id)
+    client = client or NestClient.for_site(site)
+    weather_client = weather_client or WeatherClient.for_site(site)
     
-    with app.app_context():
-        client = NestClient()
-        weather_client = WeatherClient()
-        devices = client.get_devices()
-        
-        if not devices:
-            print("No devices found or authentication failed")
-            return
+    with app.app_context(), use_site(site.id):
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+            # Weather doesn't depend on the device list, so fetch it alongside
+            weather_future = pool.submit(_timed, 'weather', weather_client.get_observation)
+            _timed('token', client.get_access_token)
+            devices = _timed('device_list', client.get_devices)
+            
+            if not devices:
+                logger.warning("No devices found or authentication failed", extra={'site': site.id})
+                return 0
+            
+            # devices.list already returns every device's traits, so only
+            # devices whose list entry lacks them need their own GET
+            device_futures = {
+                index: pool.submit(_timed, 'device_fetch', client.get_thermostat_data, device.get('name'))
+                for index, device in enumerate(devices) if not has_required_traits(device)
+            }
+            weather_data = _result(weather_future, 'weather data')
+            device_results = [
+                _result(device_futures[index], device.get('name')) if index in device_futures else device
+                for index, device in enumerate(devices)
+            ]
         
-        # Get current weather data
-        weather_data = weather_client.get_current_weather()
         outside_temp_c = None
         outside_temp_f = None
         
         if weather_data:
             outside_temp_c = weather_data['temperature_c']
             outside_temp_f = weather_data['temperature_f']
-            print(f"Outside temperature: {outside_temp_c}°C / {outside_temp_f}°F")
+            logger.debug("Outside temperature: %s°C / %s°F", outside_temp_c, outside_temp_f)
         else:
-            print("Could not fetch weather data")
+            logger.warning("Could not fetch weather data", extra={'site': site.id})
         
-        for device in devices:
-            device_id = device.get('name')
-            device_data = client.get_thermostat_data(device_id)
-            
-            if device_data:
-                traits = device_data.get('traits', {})
-                
-                temp_data = traits.get('sdm.devices.traits.Temperature', {})
-                humidity_data = traits.get('sdm.devices.traits.Humidity', {})
-                thermostat_data = traits.get('sdm.devices.traits.ThermostatTemperatureSetpoint', {})
-                hvac_data = traits.get('sdm.devices.traits.ThermostatHvac', {})
-                
-                if temp_data:
-                    temp_c = temp_data.get('ambientTemperatureCelsius')
-                    print(f"Temperature data extracted: {temp_c}°C")
-                    print(f"Full temperature traits: {temp_data}")
-                    
-                    reading = TemperatureReading(
-                        device_name=device_data.get('displayName', 'Unknown'),
-                        temperature_c=temp_c,
-                        temperature_f=temp_c * 9/5 + 32 if temp_c else None,
-                        humidity=humidity_data.get('ambientHumidityPercent'),
-                        target_temperature_c=thermostat_data.get('heatCelsius') or thermostat_data.get('coolCelsius'),
-                        target_temperature_f=(thermostat_data.get('heatCelsius') or thermostat_data.get('coolCelsius', 0)) * 9/5 + 32 if thermostat_data else None,
-                        hvac_mode=hvac_data.get('mode'),
-                        hvac_state=hvac_data.get('status'),
-                        outside_temperature_c=outside_temp_c,
-                        outside_temperature_f=outside_temp_f
-                    )
-                    
-                    db.session.add(reading)
+        collected_at = datetime.utcnow()
+        rows = []
+        for device_data in device_results:
+            fields = extract_reading(device_data) if device_data else None
+            if fields:
+                logger.debug("Temperature data extracted: %s°C", fields['temperature_c'])
+                rows.append(dict(
+                    fields,
+                    timestamp=collected_at,
+                    outside_temperature_c=outside_temp_c,
+                    outside_temperature_f=outside_temp_f
+                ))
         
-        db.session.commit()
-        print(f"Temperature data collected at {datetime.now()}")
\ No newline at end of file
+        with phase_duration.time(phase='commit'):
+            if spool.enabled:
+                # Durable once appended, whether or not the database is writable now
+                spool.append(site.id, rows, weather_data, weather_client.location)
+                spool_replayer.notify()
+            else:
+                store_batches([{'readings': rows, 'weather': weather_data, 'location': weather_client.location}])
+                bump_generation()
+                db.session.commit()
+        readings_collected.inc(len(rows), site=site.id)
+        logger.debug("Temperature data collected", extra={'site': site.id, 'readings': len(rows)})
+        return len(rows)
@@ -0,0 +1,128 @@
+"""Column-tuple read path for temperature readings.
+
+Selects only the requested columns through SQLAlchemy Core so rows come
+back as plain tuples instead of hydrated ``TemperatureReading`` objects.
+Outside temperatures are joined in from the linked weather observation
+only when they are asked for.
+"""
+from sqlalchemy import func, select
+from app import db
+from app.models import TemperatureReading, WeatherObservation
+from app.sites import current_site_id
+from app.weather import OUTSIDE_FIELDS
+
+# Same keys and order as TemperatureReading.to_dict()
+READING_FIELDS = (
+    'id', 'timestamp', 'device_name', 'temperature_c', 'temperature_f', 'humidity',
+    'target_temperature_c', 'target_temperature_f', 'hvac_mode', 'hvac_state',
+    'outside_temperature_c', 'outside_temperature_f'
+)
+
+# Columns the downsampler reads from each row
+DOWNSAMPLE_FIELDS = ('timestamp', 'device_name', 'temperature_c', 'hvac_state')
+
+SHAPES = ('rows', 'columnar')
+
+
+def parse_fields(value):
+    """Turn a comma-separated ``fields`` parameter into a tuple of column names"""
+    if not value:
+        return READING_FIELDS
+    fields = tuple(f.strip() for f in value.split(',') if f.strip())
+    unknown = [f for f in fields if f not in READING_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return fields
+
+
+def with_fields(fields, extra):
+    """``fields`` followed by any columns from ``extra`` it does not already include"""
+    return fields + tuple(f for f in extra if f not in fields)
+
+
+def _select(columns):
+    """SELECT of ``columns`` from the current site's readings"""
+    table = TemperatureReading.__table__
+    observations = WeatherObservation.__table__
+    stmt = select(*(
+        observations.c[OUTSIDE_FIELDS[name]].label(name) if name in OUTSIDE_FIELDS else table.c[name]
+        for name in columns
+    ))
+    if any(name in OUTSIDE_FIELDS for name in columns):
+        stmt = stmt.select_from(
+            table.outerjoin(observations, table.c.weather_observation_id == observations.c.id)
+        )
+    return stmt.where(table.c.site_id == current_site_id())
+
+
+def select_readings(since, columns, until=None, yield_per=None, device=None):
+    """Rows of ``columns`` for readings in [since, until), oldest first"""
+    table = TemperatureReading.__table__
+    stmt = _select(columns).where(table.c.timestamp >= since)
+    if until is not None:
+        stmt = stmt.where(table.c.timestamp < until)
+    if device is not None:
+        stmt = stmt.where(table.c.device_name == device)
+    stmt = stmt.order_by(table.c.timestamp)
+    if yield_per:
+        stmt = stmt.execution_options(yield_per=yield_per)
+    return db.session.execute(stmt)
+
+
+def select_readings_after_id(since_id, columns, since=None, limit=None):
+    """Rows of ``columns`` for readings stored after the one with id ``since_id``, oldest first.
+
+    ``since`` skips readings older than it. With ``limit``, only the first
+    ``limit`` readings by id are returned, so the highest id among them is
+    a cursor that skips nothing.
+    """
+    table = TemperatureReading.__table__
+    stmt = _select(columns).where(table.c.id > since_id)
+    if since is not None:
+        stmt = stmt.where(table.c.timestamp >= since)
+    if limit is None:
+        return db.session.execute(stmt.order_by(table.c.timestamp))
+    rows = db.session.execute(stmt.order_by(table.c.id).limit(limit)).all()
+    rows.sort(key=lambda row: row.timestamp)
+    return rows
+
+
+def select_last_id():
+    t = TemperatureReading
+    return db.session.execute(select(func.max(t.id)).where(t.site_id == current_site_id())).scalar()
+
+
+def select_latest(columns):
+    table = TemperatureReading.__table__
+    stmt = _select(columns).order_by(table.c.timestamp.desc()).limit(1)
+    return db.session.execute(stmt).first()
+
+
+def project_rows(rows, source_fields, fields):
+    """Reorder/trim tuples selected as ``source_fields`` down to ``fields``"""
+    if source_fields[:len(fields)] == fields:
+        width = len(fields)
+        return [tuple(row[:width]) for row in rows]
+    positions = [source_fields.index(f) for f in fields]
+    return [tuple(row[p] for p in positions) for row in rows]
+
+
+def as_records(rows, fields):
+    return [dict(zip(fields, row)) for row in rows]
+
+
+def as_columns(rows, fields):
+    """Column-major shape, e.g. {"timestamp": [...], "temperature_c": [...]}"""
+    columns = list(zip(*rows)) if rows else [()] * len(fields)
+    return {field: list(values) for field, values in zip(fields, columns)}
+
+
+def shape_rows(rows, fields, shape):
+    if shape == 'columnar':
+        return as_columns(rows, fields)
+    return as_records(rows, fields)
+
+
+def shape_dicts(records, fields, shape):
+    """Apply ``fields``/``shape`` to already-built dicts such as rollup buckets"""
+    return shape_rows([tuple(r.get(f) for f in fields) for r in records], fields, shape)
@@ -0,0 +1,271 @@
+"""Tiered retention and compaction of stored readings.
+
+Raw readings older than the raw retention are deleted once the rollups for
+their day are known to cover them, and each rollup resolution is pruned to
+its own retention, e.g. raw readings for 30 days, 5-minute buckets for a
+year and hourly/daily buckets forever. Deletes run in bounded batches, each
+committed on its own, so the collector and dashboard never wait long on the
+write lock. Freed pages are then returned to the filesystem with
+incremental VACUUM.
+
+Weather observations go with the raw readings that link to them.
+
+Statistics and history for windows reaching past a tier's retention are
+served from the next coarser tier, so they may drop the few minutes before
+the window's first retained bucket boundary.
+
+Retention works on whole databases: ``compact`` runs once for the main
+database and once per sharded site.
+
+The ``columnar`` storage backend keeps no rollups to fall back on, so its
+readings are kept forever unless ``RETAIN_COLUMNAR_DAYS`` is set; then whole
+day partitions older than that are deleted, per site.
+"""
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import delete, func, select
+from app import db
+from app.cache import bump_generation
+from app.models import ReadingRollup, TemperatureReading, WeatherObservation
+from app.rollups import DAY, FIVE_MINUTES, HOUR, bucket_floor, rebuild_rollups
+from app.sites import site_engine, sites, use_site
+from app.storage import storage
+from app.weather import observation_cache
+
+logger = logging.getLogger(__name__)
+
+# Retention of 0 days keeps a tier forever
+FOREVER = 0
+
+# PRAGMA auto_vacuum value for INCREMENTAL
+INCREMENTAL = 2
+
+
+class RetentionPolicy:
+    def __init__(self, raw_days=30, five_minute_days=365, hour_days=FOREVER, day_days=FOREVER,
+                 batch_size=5000, vacuum_pages=1000, columnar_days=FOREVER):
+        self.raw_days = raw_days
+        self.rollup_days = {FIVE_MINUTES: five_minute_days, HOUR: hour_days, DAY: day_days}
+        self.columnar_days = columnar_days
+        self.batch_size = batch_size
+        self.vacuum_pages = vacuum_pages
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            raw_days=int(os.getenv('RETAIN_RAW_DAYS', 30)),
+            five_minute_days=int(os.getenv('RETAIN_5MIN_DAYS', 365)),
+            hour_days=int(os.getenv('RETAIN_HOURLY_DAYS', FOREVER)),
+            day_days=int(os.getenv('RETAIN_DAILY_DAYS', FOREVER)),
+            batch_size=int(os.getenv('COMPACT_BATCH_SIZE', 5000)),
+            vacuum_pages=int(os.getenv('COMPACT_VACUUM_PAGES', 1000)),
+            columnar_days=int(os.getenv('RETAIN_COLUMNAR_DAYS', FOREVER)),
+        )
+
+    @staticmethod
+    def cutoff(days, now):
+        """Start of the oldest day to keep, or None to keep everything"""
+        if days == FOREVER:
+            return None
+        return bucket_floor(now - timedelta(days=days), DAY)
+
+    def raw_cutoff(self, now):
+        return self.cutoff(self.raw_days, now)
+
+    def rollup_cutoff(self, resolution, now):
+        return self.cutoff(self.rollup_days[resolution], now)
+
+
+def _delete_in_batches(table, condition, batch_size):
+    """Delete rows matching ``condition`` ``batch_size`` at a time, one short transaction each"""
+    batch = select(table.c.id).where(condition).limit(batch_size).scalar_subquery()
+    statement = delete(table).where(table.c.id.in_(batch))
+    deleted = 0
+    while True:
+        with site_engine().begin() as conn:
+            count = conn.execute(statement).rowcount
+        deleted += count
+        if count < batch_size:
+            return deleted
+
+
+def _rollups_cover(conn, start, end, policy, now):
+    """Whether every retained rollup resolution accounts for each raw reading in [start, end)"""
+    t = TemperatureReading
+    raw = conn.execute(
+        select(t.site_id, t.device_name, func.count()).where(t.timestamp >= start, t.timestamp < end)
+        .group_by(t.site_id, t.device_name)
+    ).all()
+    r = ReadingRollup
+    rolled = conn.execute(
+        select(r.resolution, r.site_id, r.device_name, func.sum(r.count))
+        .where(r.bucket_start >= start, r.bucket_start < end)
+        .group_by(r.resolution, r.site_id, r.device_name)
+    ).all()
+    counts = {(resolution, site, device): count for resolution, site, device, count in rolled}
+    for resolution in policy.rollup_days:
+        cutoff = policy.rollup_cutoff(resolution, now)
+        if cutoff is not None and start < cutoff:
+            continue
+        if any(counts.get((resolution, site, device)) != count for site, device, count in raw):
+            return False
+    return True
+
+
+def compact_raw_readings(policy, now):
+    """Delete raw readings older than the raw retention, one day at a time.
+
+    Returns (readings deleted, days whose rollups had to be rebuilt first).
+    """
+    cutoff = policy.raw_cutoff(now)
+    if cutoff is None:
+        return 0, 0
+
+    deleted = 0
+    rebuilt = 0
+    while True:
+        with site_engine().connect() as conn:
+            oldest = conn.execute(select(func.min(TemperatureReading.timestamp))).scalar()
+        if oldest is None or oldest >= cutoff:
+            return deleted, rebuilt
+
+        start = bucket_floor(oldest, DAY)
+        end = start + timedelta(seconds=DAY)
+        with site_engine().begin() as conn:
+            if not _rollups_cover(conn, start, end, policy, now):
+                rebuild_rollups(conn, start, end)
+                rebuilt += 1
+        table = TemperatureReading.__table__
+        deleted += _delete_in_batches(table, table.c.timestamp < end, policy.batch_size)
+
+
+def compact_observations(policy, now):
+    """Delete weather observations no retained raw reading can link to"""
+    cutoff = policy.raw_cutoff(now)
+    if cutoff is None:
+        return 0
+    # A reading links to an observation fetched at most one cache TTL before it
+    table = WeatherObservation.__table__
+    condition = table.c.fetched_at < cutoff - timedelta(seconds=observation_cache.ttl)
+    return _delete_in_batches(table, condition, policy.batch_size)
+
+
+def compact_rollups(policy, now):
+    """Delete rollup buckets past their resolution's retention; returns {resolution: deleted}"""
+    table = ReadingRollup.__table__
+    deleted = {}
+    for resolution in policy.rollup_days:
+        cutoff = policy.rollup_cutoff(resolution, now)
+        if cutoff is None:
+            continue
+        condition = (table.c.resolution == resolution) & (table.c.bucket_start < cutoff)
+        deleted[resolution] = _delete_in_batches(table, condition, policy.batch_size)
+    return deleted
+
+
+def database_bytes():
+    with site_engine().connect() as conn:
+        page_size = conn.exec_driver_sql("PRAGMA page_size").scalar()
+        return conn.exec_driver_sql("PRAGMA page_count").scalar() * page_size
+
+
+def incremental_vacuum_enabled(engine):
+    with engine.connect() as conn:
+        return conn.exec_driver_sql("PRAGMA auto_vacuum").scalar() == INCREMENTAL
+
+
+def enable_incremental_vacuum(engine):
+    """Switch an existing database to auto_vacuum=INCREMENTAL; returns True if it needed to.
+
+    This takes one full VACUUM, which rewrites the whole file under an
+    exclusive lock, so it is only run by hand (``migrate.py
+    --incremental-vacuum``), never by the scheduled compaction.
+    """
+    if incremental_vacuum_enabled(engine):
+        return False
+    # VACUUM cannot run inside a transaction
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        conn.exec_driver_sql("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.exec_driver_sql("VACUUM")
+    return True
+
+
+def incremental_vacuum(pages):
+    """Release free pages back to the filesystem, ``pages`` per write transaction"""
+    with site_engine().connect() as conn:
+        free = conn.exec_driver_sql("PRAGMA freelist_count").scalar()
+        while free:
+            # Each step of the pragma frees one page, and sqlite3 steps a
+            # statement without result columns only once; executescript
+            # runs it to completion in its own transaction
+            conn.connection.dbapi_connection.executescript(f"PRAGMA incremental_vacuum({int(pages)})")
+            remaining = conn.exec_driver_sql("PRAGMA freelist_count").scalar()
+            if remaining >= free:
+                break
+            free = remaining
+        # Fold the WAL back in and truncate it so the space shows up on disk
+        conn.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+
+
+def compact(policy=None, now=None):
+    """Apply the retention policy and vacuum every database; returns a summary per database"""
+    policy = policy or RetentionPolicy.from_env()
+    now = now or datetime.utcnow()
+    summaries = {}
+    for site in sites.shards():
+        with use_site(site.id):
+            summaries[site.database or 'main'] = compact_database(policy, now)
+    if storage.backend == 'columnar':
+        # Columnar arrays live per site, not per database
+        for site in sites:
+            with use_site(site.id):
+                summaries[f'columnar:{site.id}'] = compact_columnar(policy, now)
+    return summaries
+
+
+def compact_database(policy, now):
+    """Apply the retention policy to the current site's database and vacuum it"""
+    started = time.perf_counter()
+
+    raw_deleted, rebuilt_days = compact_raw_readings(policy, now)
+    observations_deleted = compact_observations(policy, now)
+    rollups_deleted = compact_rollups(policy, now)
+    if raw_deleted or any(rollups_deleted.values()):
+        bump_generation()
+        db.session.commit()
+
+    reclaimed = 0
+    if site_engine().dialect.name == 'sqlite':
+        if incremental_vacuum_enabled(site_engine()):
+            size_before = database_bytes()
+            incremental_vacuum(policy.vacuum_pages)
+            reclaimed = size_before - database_bytes()
+        else:
+            logger.warning("Database is not in incremental auto-vacuum mode; freed pages stay in the file "
+                           "until you run python migrate.py --incremental-vacuum")
+
+    summary = {
+        'raw_deleted': raw_deleted,
+        'rebuilt_days': rebuilt_days,
+        'observations_deleted': observations_deleted,
+        'rollups_deleted': sum(rollups_deleted.values()),
+        'reclaimed_bytes': reclaimed,
+        'seconds': time.perf_counter() - started,
+    }
+    logger.info("Compaction finished", extra=dict(summary, database=site_engine().url.database))
+    return summary
+
+
+def compact_columnar(policy, now):
+    """Delete the current site's columnar day partitions past the columnar retention"""
+    started = time.perf_counter()
+    cutoff = policy.cutoff(policy.columnar_days, now)
+    deleted = storage.store.drop_days_before(cutoff) if cutoff is not None else 0
+    if deleted:
+        bump_generation()
+        db.session.commit()
+    summary = {'raw_deleted': deleted, 'seconds': time.perf_counter() - started}
+    logger.info("Columnar compaction finished", extra=dict(summary, site=storage.store.root))
+    return summary
@@ -0,0 +1,274 @@
+"""Pre-aggregated 5-minute, hourly and daily rollups of temperature readings.
+
+Rollups are upserted in the same transaction as the raw readings at ingest
+time, so statistics and long-range history can be served from a few hundred
+bucket rows instead of scanning every raw reading in the window.
+"""
+from datetime import datetime, timedelta
+from sqlalchemy import DateTime, and_, bindparam, func, text
+from sqlalchemy.dialects.sqlite import insert
+from app import db
+from app.migrations import column_names
+from app.models import ReadingRollup, TemperatureReading, WeatherObservation
+from app.sites import current_site_id
+
+FIVE_MINUTES = 300
+HOUR = 3600
+DAY = 86400
+RESOLUTIONS = (FIVE_MINUTES, HOUR, DAY)
+RESOLUTION_NAMES = {'5min': FIVE_MINUTES, 'hour': HOUR, 'day': DAY}
+
+# Auto-selected history keeps at least this many buckets per device
+MIN_HISTORY_POINTS = 150
+
+EPOCH = datetime(1970, 1, 1)
+
+SUM_COLUMNS = (
+    'count', 'temperature_sum', 'humidity_count', 'humidity_sum', 'outside_count',
+    'outside_sum', 'target_count', 'target_sum', 'heating_count', 'cooling_count'
+)
+MIN_COLUMNS = ('temperature_min', 'humidity_min', 'outside_min')
+MAX_COLUMNS = ('temperature_max', 'humidity_max', 'outside_max')
+
+
+def bucket_floor(timestamp, resolution):
+    seconds = int((timestamp - EPOCH).total_seconds())
+    return EPOCH + timedelta(seconds=seconds - seconds % resolution)
+
+
+def bucket_ceil(timestamp, resolution):
+    floor = bucket_floor(timestamp, resolution)
+    return floor if floor == timestamp else floor + timedelta(seconds=resolution)
+
+
+def _contribution(row):
+    """A single reading row expressed as a one-sample rollup row"""
+    def present(value):
+        return 1 if value is not None else 0
+
+    temperature = row['temperature_c']
+    humidity = row.get('humidity')
+    outside = row.get('outside_temperature_c')
+    target = row.get('target_temperature_c')
+    return {
+        'site_id': row['site_id'],
+        'device_name': row['device_name'],
+        'count': 1,
+        'temperature_sum': temperature,
+        'temperature_min': temperature,
+        'temperature_max': temperature,
+        'humidity_count': present(humidity),
+        'humidity_sum': humidity,
+        'humidity_min': humidity,
+        'humidity_max': humidity,
+        'outside_count': present(outside),
+        'outside_sum': outside,
+        'outside_min': outside,
+        'outside_max': outside,
+        'target_count': present(target),
+        'target_sum': target,
+        'heating_count': 1 if row.get('hvac_state') == 'HEATING' else 0,
+        'cooling_count': 1 if row.get('hvac_state') == 'COOLING' else 0,
+    }
+
+
+def _upsert_statement():
+    table = ReadingRollup.__table__
+    stmt = insert(table)
+    excluded = stmt.excluded
+    updates = {}
+    for name in SUM_COLUMNS:
+        updates[name] = func.coalesce(table.c[name], 0) + func.coalesce(excluded[name], 0)
+    # Scalar MIN/MAX return NULL if either side is NULL, so coalesce both ways
+    for name in MIN_COLUMNS:
+        updates[name] = func.min(
+            func.coalesce(table.c[name], excluded[name]), func.coalesce(excluded[name], table.c[name])
+        )
+    for name in MAX_COLUMNS:
+        updates[name] = func.max(
+            func.coalesce(table.c[name], excluded[name]), func.coalesce(excluded[name], table.c[name])
+        )
+    return stmt.on_conflict_do_update(
+        index_elements=['resolution', 'site_id', 'device_name', 'bucket_start'],
+        set_=updates,
+    )
+
+
+def update_rollups(rows):
+    """Fold new reading rows (column dicts) into every rollup resolution.
+
+    Runs in the current session and the caller commits, so rollups and raw
+    rows land atomically.
+    """
+    rollup_rows = []
+    for row in rows:
+        contribution = _contribution(row)
+        for resolution in RESOLUTIONS:
+            rollup_rows.append(dict(
+                contribution,
+                resolution=resolution,
+                bucket_start=bucket_floor(row['timestamp'], resolution),
+            ))
+
+    if rollup_rows:
+        db.session.execute(_upsert_statement(), rollup_rows)
+
+
+def _outside_source(conn):
+    """FROM clause and outside temperature expression for the schema ``conn`` is at.
+
+    Migrations rebuild rollups before readings link to weather observations,
+    while the outside temperature is still a column of the readings.
+    """
+    if 'weather_observation_id' in column_names(conn, 'temperature_reading'):
+        return (
+            "temperature_reading r LEFT JOIN weather_observation w ON w.id = r.weather_observation_id",
+            "w.temperature_c",
+        )
+    return "temperature_reading r", "r.outside_temperature_c"
+
+
+def rebuild_rollups(conn, start=None, end=None):
+    """Recompute rollups from the raw readings table.
+
+    With ``start``/``end`` (which must fall on day boundaries) only buckets
+    in that range are rebuilt; otherwise every rollup is.
+    """
+    source, outside = _outside_source(conn)
+    params = {'start': start or EPOCH, 'end': end or datetime.max}
+    range_types = (bindparam('start', type_=DateTime), bindparam('end', type_=DateTime))
+    conn.execute(text(
+        "DELETE FROM reading_rollup WHERE bucket_start >= :start AND bucket_start < :end"
+    ).bindparams(*range_types), params)
+    for resolution in RESOLUTIONS:
+        conn.execute(text(
+            "INSERT INTO reading_rollup ("
+            "resolution, bucket_start, site_id, device_name, count, temperature_sum, temperature_min, "
+            "temperature_max, humidity_count, humidity_sum, humidity_min, humidity_max, "
+            "outside_count, outside_sum, outside_min, outside_max, target_count, target_sum, "
+            "heating_count, cooling_count) "
+            "SELECT :resolution, "
+            "strftime('%Y-%m-%d %H:%M:%S', "
+            "(CAST(strftime('%s', r.timestamp) AS INTEGER) / :resolution) * :resolution, 'unixepoch') "
+            "|| '.000000' AS bucket, "
+            "r.site_id, r.device_name, COUNT(*), SUM(r.temperature_c), MIN(r.temperature_c), MAX(r.temperature_c), "
+            "COUNT(r.humidity), SUM(r.humidity), MIN(r.humidity), MAX(r.humidity), "
+            f"COUNT({outside}), SUM({outside}), MIN({outside}), MAX({outside}), "
+            "COUNT(r.target_temperature_c), SUM(r.target_temperature_c), "
+            "SUM(CASE WHEN r.hvac_state = 'HEATING' THEN 1 ELSE 0 END), "
+            "SUM(CASE WHEN r.hvac_state = 'COOLING' THEN 1 ELSE 0 END) "
+            f"FROM {source} WHERE r.timestamp >= :start AND r.timestamp < :end "
+            "GROUP BY r.site_id, r.device_name, bucket"
+        ).bindparams(*range_types), dict(params, resolution=resolution))
+
+
+class _Totals:
+    def __init__(self):
+        self.values = {name: 0 for name in ('count', 'temperature_sum', 'humidity_count',
+                                             'humidity_sum', 'outside_count', 'outside_sum')}
+        self.values.update({name: None for name in MIN_COLUMNS + MAX_COLUMNS})
+
+    def add(self, row):
+        for name, value in row._mapping.items():
+            if value is None:
+                continue
+            current = self.values[name]
+            if name in MIN_COLUMNS:
+                self.values[name] = value if current is None else min(current, value)
+            elif name in MAX_COLUMNS:
+                self.values[name] = value if current is None else max(current, value)
+            else:
+                self.values[name] = current + value
+
+    def average(self, sum_name, count_name):
+        count = self.values[count_name]
+        return self.values[sum_name] / count if count else None
+
+
+def _rollup_totals(resolution, start, end):
+    r = ReadingRollup
+    conditions = [r.site_id == current_site_id(), r.resolution == resolution, r.bucket_start >= start]
+    if end is not None:
+        conditions.append(r.bucket_start < end)
+    return db.session.query(
+        func.sum(r.count).label('count'),
+        func.sum(r.temperature_sum).label('temperature_sum'),
+        func.min(r.temperature_min).label('temperature_min'),
+        func.max(r.temperature_max).label('temperature_max'),
+        func.sum(r.humidity_count).label('humidity_count'),
+        func.sum(r.humidity_sum).label('humidity_sum'),
+        func.sum(r.outside_count).label('outside_count'),
+        func.sum(r.outside_sum).label('outside_sum'),
+        func.min(r.outside_min).label('outside_min'),
+        func.max(r.outside_max).label('outside_max'),
+    ).filter(and_(*conditions)).first()
+
+
+def _raw_totals(start, end):
+    t = TemperatureReading
+    w = WeatherObservation
+    return db.session.query(
+        func.count(t.id).label('count'),
+        func.sum(t.temperature_c).label('temperature_sum'),
+        func.min(t.temperature_c).label('temperature_min'),
+        func.max(t.temperature_c).label('temperature_max'),
+        func.count(t.humidity).label('humidity_count'),
+        func.sum(t.humidity).label('humidity_sum'),
+        func.count(w.temperature_c).label('outside_count'),
+        func.sum(w.temperature_c).label('outside_sum'),
+        func.min(w.temperature_c).label('outside_min'),
+        func.max(w.temperature_c).label('outside_max'),
+    ).select_from(t).outerjoin(
+        w, t.weather_observation_id == w.id
+    ).filter(
+        t.site_id == current_site_id(),
+        t.timestamp >= start,
+        t.timestamp < end
+    ).first()
+
+
+def window_statistics(since):
+    """Exact aggregates over every reading at or after ``since``.
+
+    The window is covered with whole daily buckets from the first day
+    boundary onwards, hourly buckets back to the first hour boundary,
+    5-minute buckets back to the first 5-minute boundary, and raw rows for
+    whatever is left before that.
+    """
+    totals = _Totals()
+    end = None
+    for resolution in sorted(RESOLUTIONS, reverse=True):
+        start = bucket_ceil(since, resolution)
+        if end is None or start < end:
+            totals.add(_rollup_totals(resolution, start, end))
+            end = start
+    if since < end:
+        totals.add(_raw_totals(since, end))
+
+    values = totals.values
+    return {
+        'avg_temp': totals.average('temperature_sum', 'count'),
+        'min_temp': values['temperature_min'],
+        'max_temp': values['temperature_max'],
+        'avg_humidity': totals.average('humidity_sum', 'humidity_count'),
+        'avg_outside_temp': totals.average('outside_sum', 'outside_count'),
+        'min_outside_temp': values['outside_min'],
+        'max_outside_temp': values['outside_max'],
+    }
+
+
+def history_resolution(hours):
+    """Coarsest rollup that still leaves MIN_HISTORY_POINTS buckets, or None for raw rows"""
+    for resolution in (DAY, HOUR):
+        if hours * 3600 / resolution >= MIN_HISTORY_POINTS:
+            return resolution
+    return None
+
+
+def rollup_history(since, resolution):
+    """Query for rollup buckets covering ``since`` onwards, ordered like raw readings"""
+    return ReadingRollup.query.filter(
+        ReadingRollup.site_id == current_site_id(),
+        ReadingRollup.resolution == resolution,
+        ReadingRollup.bucket_start >= bucket_floor(since, resolution)
+    ).order_by(ReadingRollup.bucket_start, ReadingRollup.device_name)
@@ -1,72 +1,413 @@
-from flask import Blueprint, render_template, jsonify, request
-from app.models import TemperatureReading
-from app import db
+from flask import Blueprint, Response, g, render_template, jsonify, request, stream_with_context
+from app.analytics import analytics
+from app.cache import cached_response, response_cache, current_generation
+from app.downsample import METHODS, downsample_readings, hvac_bands
+from app.export import COMPRESSIONS, EXPORT_BATCH_SIZE, EXPORT_FORMATS, export_chunks, export_type, missing_dependency
+from app.http_client import CircuitOpenError, http_client
+from app.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, registry
+from app.queries import DOWNSAMPLE_FIELDS, SHAPES, parse_fields, project_rows, shape_dicts, shape_rows, with_fields
+from app.rollups import RESOLUTION_NAMES, history_resolution, rollup_history
+from app.live import broadcaster
+from app.sites import activate_site, current_site_id, deactivate_site, sites
+from app.stats_engine import PERCENTILES, stats_engine
+from app.storage import storage
+from app.serialization import dumps, json_response
 from app.nest_client import NestClient
 from app.swagger import get_swagger_spec
 from datetime import datetime, timedelta
-from sqlalchemy import func
+from itertools import islice
+import logging
+import math
+import queue
+import requests
 
 main = Blueprint('main', __name__)
+logger = logging.getLogger(__name__)
+
+@main.before_request
+def select_site():
+    """Work on the site named by the ``site`` query parameter (default: the first site)"""
+    site_id = request.args.get('site')
+    if not site_id:
+        return None
+    if sites.get(site_id) is None:
+        return jsonify({'error': f'Unknown site: {site_id}'}), 404
+    g.site_token = activate_site(site_id)
+
+@main.teardown_request
+def release_site(exc):
+    token = g.pop('site_token', None)
+    if token is not None:
+        deactivate_site(token)
+
+# Rows fetched from the cursor and serialized per chunk when streaming
+STREAM_BATCH_SIZE = 1000
+
+def stream_records(records, ndjson):
+    """Serialize dicts one batch at a time so memory stays flat for any window"""
+    def generate():
+        separator = b'\n' if ndjson else b','
+        started = False
+        batch = []
+        if not ndjson:
+            yield b'['
+        for record in records:
+            batch.append(dumps(record))
+            if len(batch) == STREAM_BATCH_SIZE:
+                yield (separator if started else b'') + separator.join(batch)
+                started = True
+                batch = []
+        if batch:
+            yield (separator if started else b'') + separator.join(batch)
+            started = True
+        if ndjson:
+            yield b'\n' if started else b''
+        else:
+            yield b']'
+
+    mimetype = 'application/x-ndjson' if ndjson else 'application/json'
+    return Response(stream_with_context(generate()), mimetype=mimetype)
+
+# Columns that make up the X-Next-After / X-Next-Since-Id cursors
+CURSOR_FIELDS = ('id', 'timestamp')
+
+# Most rows one cursor request returns; ``next.more`` says there are more
+DELTA_PAGE_SIZE = 5000
+
+def with_bands(body, bands):
+    """Wrap a readings body with its HVAC bands when they were asked for"""
+    if bands is None:
+        return body
+    return {'readings': body, 'hvac_bands': bands}
+
+def parse_timestamp(value):
+    """Naive UTC datetime from an ISO 8601 query parameter, with or without a trailing Z"""
+    return datetime.fromisoformat(value.removesuffix('Z'))
+
+def current_cursor():
+    """(after, since_id) for everything stored so far"""
+    latest = storage.latest(('timestamp',))
+    last_id = storage.last_id() if storage.supports_ids else None
+    return (latest.timestamp if latest else None), last_id
+
+def set_cursor(response, after, since_id, resolution=None):
+    """Attach the cursor a client passes as ``after``/``since_id`` to fetch only newer rows.
+
+    ``resolution`` is the rollup bucket size the history was drawn at, so a
+    client knows to fetch its deltas as buckets too.
+    """
+    if after is not None:
+        response.headers['X-Next-After'] = after.isoformat()
+    if since_id is not None:
+        response.headers['X-Next-Since-Id'] = str(since_id)
+    if resolution is not None:
+        response.headers['X-Resolution'] = str(resolution)
+    return response
+
+def bucket_delta_response(window_start, after, resolution, fields, shape):
+    """Rollup buckets from the one holding ``after`` onwards, plus the cursor for the next call.
+
+    That bucket was still filling when the client drew it, so it comes back
+    whole for the client to replace.
+    """
+    cursor = current_cursor()
+    buckets = rollup_history(max(window_start, after), resolution).all()
+    after = cursor[0] or after
+    response = json_response({
+        'readings': shape_dicts([b.to_dict() for b in buckets], fields, shape),
+        'next': {'after': after, 'since_id': cursor[1], 'more': False},
+        'resolution': resolution,
+    })
+    return set_cursor(response, after, cursor[1], resolution)
+
+def delta_response(window_start, after, since_id, fields, shape):
+    """Rows stored after the ``after``/``since_id`` cursor, plus the cursor for the next call"""
+    columns = with_fields(fields, CURSOR_FIELDS)
+    if since_id is not None:
+        if not storage.supports_ids:
+            return jsonify({'error': f'The {storage.name} storage backend has no reading ids; use after'}), 400
+        rows = list(storage.readings_after_id(since_id, columns, since=window_start, limit=DELTA_PAGE_SIZE))
+        more = len(rows) == DELTA_PAGE_SIZE
+    else:
+        since = max(window_start, after + timedelta(microseconds=1))
+        rows = list(islice(storage.readings(since, columns), DELTA_PAGE_SIZE + 1))
+        more = len(rows) > DELTA_PAGE_SIZE
+        if more:
+            # The next page starts after the last timestamp, so don't split one
+            last = rows.pop().timestamp
+            rows = [r for r in rows if r.timestamp < last] or rows
+    
+    if rows:
+        after = max(r.timestamp for r in rows)
+        if storage.supports_ids:
+            since_id = max(since_id or 0, max(r.id for r in rows))
+    
+    response = json_response({
+        'readings': shape_rows(project_rows(rows, columns, fields), fields, shape),
+        'next': {'after': after, 'since_id': since_id, 'more': more},
+    })
+    return set_cursor(response, after, since_id)
 
 @main.route('/')
 def index():
-    return render_template('index.html')
+    return render_template('index.html', sites=list(sites), current_site=sites.current())
 
 @main.route('/api/temperatures')
+@cached_response
 def get_temperatures():
     hours = int(request.args.get('hours', 24))
     since = datetime.utcnow() - timedelta(hours=hours)
     
-    readings = TemperatureReading.query.filter(
-        TemperatureReading.timestamp >= since
-    ).order_by(TemperatureReading.timestamp).all()
+    resolution_param = request.args.get('resolution', 'auto')
+    if resolution_param == 'auto':
+        resolution = history_resolution(hours) if storage.supports_rollups else None
+    elif resolution_param == 'raw':
+        resolution = None
+    elif resolution_param in RESOLUTION_NAMES:
+        if not storage.supports_rollups:
+            return jsonify({'error': f'The {storage.name} storage backend has no rollups; use resolution=raw'}), 400
+        resolution = RESOLUTION_NAMES[resolution_param]
+    else:
+        return jsonify({'error': f'Unknown resolution: {resolution_param}'}), 400
+    
+    max_points = request.args.get('max_points', type=int)
+    if max_points is not None and max_points < 1:
+        return jsonify({'error': 'max_points must be at least 1'}), 400
+    bands = bool(request.args.get('bands', type=int))
+    method = request.args.get('method', 'lttb')
+    if method not in METHODS:
+        return jsonify({'error': f'Unknown downsampling method: {method}'}), 400
+    
+    try:
+        fields = parse_fields(request.args.get('fields'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    shape = request.args.get('shape', 'rows')
+    if shape not in SHAPES:
+        return jsonify({'error': f'Unknown shape: {shape}'}), 400
+    
+    # Cursor requests return raw rows newer than the cursor; with after and a
+    # rollup resolution, the buckets from the cursor's bucket on
+    since_id = request.args.get('since_id', type=int)
+    after = request.args.get('after')
+    if after:
+        try:
+            after = parse_timestamp(after)
+        except ValueError:
+            return jsonify({'error': f'Invalid after timestamp: {after}'}), 400
+    if after and resolution:
+        return bucket_delta_response(since, after, resolution, fields, shape)
+    if after or since_id is not None:
+        return delta_response(since, after, since_id, fields, shape)
+    
+    # Where a follow-up cursor request should start; read before the data so
+    # nothing committed in between is skipped
+    cursor = current_cursor()
+    
+    # Downsampling and bands need each device's whole series, so they always buffer
+    ndjson = request.accept_mimetypes.best_match(
+        ['application/json', 'application/x-ndjson']
+    ) == 'application/x-ndjson'
+    stream = (ndjson or request.args.get('stream', type=int)) and not (max_points or bands)
+    if stream and shape == 'columnar':
+        return jsonify({'error': 'Columnar responses cannot be streamed'}), 400
     
-    return jsonify([r.to_dict() for r in readings])
+    if resolution:
+        query = rollup_history(since, resolution)
+        # Rollup buckets carry extra keys (samples, min/max) unless fields narrows them
+        project = 'fields' in request.args or shape == 'columnar'
+        if stream:
+            records = (r.to_dict() for r in query.yield_per(STREAM_BATCH_SIZE))
+            if project:
+                records = ({f: r.get(f) for f in fields} for r in records)
+            return set_cursor(stream_records(records, ndjson), *cursor, resolution)
+        buckets = query.all()
+        runs = hvac_bands(buckets) if bands else None
+        if max_points:
+            buckets = downsample_readings(buckets, max_points, method)
+        records = [r.to_dict() for r in buckets]
+        body = shape_dicts(records, fields, shape) if project else records
+        return set_cursor(json_response(with_bands(body, runs)), *cursor, resolution)
+    
+    if stream:
+        rows = storage.readings(since, fields, yield_per=STREAM_BATCH_SIZE)
+        return set_cursor(stream_records((dict(zip(fields, row)) for row in rows), ndjson), *cursor)
+    
+    runs = None
+    if max_points or bands:
+        columns = with_fields(fields, DOWNSAMPLE_FIELDS)
+        rows = list(storage.readings(since, columns))
+        if bands:
+            runs = hvac_bands(rows)
+        if max_points:
+            rows = downsample_readings(rows, max_points, method)
+        rows = project_rows(rows, columns, fields)
+    else:
+        rows = list(storage.readings(since, fields))
+    
+    return set_cursor(json_response(with_bands(shape_rows(rows, fields, shape), runs)), *cursor)
 
 @main.route('/api/current')
+@cached_response
 def get_current():
-    latest = TemperatureReading.query.order_by(
-        TemperatureReading.timestamp.desc()
-    ).first()
+    try:
+        fields = parse_fields(request.args.get('fields'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    latest = storage.latest(fields)
     
     if latest:
-        return jsonify(latest.to_dict())
+        return json_response(dict(zip(fields, latest)))
     return jsonify({'error': 'No data available'}), 404
 
+def statistics_payload(hours):
+    """The /api/statistics body for the last ``hours`` hours"""
+    if stats_engine.tracks(hours):
+        stats = stats_engine.statistics(hours)
+    else:
+        # Only the dashboard's windows are kept in memory; percentiles need the engine
+        stats = storage.statistics(datetime.utcnow() - timedelta(hours=hours))
+    
+    payload = {
+        'avg_temperature': round(stats['avg_temp'], 1) if stats['avg_temp'] else None,
+        'min_temperature': round(stats['min_temp'], 1) if stats['min_temp'] else None,
+        'max_temperature': round(stats['max_temp'], 1) if stats['max_temp'] else None,
+        'avg_humidity': round(stats['avg_humidity'], 1) if stats['avg_humidity'] else None,
+        'avg_outside_temperature': round(stats['avg_outside_temp'], 1) if stats['avg_outside_temp'] else None,
+        'min_outside_temperature': round(stats['min_outside_temp'], 1) if stats['min_outside_temp'] else None,
+        'max_outside_temperature': round(stats['max_outside_temp'], 1) if stats['max_outside_temp'] else None,
+        'period_hours': hours
+    }
+    for p in PERCENTILES:
+        value = stats.get(f'p{p}_temp')
+        payload[f'p{p}_temperature'] = round(value, 1) if value is not None else None
+    return payload
+
 @main.route('/api/statistics')
+@cached_response
 def get_statistics():
     hours = int(request.args.get('hours', 24))
-    since = datetime.utcnow() - timedelta(hours=hours)
+    return jsonify(statistics_payload(hours))
+
+@main.route('/api/analytics')
+@cached_response
+def get_analytics():
+    hours = int(request.args.get('hours', 24))
+    return jsonify(analytics.window(hours, device=request.args.get('device') or None))
+
+@main.route('/api/export')
+def export_readings():
+    """Readings in [from, to) as a CSV, Parquet or Arrow IPC download, streamed from the cursor"""
+    fmt = request.args.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'error': f'Unknown export format: {fmt}'}), 400
+    compression = request.args.get('compression') or None
+    if compression is not None and compression not in COMPRESSIONS:
+        return jsonify({'error': f'Unknown compression: {compression}'}), 400
+    missing = missing_dependency(fmt, compression)
+    if missing:
+        return jsonify({'error': f'Export as {fmt} with compression={compression} needs the {missing} package'}), 400
     
-    stats = db.session.query(
-        func.avg(TemperatureReading.temperature_c).label('avg_temp'),
-        func.min(TemperatureReading.temperature_c).label('min_temp'),
-        func.max(TemperatureReading.temperature_c).label('max_temp'),
-        func.avg(TemperatureReading.humidity).label('avg_humidity'),
-        func.avg(TemperatureReading.outside_temperature_c).label('avg_outside_temp'),
-        func.min(TemperatureReading.outside_temperature_c).label('min_outside_temp'),
-        func.max(TemperatureReading.outside_temperature_c).label('max_outside_temp')
-    ).filter(TemperatureReading.timestamp >= since).first()
+    try:
+        fields = parse_fields(request.args.get('fields'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    return jsonify({
-        'avg_temperature': round(stats.avg_temp, 1) if stats.avg_temp else None,
-        'min_temperature': round(stats.min_temp, 1) if stats.min_temp else None,
-        'max_temperature': round(stats.max_temp, 1) if stats.max_temp else None,
-        'avg_humidity': round(stats.avg_humidity, 1) if stats.avg_humidity else None,
-        'avg_outside_temperature': round(stats.avg_outside_temp, 1) if stats.avg_outside_temp else None,
-        'min_outside_temperature': round(stats.min_outside_temp, 1) if stats.min_outside_temp else None,
-        'max_outside_temperature': round(stats.max_outside_temp, 1) if stats.max_outside_temp else None,
-        'period_hours': hours
+    now = datetime.utcnow()
+    try:
+        start = parse_timestamp(request.args['from']) if request.args.get('from') else now - timedelta(days=30)
+        end = parse_timestamp(request.args['to']) if request.args.get('to') else None
+    except ValueError:
+        return jsonify({'error': 'Invalid from/to timestamp'}), 400
+    
+    rows = storage.readings(
+        start, fields, until=end, yield_per=EXPORT_BATCH_SIZE, device=request.args.get('device') or None
+    )
+    content_type, extension = export_type(fmt, compression)
+    filename = f"readings-{start:%Y%m%d}-{end or now:%Y%m%d}.{extension}"
+    return Response(
+        stream_with_context(export_chunks(rows, fields, fmt, compression)),
+        content_type=content_type,
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'},
+    )
+
+@main.route('/api/stream')
+def stream_events():
+    """Server-Sent Events: new readings and the statistics for ``hours`` after each collection"""
+    hours = int(request.args.get('hours', 24))
+    subscription = broadcaster.subscribe(current_site_id(), hours)
+    if subscription is None:
+        response = jsonify({'error': 'Too many live streams open; poll /api/temperatures with a cursor instead'})
+        response.headers['Retry-After'] = '60'
+        return response, 503
+    keepalive = broadcaster.keepalive
+    
+    def generate():
+        try:
+            # Tell EventSource how long to wait before reconnecting
+            yield b'retry: 5000\n\n'
+            while not subscription.closed:
+                try:
+                    yield subscription.get(timeout=keepalive)
+                except queue.Empty:
+                    # Comment line so proxies don't close an idle connection
+                    yield b': keepalive\n\n'
+        finally:
+            broadcaster.unsubscribe(subscription)
+    
+    response = Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
     })
+    # Frees the slot even if the client goes away before the first event
+    response.call_on_close(lambda: broadcaster.unsubscribe(subscription))
+    return response
+
+@main.route('/api/cache/stats')
+def get_cache_stats():
+    """Response cache hit/miss counters"""
+    stats = response_cache.stats()
+    stats['generation'] = current_generation()
+    return jsonify(stats)
+
+@main.route('/api/http/stats')
+def get_http_stats():
+    """Latency histograms and retry counters per external API endpoint, and circuit breaker states"""
+    return jsonify(http_client.stats())
+
+@main.route('/api/sites')
+def get_sites():
+    """Sites served by this deployment; pass one as ``site`` to the other endpoints"""
+    return jsonify({'default': sites.default_id, 'sites': [site.to_dict() for site in sites]})
+
+@main.route('/metrics')
+def get_metrics():
+    """Prometheus metrics of this process"""
+    return Response(registry.render(), content_type=METRICS_CONTENT_TYPE)
 
 @main.route('/health')
 def health_check():
     return jsonify({'status': 'healthy', 'service': 'house-temp-tracker'}), 200
 
+@main.errorhandler(CircuitOpenError)
+def dependency_unavailable(error):
+    """An external API's circuit breaker is open: 503 until its cooldown ends"""
+    response = jsonify({'error': str(error)})
+    response.headers['Retry-After'] = str(max(1, math.ceil(error.retry_after or 0)))
+    return response, 503
+
+@main.errorhandler(requests.ConnectionError)
+@main.errorhandler(requests.Timeout)
+def dependency_unreachable(error):
+    """An external API could not be reached after retries"""
+    logger.warning("External API unreachable: %s", error)
+    return jsonify({'error': 'External API unreachable; try again later'}), 503
+
 @main.route('/api/nest/devices')
 def get_nest_devices():
     """Get all Nest devices from the API"""
-    client = NestClient()
+    client = NestClient.for_site(sites.current())
     devices = client.get_devices()
     
     if devices is None:
@@ -80,7 +421,7 @@ def get_nest_devices():
 @main.route('/api/nest/device/<path:device_id>')
 def get_nest_device_data(device_id):
     """Get specific device data from the Nest API"""
-    client = NestClient()
+    client = NestClient.for_site(sites.current())
     device_data = client.get_thermostat_data(device_id)
     
     if device_data is None:
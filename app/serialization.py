@@ -0,0 +1,12 @@
+"""Fast JSON encoding for API responses."""
+import orjson
+from flask import Response
+
+
+def dumps(payload):
+    """Encode ``payload`` to JSON bytes. Datetimes are written in ISO 8601"""
+    return orjson.dumps(payload)
+
+
+def json_response(payload, status=200):
+    return Response(dumps(payload), status=status, mimetype='application/json')
@@ -0,0 +1,167 @@
+"""Sites (homes) served by one deployment.
+
+Each site has its own Nest credentials and coordinates, and its readings
+carry its ``site_id``. Sites are listed in the JSON file named by
+``SITES_FILE``; without one there is a single ``default`` site built from
+the ``NEST_*`` and ``LOCATION_*`` variables, as before sites existed.
+
+A site with a ``database`` path is sharded into its own SQLite file, so its
+writes and queries don't contend with other homes. Sites without one share
+the main database. The site being worked on is held in a context variable:
+request handlers set it from the ``site`` query parameter and the collector
+sets it per site. ``SiteSession`` then sends every query to that site's
+database.
+"""
+import json
+import os
+from contextlib import contextmanager
+from contextvars import ContextVar
+from flask_sqlalchemy.session import Session
+
+DEFAULT_SITE_ID = 'default'
+
+_current_site = ContextVar('current_site', default=None)
+
+
+class Site:
+    def __init__(self, site_id, name=None, nest=None, location=None, weather_api_key=None, database=None):
+        self.id = site_id
+        self.name = name or site_id
+        # client_id, client_secret, project_id, refresh_token
+        self.nest = nest or {}
+        location = location or {}
+        self.lat = location.get('lat')
+        self.lon = location.get('lon')
+        self.weather_api_key = weather_api_key
+        self.database = database
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            DEFAULT_SITE_ID,
+            name=os.getenv('SITE_NAME'),
+            nest={
+                'client_id': os.getenv('NEST_CLIENT_ID'),
+                'client_secret': os.getenv('NEST_CLIENT_SECRET'),
+                'project_id': os.getenv('NEST_PROJECT_ID'),
+                'refresh_token': os.getenv('NEST_REFRESH_TOKEN'),
+            },
+            location={'lat': os.getenv('LOCATION_LAT'), 'lon': os.getenv('LOCATION_LON')},
+            weather_api_key=os.getenv('OPENWEATHER_API_KEY'),
+        )
+
+    @classmethod
+    def from_config(cls, config, basedir):
+        """A site from one entry of the sites file; string values may reference ${ENV_VARS}"""
+        def expand(value):
+            if isinstance(value, dict):
+                return {k: expand(v) for k, v in value.items()}
+            return os.path.expandvars(value) if isinstance(value, str) else value
+
+        config = expand(config)
+        database = config.get('database')
+        if database and not os.path.isabs(database):
+            database = os.path.join(basedir, database)
+        return cls(
+            config['id'],
+            name=config.get('name'),
+            nest=config.get('nest'),
+            location=config.get('location'),
+            weather_api_key=config.get('weather_api_key', os.getenv('OPENWEATHER_API_KEY')),
+            database=database,
+        )
+
+    @property
+    def shard(self):
+        """SQLALCHEMY_BINDS key of the site's own database, or None for the main one"""
+        return f'shard:{self.database}' if self.database else None
+
+    def to_dict(self):
+        return {'id': self.id, 'name': self.name, 'sharded': self.database is not None}
+
+
+class SiteRegistry:
+    def __init__(self):
+        self.sites = {DEFAULT_SITE_ID: Site(DEFAULT_SITE_ID)}
+        self.default_id = DEFAULT_SITE_ID
+
+    def init_app(self, app):
+        """Load the sites and register a bind per shard; call before ``db.init_app``"""
+        path = app.config.get('SITES_FILE')
+        if path:
+            with open(path) as f:
+                entries = json.load(f)['sites']
+            basedir = os.path.dirname(os.path.abspath(path))
+            loaded = [Site.from_config(entry, basedir) for entry in entries]
+            if not loaded:
+                raise ValueError(f"No sites defined in {path}")
+        else:
+            loaded = [Site.from_env()]
+        self.sites = {site.id: site for site in loaded}
+        self.default_id = loaded[0].id
+
+        binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+        for site in loaded:
+            if site.database:
+                os.makedirs(os.path.dirname(site.database), exist_ok=True)
+                binds[site.shard] = f'sqlite:///{site.database}'
+        app.config['SQLALCHEMY_BINDS'] = binds
+
+    def get(self, site_id):
+        return self.sites.get(site_id)
+
+    def __iter__(self):
+        return iter(self.sites.values())
+
+    def current(self):
+        return self.sites.get(current_site_id()) or self.sites[self.default_id]
+
+    def shards(self):
+        """One site per distinct database, for jobs that work on whole databases"""
+        seen = {}
+        for site in self:
+            seen.setdefault(site.shard, site)
+        return list(seen.values())
+
+
+sites = SiteRegistry()
+
+
+def current_site_id():
+    return _current_site.get() or sites.default_id
+
+
+def activate_site(site_id):
+    """Make ``site_id`` current; returns a token for ``deactivate_site``"""
+    return _current_site.set(site_id)
+
+
+def deactivate_site(token):
+    _current_site.reset(token)
+
+
+@contextmanager
+def use_site(site_id):
+    token = activate_site(site_id)
+    try:
+        yield sites.get(site_id)
+    finally:
+        deactivate_site(token)
+
+
+def site_engine():
+    """Engine of the current site's database"""
+    from app import db
+
+    shard = sites.current().shard
+    return db.engines[shard] if shard else db.engine
+
+
+class SiteSession(Session):
+    """Session that runs every statement against the current site's database"""
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None:
+            shard = sites.current().shard
+            if shard:
+                return self._db.engines[shard]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
@@ -0,0 +1,311 @@
+"""Write-ahead spool for collected readings.
+
+The collector appends each site's collection batch to an append-only NDJSON
+file and fsyncs it before the cycle counts as done. A replayer thread then
+drains the spool into storage in bulk. A locked or failing database only
+delays readings instead of losing them, and collection never waits on the
+write lock.
+
+The spool is a directory of numbered segments (``<seq>.ndjson``), by
+default next to the database (``SPOOL_PATH``, ``<database>-spool``). Only
+collecting processes set it up (``create_app(use_spool=True)``).
+Appends go to the newest segment, and appends that overlap share one
+fsync. The replayer seals the newest segment, replays the sealed ones
+oldest first, and deletes each once all of its batches are committed.
+Replay is idempotent: readings whose (device, timestamp) the site already
+has are skipped, along with the weather observation of a batch that has
+nothing left to store, so a crash between the commit and the delete only
+means the segment is replayed again. A line torn by a crash mid-append is
+skipped.
+"""
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+from sqlalchemy.engine import make_url
+from app import db
+from app.cache import bump_generation
+from app.metrics import phase_duration
+from app.sites import use_site
+from app.storage import storage
+from app.weather import store_observation
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_SUFFIX = '.ndjson'
+
+# Fields of a spooled batch that hold datetimes
+READING_TIMESTAMPS = ('timestamp',)
+WEATHER_TIMESTAMPS = ('observed_at', 'fetched_at')
+
+
+def default_spool_path(database_uri):
+    """``<database file>-spool`` for a SQLite file database, else None (no spool)"""
+    url = make_url(database_uri)
+    if url.get_backend_name() != 'sqlite' or not url.database or url.database == ':memory:':
+        return None
+    return f'{url.database}-spool'
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Cannot spool {type(value).__name__}")
+
+
+def _parse_times(record, names):
+    for name in names:
+        if record.get(name) is not None:
+            record[name] = datetime.fromisoformat(record[name])
+    return record
+
+
+def _ends_with_newline(path):
+    with open(path, 'rb') as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b'\n'
+
+
+def decode_batch(line):
+    batch = json.loads(line)
+    batch['readings'] = [_parse_times(r, READING_TIMESTAMPS) for r in batch['readings']]
+    if batch.get('weather'):
+        _parse_times(batch['weather'], WEATHER_TIMESTAMPS)
+    if batch.get('location'):
+        batch['location'] = tuple(batch['location'])
+    return batch
+
+
+def store_batches(batches):
+    """Store spooled batches for the current site, skipping readings it already has.
+
+    Returns the number of readings written; the caller commits.
+    """
+    rows = {}
+    for index, batch in enumerate(batches):
+        for reading in batch['readings']:
+            rows[(reading['device_name'], reading['timestamp'])] = (index, reading)
+    existing = storage.existing_keys([reading for _, reading in rows.values()])
+
+    # Only batches with something left to write get their observation stored
+    observations = {}
+    new_rows = []
+    for key, (index, reading) in rows.items():
+        if key in existing:
+            continue
+        if index not in observations:
+            batch = batches[index]
+            weather = batch.get('weather')
+            observations[index] = store_observation(batch.get('location'), weather) if weather else None
+        new_rows.append(dict(reading, weather_observation_id=observations[index]))
+    storage.write(new_rows)
+    return len(new_rows)
+
+
+class ReadingSpool:
+    def __init__(self, path=None):
+        self.path = path
+        self.lock = threading.Lock()
+        self.sync_lock = threading.Lock()
+        self.file = None
+        # Appends written and appends known to be on disk, for sharing fsyncs
+        self.written = 0
+        self.synced = 0
+
+    def init_app(self, app):
+        self.path = app.config.get('SPOOL_PATH') or None
+        if self.path:
+            os.makedirs(self.path, exist_ok=True)
+
+    @property
+    def enabled(self):
+        return self.path is not None
+
+    # Segments
+
+    def segments(self):
+        """Segment paths, oldest first"""
+        names = sorted(n for n in os.listdir(self.path) if n.endswith(SEGMENT_SUFFIX))
+        return [os.path.join(self.path, n) for n in names]
+
+    def _new_segment(self, after=None):
+        sequence = int(os.path.basename(after)[:-len(SEGMENT_SUFFIX)]) + 1 if after else 1
+        path = os.path.join(self.path, f'{sequence:012d}{SEGMENT_SUFFIX}')
+        open(path, 'a').close()
+        # Make the new directory entry durable too
+        fd = os.open(self.path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        return path
+
+    @contextmanager
+    def _file_lock(self, name, blocking=True):
+        """Lock shared with other processes using the spool; yields whether it was acquired"""
+        with open(os.path.join(self.path, name), 'a') as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _active_file(self):
+        """Open file of the newest segment, switching to it if the replayer has sealed ours"""
+        segments = self.segments()
+        newest = segments[-1] if segments else self._new_segment()
+        if self.file is None or self.file.name != newest:
+            self._close()
+            self.file = open(newest, 'ab')
+            # End a record torn by a crash so it doesn't swallow the next one
+            if self.file.tell() and not _ends_with_newline(newest):
+                self.file.write(b'\n')
+        return self.file
+
+    def _close(self):
+        if self.file is not None:
+            with self.sync_lock:
+                self.file.flush()
+                os.fsync(self.file.fileno())
+                self.synced = self.written
+            self.file.close()
+            self.file = None
+
+    # Writing
+
+    def append(self, site_id, readings, weather=None, location=None):
+        """Durably record one collection batch for ``site_id``"""
+        line = json.dumps(
+            {'site_id': site_id, 'readings': readings, 'weather': weather, 'location': location},
+            default=_encode, separators=(',', ':'),
+        ).encode() + b'\n'
+        with self.lock, self._file_lock('.lock'):
+            f = self._active_file()
+            f.write(line)
+            f.flush()
+            self.written += 1
+            ticket = self.written
+        # Whoever syncs first covers every append written before it
+        with self.sync_lock:
+            if self.synced < ticket:
+                target = self.written
+                os.fsync(f.fileno())
+                self.synced = target
+
+    def seal(self):
+        """Start a new segment if the newest has data; returns the sealed segments, oldest first"""
+        with self.lock, self._file_lock('.lock'):
+            segments = self.segments()
+            if segments and os.path.getsize(segments[-1]):
+                self._close()
+                self._new_segment(after=segments[-1])
+                return segments
+            return segments[:-1]
+
+    # Replay
+
+    def read_segment(self, path):
+        with open(path, 'rb') as f:
+            for number, line in enumerate(f, 1):
+                try:
+                    batch = decode_batch(line)
+                except ValueError:
+                    logger.warning("Skipping torn spool record", extra={'segment': path, 'line': number})
+                    continue
+                yield batch
+
+    def replay(self):
+        """Store every sealed batch and delete replayed segments; returns readings stored.
+
+        Needs an app context. Stops at the first segment that can't be
+        stored, leaving it and the ones after it for the next attempt.
+        """
+        with self._file_lock('.replay.lock', blocking=False) as acquired:
+            if not acquired:
+                return 0
+            stored = 0
+            for path in self.seal():
+                by_site = defaultdict(list)
+                for batch in self.read_segment(path):
+                    by_site[batch['site_id']].append(batch)
+                for site_id, batches in by_site.items():
+                    with use_site(site_id):
+                        try:
+                            written = store_batches(batches)
+                            if written:
+                                bump_generation()
+                            db.session.commit()
+                        except Exception:
+                            db.session.rollback()
+                            raise
+                        stored += written
+                os.remove(path)
+            return stored
+
+    def pending(self):
+        """Segments and bytes waiting to be replayed, including the active segment"""
+        segments = self.segments()
+        return {'segments': len(segments), 'bytes': sum(os.path.getsize(p) for p in segments)}
+
+
+class SpoolReplayer:
+    """Background thread that drains the spool after each append and every ``interval`` seconds"""
+    def __init__(self, spool, interval=5):
+        self.spool = spool
+        self.interval = interval
+        self.app = None
+        self.thread = None
+        self.wakeup = threading.Event()
+        self.stopped = threading.Event()
+
+    def init_app(self, app):
+        self.app = app
+        self.interval = app.config.get('SPOOL_REPLAY_SECONDS', self.interval)
+
+    def start(self):
+        if self.spool.enabled and (self.thread is None or not self.thread.is_alive()):
+            self.stopped.clear()
+            self.thread = threading.Thread(target=self.run, name='spool-replayer', daemon=True)
+            self.thread.start()
+
+    def notify(self):
+        self.wakeup.set()
+
+    def stop(self):
+        self.stopped.set()
+        self.wakeup.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def run(self):
+        # Drain whatever an earlier process left behind before waiting
+        while not self.stopped.is_set():
+            self.wakeup.clear()
+            self.drain()
+            self.wakeup.wait(self.interval)
+
+    def drain(self):
+        started = time.perf_counter()
+        try:
+            with self.app.app_context(), phase_duration.time(phase='replay'):
+                stored = self.spool.replay()
+        except Exception as e:
+            logger.warning("Spool replay failed, retrying in %ss: %s", self.interval, e)
+            return None
+        if stored:
+            logger.info("Replayed spooled readings",
+                        extra={'readings': stored, 'seconds': round(time.perf_counter() - started, 3)})
+        return stored
+
+
+spool = ReadingSpool()
+spool_replayer = SpoolReplayer(spool)
@@ -0,0 +1,373 @@
+"""In-memory sliding-window statistics for the dashboard's time ranges.
+
+For every device the engine keeps the readings of the longest window with
+running totals for the averages and monotonic deques for min/max; every
+shorter window reads the same deques from its start, so a statistics
+request costs O(devices * log readings) however many readings the window
+holds. Temperature
+percentiles come from t-digests kept per time bucket (``DIGEST_BUCKETS``
+per window): buckets that leave the window are dropped and the rest are
+merged, so percentiles may include up to one bucket of readings from just
+before the window start. The merged percentiles are reused until a reading
+arrives or a bucket expires.
+
+The engine keeps this per site. Each site is warmed from storage once per
+web process (``wsgi.py``, or on its first request) and catches up with
+new readings whenever the data generation changes. A change that brings no
+new readings (e.g. compaction) only forces a re-warm if it deleted readings
+the engine holds. Windows other than
+``WINDOWS`` are not tracked; callers fall back to the storage backend.
+"""
+import threading
+from bisect import bisect_left
+from collections import deque
+from datetime import datetime, timedelta
+from operator import itemgetter
+import numpy as np
+from app.cache import current_generation
+from app.sites import current_site_id, sites, use_site
+from app.storage import storage
+
+# Hours, matching the dashboard's range buttons
+WINDOWS = (6, 12, 24, 48, 168)
+
+# Percentile sketch granularity: each window keeps this many digest buckets
+DIGEST_BUCKETS = 48
+
+PERCENTILES = (5, 95)
+
+ENGINE_FIELDS = ('id', 'timestamp', 'device_name', 'temperature_c', 'humidity', 'outside_temperature_c')
+
+
+class TDigest:
+    """Merging t-digest (Dunning) for approximate quantiles of a stream"""
+    def __init__(self, compression=100):
+        self.compression = compression
+        self.means = np.empty(0)
+        self.weights = np.empty(0)
+        self.buffer = []
+        self.min = None
+        self.max = None
+
+    @property
+    def count(self):
+        return float(self.weights.sum()) + len(self.buffer)
+
+    def add(self, value):
+        self.buffer.append(value)
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        if len(self.buffer) >= 5 * self.compression:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            self.means, self.weights = self._compress(
+                np.concatenate((self.means, self.buffer)),
+                np.concatenate((self.weights, np.ones(len(self.buffer)))),
+            )
+            self.buffer = []
+
+    def _compress(self, means, weights):
+        order = np.argsort(means, kind='stable')
+        means, weights = means[order], weights[order]
+        total = weights.sum()
+        merged_means, merged_weights = [means[0]], [weights[0]]
+        below = 0.0
+        for mean, weight in zip(means[1:], weights[1:]):
+            proposed = merged_weights[-1] + weight
+            q = (below + proposed / 2) / total
+            # Centroids near the tails stay small so extreme quantiles stay accurate
+            if proposed <= max(1.0, 4 * total * q * (1 - q) / self.compression):
+                merged_means[-1] += (mean - merged_means[-1]) * weight / proposed
+                merged_weights[-1] = proposed
+            else:
+                below += merged_weights[-1]
+                merged_means.append(mean)
+                merged_weights.append(weight)
+        return np.array(merged_means), np.array(merged_weights)
+
+    @classmethod
+    def merge(cls, digests, compression=100):
+        merged = cls(compression)
+        parts = [d for d in digests if d.count]
+        if not parts:
+            return merged
+        for digest in parts:
+            digest.flush()
+        merged.means, merged.weights = merged._compress(
+            np.concatenate([d.means for d in parts]), np.concatenate([d.weights for d in parts])
+        )
+        merged.min = min(d.min for d in parts)
+        merged.max = max(d.max for d in parts)
+        return merged
+
+    def quantile(self, q):
+        self.flush()
+        if not len(self.weights):
+            return None
+        if len(self.weights) == 1:
+            return float(self.means[0])
+        # Each centroid's mean sits at the middle of its weight
+        positions = np.cumsum(self.weights) - self.weights / 2
+        xs = np.concatenate(([0.0], positions, [self.weights.sum()]))
+        ys = np.concatenate(([self.min], self.means, [self.max]))
+        return float(np.interp(q * self.weights.sum(), xs, ys))
+
+
+class SlidingSeries:
+    """Count, sum, min and max of one field over any trailing window.
+
+    The values cover the longest window and are shared by the shorter ones.
+    Each entry carries the running total up to and including it, so a
+    window's count and sum come from a binary search on its start. The
+    min/max candidates of a shorter window are a suffix of the longest
+    window's monotonic deques, found the same way.
+    """
+    def __init__(self):
+        self.values = deque()  # (timestamp, value, running total), oldest first
+        # Increasing / decreasing values, so a window's min/max is its first candidate
+        self.mins = deque()
+        self.maxes = deque()
+
+    def add(self, timestamp, value):
+        if value is None:
+            return
+        # Restarting from zero when empty keeps floating point residue out of the next window
+        total = (self.values[-1][2] if self.values else 0.0) + value
+        self.values.append((timestamp, value, total))
+        while self.mins and self.mins[-1][1] >= value:
+            self.mins.pop()
+        self.mins.append((timestamp, value))
+        while self.maxes and self.maxes[-1][1] <= value:
+            self.maxes.pop()
+        self.maxes.append((timestamp, value))
+
+    def evict(self, start):
+        """Drop values older than ``start``"""
+        for values in (self.values, self.mins, self.maxes):
+            while values and values[0][0] < start:
+                values.popleft()
+
+    def window(self, start):
+        """(count, sum, min, max) of the values at or after ``start``"""
+        values = self.values
+        first = bisect_left(values, start, key=itemgetter(0))
+        if first == len(values):
+            return 0, 0.0, None, None
+        _, value, total = values[first]
+        lowest = self.mins[bisect_left(self.mins, start, key=itemgetter(0))][1]
+        highest = self.maxes[bisect_left(self.maxes, start, key=itemgetter(0))][1]
+        return len(values) - first, values[-1][2] - (total - value), lowest, highest
+
+
+class DeviceWindows:
+    """One device's readings over the longest window, with a digest series per window"""
+    def __init__(self, windows):
+        self.span = timedelta(hours=max(windows))
+        self.temperature = SlidingSeries()
+        self.humidity = SlidingSeries()
+        self.outside = SlidingSeries()
+        self.buckets = {hours: timedelta(hours=hours) / DIGEST_BUCKETS for hours in windows}
+        self.digests = {hours: deque() for hours in windows}  # (bucket start, TDigest of temperatures)
+
+    def add(self, reading):
+        timestamp = reading.timestamp
+        self.temperature.add(timestamp, reading.temperature_c)
+        self.humidity.add(timestamp, reading.humidity)
+        self.outside.add(timestamp, reading.outside_temperature_c)
+        if reading.temperature_c is not None:
+            for hours, bucket in self.buckets.items():
+                digests = self.digests[hours]
+                start = datetime.min + (timestamp - datetime.min) // bucket * bucket
+                if not digests or digests[-1][0] != start:
+                    digests.append((start, TDigest()))
+                digests[-1][1].add(reading.temperature_c)
+
+    @property
+    def oldest(self):
+        # Every reading has a temperature
+        values = self.temperature.values
+        return values[0][0] if values else None
+
+    def evict(self, now):
+        start = now - self.span
+        for series in (self.temperature, self.humidity, self.outside):
+            series.evict(start)
+        for hours, bucket in self.buckets.items():
+            digests = self.digests[hours]
+            start = now - timedelta(hours=hours)
+            while digests and digests[0][0] + bucket <= start:
+                digests.popleft()
+
+
+class SiteStatistics:
+    """Windows for every device of one site"""
+    def __init__(self, windows=WINDOWS):
+        self.windows = windows
+        self.lock = threading.RLock()
+        self.devices = {}  # device name -> DeviceWindows
+        self.newest = {}  # device name -> newest timestamp added
+        self.generation = None
+        self.last_id = None
+        self.last_timestamp = None
+        self.stale = True
+        # Bumped whenever readings are added, to invalidate cached percentiles
+        self.version = 0
+        self.percentiles = {}  # hours -> (cache key, {p: value})
+
+    def reset(self):
+        self.devices = {}
+        self.newest = {}
+        self.last_id = None
+        self.last_timestamp = None
+
+    def warm(self, now=None):
+        """Rebuild every window from the readings in storage"""
+        now = now or datetime.utcnow()
+        with self.lock:
+            self.reset()
+            self.generation = current_generation()
+            self.stale = False
+            self.add_rows(storage.readings(now - timedelta(hours=max(self.windows)), ENGINE_FIELDS))
+
+    def sync(self, now=None):
+        """Fold in readings stored since the last call, if the data generation moved"""
+        with self.lock:
+            if self.stale:
+                return self.warm(now)
+            generation = current_generation()
+            if generation == self.generation:
+                return
+            self.generation = generation
+            if storage.supports_ids and self.last_id is not None:
+                rows = storage.readings_after_id(self.last_id, ENGINE_FIELDS)
+            elif self.last_timestamp is not None:
+                # Without ids, late readings are only noticed when a write brings nothing newer
+                rows = storage.readings(self.last_timestamp + timedelta(microseconds=1), ENGINE_FIELDS)
+            else:
+                return self.warm(now)
+            added = self.add_rows(rows)
+            # A late reading can't be slotted into the deques; start over
+            if self.stale or (not added and not self.intact(now)):
+                self.warm(now)
+
+    def intact(self, now):
+        """Whether every reading held for the windows is still in storage.
+
+        Readings are never rewritten in place and retention deletes the oldest
+        first, so the oldest reading held still being stored means none of
+        the others was deleted. Without ids a write that brought nothing newer
+        may have been late readings, which only a re-warm picks up.
+        """
+        if not storage.supports_ids:
+            return False
+        now = now or datetime.utcnow()
+        for device in self.devices.values():
+            device.evict(now)
+        oldest = min((d.oldest for d in self.devices.values() if d.oldest is not None), default=None)
+        if oldest is None:
+            return True
+        rows = storage.readings(oldest, ('id',), until=oldest + timedelta(microseconds=1))
+        return next(iter(rows), None) is not None
+
+    def add_rows(self, rows):
+        """Add readings in timestamp order; returns how many were seen"""
+        self.version += 1
+        count = 0
+        for count, row in enumerate(rows, 1):
+            if row.id is not None:
+                self.last_id = row.id if self.last_id is None else max(self.last_id, row.id)
+            newest = self.newest.get(row.device_name)
+            if newest is not None and row.timestamp < newest:
+                self.stale = True
+                continue
+            self.newest[row.device_name] = row.timestamp
+            if self.last_timestamp is None or row.timestamp > self.last_timestamp:
+                self.last_timestamp = row.timestamp
+            device = self.devices.get(row.device_name)
+            if device is None:
+                device = self.devices[row.device_name] = DeviceWindows(self.windows)
+            device.add(row)
+        return count
+
+    def statistics(self, hours, now=None):
+        """``window_statistics`` keys plus temperature percentiles, for a tracked window"""
+        if hours not in self.windows:
+            raise KeyError(f"Window of {hours}h is not tracked")
+        now = now or datetime.utcnow()
+        with self.lock:
+            self.sync(now)
+            devices = list(self.devices.values())
+            for device in devices:
+                device.evict(now)
+            start = now - timedelta(hours=hours)
+
+            def combine(name):
+                parts = [getattr(d, name).window(start) for d in devices]
+                count = sum(p[0] for p in parts)
+                mins = [p[2] for p in parts if p[2] is not None]
+                maxes = [p[3] for p in parts if p[3] is not None]
+                return (
+                    sum(p[1] for p in parts) / count if count else None,
+                    min(mins) if mins else None,
+                    max(maxes) if maxes else None,
+                )
+
+            avg_temp, min_temp, max_temp = combine('temperature')
+            avg_humidity, _, _ = combine('humidity')
+            avg_outside, min_outside, max_outside = combine('outside')
+            # Digests only ever leave from the front, so the lengths identify the buckets
+            key = (self.version, tuple(len(d.digests[hours]) for d in devices))
+            cached = self.percentiles.get(hours)
+            if cached is None or cached[0] != key:
+                digest = TDigest.merge(digest for d in devices for _, digest in d.digests[hours])
+                cached = self.percentiles[hours] = (key, {p: digest.quantile(p / 100) for p in PERCENTILES})
+            percentiles = cached[1]
+
+        stats = {
+            'avg_temp': avg_temp,
+            'min_temp': min_temp,
+            'max_temp': max_temp,
+            'avg_humidity': avg_humidity,
+            'avg_outside_temp': avg_outside,
+            'min_outside_temp': min_outside,
+            'max_outside_temp': max_outside,
+        }
+        for p, value in percentiles.items():
+            stats[f'p{p}_temp'] = value
+        return stats
+
+
+class StatisticsEngine:
+    """Per-site statistics; calls work on the current site (``app.sites``)"""
+    def __init__(self, windows=WINDOWS):
+        self.windows = windows
+        self.enabled = True
+        self.sites = {}
+        self.lock = threading.Lock()
+
+    def init_app(self, app):
+        self.enabled = app.config.get('STATS_ENGINE', self.enabled)
+
+    def tracks(self, hours):
+        return self.enabled and hours in self.windows
+
+    def for_site(self, site_id):
+        with self.lock:
+            engine = self.sites.get(site_id)
+            if engine is None:
+                engine = self.sites[site_id] = SiteStatistics(self.windows)
+            return engine
+
+    def warm(self, now=None):
+        """Warm every site's windows"""
+        for site in sites:
+            with use_site(site.id):
+                self.for_site(site.id).warm(now)
+
+    def statistics(self, hours, now=None):
+        return self.for_site(current_site_id()).statistics(hours, now)
+
+
+stats_engine = StatisticsEngine()
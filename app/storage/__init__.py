@@ -0,0 +1,95 @@
+"""Pluggable storage for temperature readings.
+
+``STORAGE_BACKEND`` picks the backend: ``sql`` (default) keeps readings in
+the SQLAlchemy ``temperature_reading`` table with rollups; ``columnar``
+keeps per-device, per-day NumPy arrays under ``COLUMNAR_STORAGE_PATH``.
+The database is still used for the schema version and cache generation
+with either backend.
+
+Every call works on the current site (``app.sites``). The SQL store gets
+there through the session's routing; columnar sites other than the default
+one keep their arrays under ``sites/<site id>`` in the storage path.
+"""
+import os
+from app.metrics import count_rows, storage_rows
+from app.storage.base import ReadingStore
+from app.storage.columnar import ColumnarStore
+from app.storage.sql import SqlStore
+from app.sites import DEFAULT_SITE_ID, current_site_id
+
+BACKENDS = ('sql', 'columnar')
+
+
+def create_store(backend, columnar_path=None):
+    if backend == 'sql':
+        return SqlStore()
+    if backend == 'columnar':
+        return ColumnarStore(columnar_path)
+    raise ValueError(f"Unknown storage backend: {backend} (expected one of {', '.join(BACKENDS)})")
+
+
+class Storage:
+    """Forwards to the current site's store of the backend configured for the app"""
+    def __init__(self):
+        self.backend = 'sql'
+        self.columnar_path = None
+        self.stores = {}
+
+    def init_app(self, app):
+        self.backend = app.config['STORAGE_BACKEND']
+        self.columnar_path = app.config['COLUMNAR_STORAGE_PATH']
+        self.stores = {}
+        create_store(self.backend, self.columnar_path)  # Fail at startup on an unknown backend
+
+    @property
+    def store(self):
+        site_id = current_site_id()
+        store = self.stores.get(site_id)
+        if store is None:
+            path = self.columnar_path
+            if path and site_id != DEFAULT_SITE_ID:
+                path = os.path.join(path, 'sites', site_id)
+            store = self.stores.setdefault(site_id, create_store(self.backend, path))
+        return store
+
+    @property
+    def name(self):
+        return self.store.name
+
+    @property
+    def supports_rollups(self):
+        return self.store.supports_rollups
+
+    @property
+    def supports_ids(self):
+        return self.store.supports_ids
+
+    def write(self, rows):
+        result = self.store.write(rows)
+        storage_rows.inc(len(rows), backend=self.backend, operation='write')
+        return result
+
+    def readings(self, since, columns, until=None, yield_per=None, device=None):
+        rows = self.store.readings(since, columns, until=until, yield_per=yield_per, device=device)
+        return count_rows(rows, self.backend, 'read')
+
+    def existing_keys(self, rows):
+        return self.store.existing_keys(rows)
+
+    def readings_after_id(self, since_id, columns, since=None, limit=None):
+        rows = self.store.readings_after_id(since_id, columns, since=since, limit=limit)
+        return count_rows(rows, self.backend, 'read')
+
+    def last_id(self):
+        return self.store.last_id()
+
+    def latest(self, columns):
+        return self.store.latest(columns)
+
+    def statistics(self, since):
+        return self.store.statistics(since)
+
+
+storage = Storage()
+
+__all__ = ['BACKENDS', 'ColumnarStore', 'ReadingStore', 'SqlStore', 'Storage', 'create_store', 'storage']
@@ -0,0 +1,66 @@
+from datetime import timedelta
+
+
+class ReadingStore:
+    """Where temperature readings are written to and read back from.
+
+    Rows returned by ``readings`` and ``latest`` are tuples of the requested
+    columns that also allow attribute access (``row.timestamp``), like
+    SQLAlchemy Core rows.
+    """
+    name = None
+    # Whether 5-minute/hourly/daily rollups are maintained for history queries
+    supports_rollups = False
+    # Whether readings get increasing ids, for readings_after_id and since_id cursors
+    supports_ids = False
+
+    def write(self, rows):
+        """Store reading rows (column dicts including ``timestamp``).
+
+        Rows carry the outside temperatures as values and may also carry the
+        ``weather_observation_id`` they came from; backends keep whichever
+        suits them.
+        """
+        raise NotImplementedError
+
+    def readings(self, since, columns, until=None, yield_per=None, device=None):
+        """Rows of ``columns`` for readings in [since, until), oldest first.
+
+        ``device`` limits the rows to one device name.
+        """
+        raise NotImplementedError
+
+    def existing_keys(self, rows):
+        """(device_name, timestamp) pairs of ``rows`` that are already stored"""
+        if not rows:
+            return set()
+        timestamps = [row['timestamp'] for row in rows]
+        until = max(timestamps) + timedelta(microseconds=1)
+        stored = {
+            (reading.device_name, reading.timestamp)
+            for reading in self.readings(min(timestamps), ('timestamp', 'device_name'), until=until)
+        }
+        return stored & {(row['device_name'], row['timestamp']) for row in rows}
+
+    def readings_after_id(self, since_id, columns, since=None, limit=None):
+        """Rows of ``columns`` for readings stored after id ``since_id``, oldest first.
+
+        ``since`` skips readings older than it; ``limit`` keeps the first
+        ``limit`` readings by id.
+        """
+        raise NotImplementedError
+
+    def last_id(self):
+        """Highest reading id stored so far, or None"""
+        raise NotImplementedError
+
+    def latest(self, columns):
+        """Row of ``columns`` for the most recent reading, or None"""
+        raise NotImplementedError
+
+    def statistics(self, since):
+        """Aggregates over every reading at or after ``since``.
+
+        Returns the keys of ``app.rollups.window_statistics``.
+        """
+        raise NotImplementedError
@@ -0,0 +1,363 @@
+"""Embedded columnar storage for temperature readings.
+
+Each device gets one append-only binary array per column, partitioned by
+UTC day::
+
+    <root>/catalog.json                       device directories, category codes
+    <root>/<device>/<YYYY-MM-DD>/<column>.bin
+
+Range queries open only the partitions and columns they need and slice them
+with ``searchsorted``. Aggregates run vectorized over the slices, and the
+summary of a day that lies wholly inside the window is cached until that
+partition grows.
+
+A single process (the collector) writes. The timestamp array is appended
+last, and readers take its length as the partition's row count, so readers
+in other processes never see half of a collection cycle.
+"""
+import json
+import os
+import shutil
+import threading
+from collections import defaultdict, namedtuple
+from datetime import datetime, timedelta
+from functools import lru_cache
+import numpy as np
+from app.storage.base import ReadingStore
+
+FLOAT_COLUMNS = (
+    'temperature_c', 'temperature_f', 'humidity', 'target_temperature_c',
+    'target_temperature_f', 'outside_temperature_c', 'outside_temperature_f'
+)
+# Low-cardinality strings stored as int16 codes into the catalog, -1 for None
+CATEGORY_COLUMNS = ('hvac_mode', 'hvac_state')
+
+DTYPES = {'timestamp': np.dtype('<i8')}  # microseconds since the epoch
+DTYPES.update({name: np.dtype('<f8') for name in FLOAT_COLUMNS})
+DTYPES.update({name: np.dtype('<i2') for name in CATEGORY_COLUMNS})
+
+EPOCH = datetime(1970, 1, 1)
+
+SUMMARY_SUMS = ('count', 'temperature_sum', 'humidity_count', 'humidity_sum', 'outside_count', 'outside_sum')
+SUMMARY_MINS = ('temperature_min', 'outside_min')
+SUMMARY_MAXES = ('temperature_max', 'outside_max')
+
+
+def to_micros(timestamp):
+    return (timestamp - EPOCH) // timedelta(microseconds=1)
+
+
+@lru_cache(maxsize=64)
+def row_type(columns):
+    return namedtuple('Reading', columns)
+
+
+def _summarize(data):
+    """Count/sum/min/max of one partition slice"""
+    temperature = data['temperature_c']
+    humidity = data['humidity'][~np.isnan(data['humidity'])]
+    outside = data['outside_temperature_c'][~np.isnan(data['outside_temperature_c'])]
+    return {
+        'count': len(temperature),
+        'temperature_sum': float(temperature.sum()),
+        'temperature_min': float(temperature.min()) if len(temperature) else None,
+        'temperature_max': float(temperature.max()) if len(temperature) else None,
+        'humidity_count': len(humidity),
+        'humidity_sum': float(humidity.sum()),
+        'outside_count': len(outside),
+        'outside_sum': float(outside.sum()),
+        'outside_min': float(outside.min()) if len(outside) else None,
+        'outside_max': float(outside.max()) if len(outside) else None,
+    }
+
+
+def _merge(totals, summary):
+    for name in SUMMARY_SUMS:
+        totals[name] += summary[name]
+    for names, pick in ((SUMMARY_MINS, min), (SUMMARY_MAXES, max)):
+        for name in names:
+            if summary[name] is not None:
+                current = totals[name]
+                totals[name] = summary[name] if current is None else pick(current, summary[name])
+
+
+class ColumnarStore(ReadingStore):
+    name = 'columnar'
+
+    def __init__(self, root):
+        self.root = root
+        self.lock = threading.Lock()
+        self.devices = {}  # device name -> directory
+        self.categories = {name: [] for name in CATEGORY_COLUMNS}
+        self.catalog_mtime = None
+        # (directory, day) -> (row count, summary) for whole-day partitions
+        self.summaries = {}
+        os.makedirs(root, exist_ok=True)
+
+    # Catalog
+
+    @property
+    def catalog_path(self):
+        return os.path.join(self.root, 'catalog.json')
+
+    def refresh_catalog(self):
+        """Reload the catalog if another process has written to it"""
+        try:
+            mtime = os.stat(self.catalog_path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime == self.catalog_mtime:
+            return
+        with open(self.catalog_path) as f:
+            catalog = json.load(f)
+        self.devices = catalog['devices']
+        self.categories = catalog['categories']
+        self.catalog_mtime = mtime
+
+    def save_catalog(self):
+        tmp_path = f'{self.catalog_path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'devices': self.devices, 'categories': self.categories}, f)
+        os.replace(tmp_path, self.catalog_path)
+        self.catalog_mtime = os.stat(self.catalog_path).st_mtime_ns
+
+    def encode(self, column, value):
+        if value is None:
+            return -1
+        values = self.categories[column]
+        if value not in values:
+            values.append(value)
+        return values.index(value)
+
+    # Partitions
+
+    def partition_path(self, directory, day):
+        return os.path.join(self.root, directory, day)
+
+    def row_count(self, path):
+        try:
+            return os.path.getsize(os.path.join(path, 'timestamp.bin')) // DTYPES['timestamp'].itemsize
+        except FileNotFoundError:
+            return 0
+
+    def read_column(self, path, column, start, stop):
+        dtype = DTYPES[column]
+        return np.fromfile(
+            os.path.join(path, f'{column}.bin'), dtype=dtype, count=stop - start, offset=start * dtype.itemsize
+        )
+
+    def days(self, directory, since, until=None):
+        """Partition names overlapping [since, until), oldest first"""
+        try:
+            names = os.listdir(os.path.join(self.root, directory))
+        except FileNotFoundError:
+            return []
+        first = since.date().isoformat()
+        last = (until - timedelta(microseconds=1)).date().isoformat() if until else None
+        return sorted(n for n in names if n >= first and (last is None or n <= last))
+
+    def append(self, path, arrays):
+        """Append one partition's new rows, keeping the partition sorted by time"""
+        os.makedirs(path, exist_ok=True)
+        count = self.row_count(path)
+        if count:
+            last = self.read_column(path, 'timestamp', count - 1, count)[0]
+            if arrays['timestamp'][0] < last:
+                return self.rewrite(path, count, arrays)
+
+        for column in sorted(arrays, key=lambda c: c == 'timestamp'):
+            with open(os.path.join(path, f'{column}.bin'), 'ab') as f:
+                # Drop anything a crashed write left past the committed rows
+                f.truncate(count * DTYPES[column].itemsize)
+                f.write(arrays[column].tobytes())
+
+    def rewrite(self, path, count, arrays):
+        """Merge late rows into a partition by rewriting it in timestamp order"""
+        merged = {
+            column: np.concatenate((self.read_column(path, column, 0, count), values))
+            for column, values in arrays.items()
+        }
+        order = np.argsort(merged['timestamp'], kind='stable')
+        for column in sorted(merged, key=lambda c: c == 'timestamp'):
+            target = os.path.join(path, f'{column}.bin')
+            with open(f'{target}.tmp', 'wb') as f:
+                f.write(merged[column][order].tobytes())
+            os.replace(f'{target}.tmp', target)
+
+    def drop_days_before(self, cutoff):
+        """Delete every partition of a day before ``cutoff``; returns the readings deleted.
+
+        The timestamp array goes first, so readers see the partition as empty
+        rather than missing some of its columns.
+        """
+        deleted = 0
+        with self.lock:
+            self.refresh_catalog()
+            for directory in self.devices.values():
+                for day in self.days(directory, EPOCH, cutoff):
+                    path = self.partition_path(directory, day)
+                    deleted += self.row_count(path)
+                    try:
+                        os.remove(os.path.join(path, 'timestamp.bin'))
+                    except FileNotFoundError:
+                        pass
+                    shutil.rmtree(path)
+                    self.summaries.pop((directory, day), None)
+        return deleted
+
+    def slice(self, directory, day, columns, start, end):
+        """Arrays of ``columns`` for one partition's rows in [start, end) microseconds"""
+        path = self.partition_path(directory, day)
+        count = self.row_count(path)
+        timestamps = self.read_column(path, 'timestamp', 0, count)
+        lo = int(np.searchsorted(timestamps, start, 'left'))
+        hi = count if end is None else int(np.searchsorted(timestamps, end, 'left'))
+        data = {'timestamp': timestamps[lo:hi]}
+        for column in columns:
+            if column in DTYPES and column != 'timestamp':
+                data[column] = self.read_column(path, column, lo, hi)
+        return data
+
+    def decode(self, column, values, names):
+        """Python values for one column of a slice, as SQLAlchemy would return them"""
+        if column == 'timestamp':
+            return values.astype('datetime64[us]').astype(object)
+        if column == 'device_name':
+            return names
+        if column == 'id':
+            return np.full(len(names), None, dtype=object)
+        if column in CATEGORY_COLUMNS:
+            lookup = np.array(self.categories[column] + [None], dtype=object)
+            return lookup[values]
+        decoded = values.astype(object)
+        decoded[np.isnan(values)] = None
+        return decoded
+
+    # ReadingStore
+
+    def write(self, rows):
+        if not rows:
+            return
+        with self.lock:
+            self.refresh_catalog()
+            partitions = defaultdict(list)
+            for row in rows:
+                partitions[(row['device_name'], row['timestamp'].date().isoformat())].append(row)
+
+            catalog_changed = False
+            batches = []
+            for (device_name, day), group in partitions.items():
+                if device_name not in self.devices:
+                    self.devices[device_name] = f'device-{len(self.devices)}'
+                    catalog_changed = True
+                group.sort(key=lambda r: r['timestamp'])
+                arrays = {'timestamp': np.array([to_micros(r['timestamp']) for r in group], DTYPES['timestamp'])}
+                for column in FLOAT_COLUMNS:
+                    arrays[column] = np.array([r.get(column) for r in group], DTYPES[column])
+                for column in CATEGORY_COLUMNS:
+                    known = len(self.categories[column])
+                    arrays[column] = np.array([self.encode(column, r.get(column)) for r in group], DTYPES[column])
+                    catalog_changed |= len(self.categories[column]) != known
+                batches.append((self.partition_path(self.devices[device_name], day), arrays))
+
+            # Codes must be resolvable before any reader can see rows that use them
+            if catalog_changed:
+                self.save_catalog()
+            for path, arrays in batches:
+                self.append(path, arrays)
+
+    def readings(self, since, columns, until=None, yield_per=None, device=None):
+        self.refresh_catalog()
+        start = to_micros(since)
+        end = to_micros(until) if until is not None else None
+        reading = row_type(tuple(columns))
+
+        by_day = defaultdict(list)
+        for device_name, directory in self.devices.items():
+            if device is not None and device_name != device:
+                continue
+            for day in self.days(directory, since, until):
+                by_day[day].append((device_name, directory))
+
+        # One day at a time keeps memory bounded for multi-year ranges
+        for day in sorted(by_day):
+            slices = []
+            for device_name, directory in by_day[day]:
+                data = self.slice(directory, day, columns, start, end)
+                if len(data['timestamp']):
+                    slices.append((device_name, data))
+            if not slices:
+                continue
+
+            timestamps = np.concatenate([data['timestamp'] for _, data in slices])
+            order = np.argsort(timestamps, kind='stable')
+            names = np.concatenate([
+                np.full(len(data['timestamp']), device_name, dtype=object) for device_name, data in slices
+            ])[order]
+            values = []
+            for column in columns:
+                merged = timestamps if column == 'timestamp' else (
+                    np.concatenate([data[column] for _, data in slices]) if column in DTYPES else None
+                )
+                values.append(self.decode(column, merged[order] if merged is not None else None, names))
+            yield from map(reading._make, zip(*values))
+
+    def latest(self, columns):
+        self.refresh_catalog()
+        newest = None
+        for device_name, directory in self.devices.items():
+            for day in reversed(self.days(directory, EPOCH)):
+                path = self.partition_path(directory, day)
+                count = self.row_count(path)
+                if not count:
+                    continue
+                timestamp = self.read_column(path, 'timestamp', count - 1, count)[0]
+                if newest is None or timestamp > newest[0]:
+                    newest = (timestamp, device_name, directory, day)
+                break
+        if newest is None:
+            return None
+
+        timestamp, device_name, directory, day = newest
+        data = self.slice(directory, day, columns, int(timestamp), int(timestamp) + 1)
+        names = np.array([device_name], dtype=object)
+        values = [
+            self.decode(column, data[column][-1:] if column in DTYPES else None, names)[0]
+            for column in columns
+        ]
+        return row_type(tuple(columns))(*values)
+
+    def statistics(self, since):
+        self.refresh_catalog()
+        start = to_micros(since)
+        columns = ('temperature_c', 'humidity', 'outside_temperature_c')
+        totals = {name: 0 for name in SUMMARY_SUMS}
+        totals.update({name: None for name in SUMMARY_MINS + SUMMARY_MAXES})
+
+        for directory in self.devices.values():
+            for day in self.days(directory, since):
+                if datetime.fromisoformat(day) >= since:
+                    # Whole day is inside the window
+                    count = self.row_count(self.partition_path(directory, day))
+                    cached = self.summaries.get((directory, day))
+                    if cached is None or cached[0] != count:
+                        data = self.slice(directory, day, columns, 0, None)
+                        cached = (len(data['timestamp']), _summarize(data))
+                        self.summaries[(directory, day)] = cached
+                    summary = cached[1]
+                else:
+                    summary = _summarize(self.slice(directory, day, columns, start, None))
+                _merge(totals, summary)
+
+        def average(sum_name, count_name):
+            return totals[sum_name] / totals[count_name] if totals[count_name] else None
+
+        return {
+            'avg_temp': average('temperature_sum', 'count'),
+            'min_temp': totals['temperature_min'],
+            'max_temp': totals['temperature_max'],
+            'avg_humidity': average('humidity_sum', 'humidity_count'),
+            'avg_outside_temp': average('outside_sum', 'outside_count'),
+            'min_outside_temp': totals['outside_min'],
+            'max_outside_temp': totals['outside_max'],
+        }
@@ -0,0 +1,46 @@
+"""Readings in the ``temperature_reading`` table, with rollups maintained at
+ingest time. This is the default backend.
+"""
+from sqlalchemy import insert
+from app import db
+from app.models import TemperatureReading
+from app.queries import select_last_id, select_latest, select_readings, select_readings_after_id
+from app.rollups import update_rollups, window_statistics
+from app.sites import current_site_id
+from app.storage.base import ReadingStore
+from app.weather import link_observations
+
+
+class SqlStore(ReadingStore):
+    name = 'sql'
+    supports_rollups = True
+    supports_ids = True
+
+    def write(self, rows):
+        """Insert rows for the current site and fold them into the rollups; the caller commits.
+
+        Outside temperatures are stored as a link to the row's weather
+        observation (``weather_observation_id``), see ``app.weather``.
+        """
+        if not rows:
+            return
+        site_id = current_site_id()
+        rows = [dict(row, site_id=site_id) for row in rows]
+        # One executemany for the whole batch instead of a unit-of-work flush per object
+        db.session.execute(insert(TemperatureReading.__table__), link_observations(rows))
+        update_rollups(rows)
+
+    def readings(self, since, columns, until=None, yield_per=None, device=None):
+        return select_readings(since, columns, until=until, yield_per=yield_per, device=device)
+
+    def readings_after_id(self, since_id, columns, since=None, limit=None):
+        return select_readings_after_id(since_id, columns, since=since, limit=limit)
+
+    def last_id(self):
+        return select_last_id()
+
+    def latest(self, columns):
+        return select_latest(columns)
+
+    def statistics(self, since):
+        return window_statistics(since)
@@ -37,6 +37,11 @@ def get_swagger_spec():
                 "get": {
                     "summary": "Get all Nest devices",
                     "description": "Retrieve all Nest devices from the Google Smart Device Management API",
+                    "parameters": [
+                        {
+                            "$ref": "#/components/parameters/Site"
+                        }
+                    ],
                     "responses": {
                         "200": {
                             "description": "List of Nest devices",
@@ -69,6 +74,16 @@ def get_swagger_spec():
                                     }
                                 }
                             }
+                        },
+                        "503": {
+                            "description": "The Nest API is unreachable or its circuit breaker is open; retry after Retry-After seconds when given",
+                            "content": {
+                                "application/json": {
+                                    "schema": {
+                                        "$ref": "#/components/schemas/Error"
+                                    }
+                                }
+                            }
                         }
                     }
                 }
@@ -108,6 +123,16 @@ def get_swagger_spec():
                                     }
                                 }
                             }
+                        },
+                        "503": {
+                            "description": "The Nest API is unreachable or its circuit breaker is open; retry after Retry-After seconds when given",
+                            "content": {
+                                "application/json": {
+                                    "schema": {
+                                        "$ref": "#/components/schemas/Error"
+                                    }
+                                }
+                            }
                         }
                     }
                 }
@@ -117,6 +142,9 @@ def get_swagger_spec():
                     "summary": "Get temperature readings",
                     "description": "Retrieve temperature readings from the database",
                     "parameters": [
+                        {
+                            "$ref": "#/components/parameters/Site"
+                        },
                         {
                             "name": "hours",
                             "in": "query",
@@ -126,11 +154,124 @@ def get_swagger_spec():
                                 "type": "integer",
                                 "default": 24
                             }
+                        },
+                        {
+                            "name": "resolution",
+                            "in": "query",
+                            "required": False,
+                            "description": "raw readings, or per-device 5min/hour/day rollup buckets. auto uses rollups for long windows (default: auto)",
+                            "schema": {
+                                "type": "string",
+                                "enum": ["auto", "raw", "5min", "hour", "day"],
+                                "default": "auto"
+                            }
+                        },
+                        {
+                            "name": "max_points",
+                            "in": "query",
+                            "required": False,
+                            "description": "Downsample to at most this many points in total, split evenly between devices. Use bands=1 to get the HVAC runs of the full series",
+                            "schema": {
+                                "type": "integer",
+                                "minimum": 1
+                            }
+                        },
+                        {
+                            "name": "bands",
+                            "in": "query",
+                            "required": False,
+                            "description": "Set to 1 to wrap the response as {readings, hvac_bands}, where hvac_bands lists every HEATING/COOLING run in the window as {device_name, state, start, end}. end is the first reading after the run. Computed before downsampling",
+                            "schema": {
+                                "type": "integer",
+                                "enum": [0, 1]
+                            }
+                        },
+                        {
+                            "name": "method",
+                            "in": "query",
+                            "required": False,
+                            "description": "Downsampling method (default: lttb)",
+                            "schema": {
+                                "type": "string",
+                                "enum": ["lttb", "minmax"],
+                                "default": "lttb"
+                            }
+                        },
+                        {
+                            "name": "stream",
+                            "in": "query",
+                            "required": False,
+                            "description": "Set to 1 to stream the JSON array in chunks. Send Accept: application/x-ndjson for one reading per line. Ignored with max_points or bands",
+                            "schema": {
+                                "type": "integer",
+                                "enum": [0, 1]
+                            }
+                        },
+                        {
+                            "name": "fields",
+                            "in": "query",
+                            "required": False,
+                            "description": "Comma-separated reading fields to return (default: all)",
+                            "schema": {
+                                "type": "string",
+                                "example": "timestamp,temperature_c,hvac_state"
+                            }
+                        },
+                        {
+                            "name": "shape",
+                            "in": "query",
+                            "required": False,
+                            "description": "rows for a list of objects, columnar for one array per field (default: rows)",
+                            "schema": {
+                                "type": "string",
+                                "enum": ["rows", "columnar"],
+                                "default": "rows"
+                            }
+                        },
+                        {
+                            "name": "after",
+                            "in": "query",
+                            "required": False,
+                            "description": "Cursor: return only raw readings newer than this timestamp (e.g. the X-Next-After header of the previous call), wrapped as {readings, next}. When a rollup resolution applies, returns the buckets from the one holding this timestamp onwards instead, so the last bucket drawn can be replaced",
+                            "schema": {
+                                "type": "string",
+                                "format": "date-time"
+                            }
+                        },
+                        {
+                            "name": "since_id",
+                            "in": "query",
+                            "required": False,
+                            "description": "Cursor: return only readings stored after this id (X-Next-Since-Id), including late readings with older timestamps. sql storage backend only",
+                            "schema": {
+                                "type": "integer"
+                            }
                         }
                     ],
                     "responses": {
                         "200": {
-                            "description": "List of temperature readings",
+                            "description": "List of temperature readings. With after or since_id, an object with the new readings (at most 5000, only those inside hours) and the next cursor. next.more is true when the page was full; call again with the next cursor for the rest",
+                            "headers": {
+                                "X-Next-After": {
+                                    "description": "Pass as after to fetch only readings stored since this response",
+                                    "schema": {
+                                        "type": "string",
+                                        "format": "date-time"
+                                    }
+                                },
+                                "X-Next-Since-Id": {
+                                    "description": "Pass as since_id to fetch only readings stored since this response",
+                                    "schema": {
+                                        "type": "integer"
+                                    }
+                                },
+                                "X-Resolution": {
+                                    "description": "Bucket size in seconds when the readings are rollup buckets; absent for raw readings",
+                                    "schema": {
+                                        "type": "integer"
+                                    }
+                                }
+                            },
                             "content": {
                                 "application/json": {
                                     "schema": {
@@ -139,6 +280,11 @@ def get_swagger_spec():
                                             "$ref": "#/components/schemas/TemperatureReading"
                                         }
                                     }
+                                },
+                                "application/x-ndjson": {
+                                    "schema": {
+                                        "$ref": "#/components/schemas/TemperatureReading"
+                                    }
                                 }
                             }
                         }
@@ -149,6 +295,21 @@ def get_swagger_spec():
                 "get": {
                     "summary": "Get current temperature",
                     "description": "Get the most recent temperature reading",
+                    "parameters": [
+                        {
+                            "$ref": "#/components/parameters/Site"
+                        },
+                        {
+                            "name": "fields",
+                            "in": "query",
+                            "required": False,
+                            "description": "Comma-separated reading fields to return (default: all)",
+                            "schema": {
+                                "type": "string",
+                                "example": "timestamp,temperature_c,hvac_state"
+                            }
+                        }
+                    ],
                     "responses": {
                         "200": {
                             "description": "Current temperature reading",
@@ -171,6 +332,9 @@ def get_swagger_spec():
                     "summary": "Get temperature statistics",
                     "description": "Get statistical analysis of temperature data",
                     "parameters": [
+                        {
+                            "$ref": "#/components/parameters/Site"
+                        },
                         {
                             "name": "hours",
                             "in": "query",
@@ -195,9 +359,379 @@ def get_swagger_spec():
                         }
                     }
                 }
+            },
+            "/api/analytics": {
+                "get": {
+                    "summary": "Get HVAC and thermal analytics",
+                    "description": "Per device: HVAC runtime, duty cycle, cycle counts, heat-up/cool-down rates and a thermal model fitted while the HVAC was off (dT/dt = gain - loss * (indoor - outside)). The window is rounded out to whole hours. Consecutive readings more than ANALYTICS_MAX_GAP_SECONDS apart are treated as a gap. Hours past the raw retention are estimated from hourly rollups (see source and estimated_hours); cycles, rates and the thermal model only cover raw readings.",
+                    "parameters": [
+                        {
+                            "$ref": "#/components/parameters/Site"
+                        },
+                        {
+                            "name": "hours",
+                            "in": "query",
+                            "required": False,
+                            "description": "Period for analytics (default: 24)",
+                            "schema": {
+                                "type": "integer",
+                                "default": 24
+                            }
+                        },
+                        {
+                            "name": "device",
+                            "in": "query",
+                            "required": False,
+                            "description": "Only analyze this device",
+                            "schema": {
+                                "type": "string"
+                            }
+                        }
+                    ],
+                    "responses": {
+                        "200": {
+                            "description": "Analytics per device",
+                            "content": {
+                                "application/json": {
+                                    "schema": {
+                                        "$ref": "#/components/schemas/Analytics"
+                                    }
+                                }
+                            }
+                        }
+                    }
+                }
+            },
+            "/api/stream": {
+                "get": {
+                    "summary": "Stream new readings",
+                    "description": "Server-Sent Events stream. After each collection cycle a `readings` event carries the newly stored readings (same keys as /api/temperatures) and a `statistics` event carries the /api/statistics body for `hours`. Idle connections receive a comment line every SSE_KEEPALIVE_SECONDS.",
+                    "parameters": [
+                        {
+                            "$ref": "#/components/parameters/Site"
+                        },
+                        {
+                            "name": "hours",
+                            "in": "query",
+                            "description": "Window for the statistics events",
+                            "required": False,
+                            "schema": {
+                                "type": "integer",
+                                "default": 24
+                            }
+                        }
+                    ],
+                    "responses": {
+                        "200": {
+                            "description": "Event stream",
+                            "content": {
+                                "text/event-stream": {
+                                    "schema": {
+                                        "type": "string"
+                                    }
+                                }
+                            }
+                        },
+                        "503": {
+                            "description": "This server process already has SSE_MAX_SUBSCRIBERS streams open. Poll /api/temperatures with a cursor instead, or retry after Retry-After seconds",
+                            "content": {
+                                "application/json": {
+                                    "schema": {
+                                        "$ref": "#/components/schemas/Error"
+                                    }
+                                }
+                            }
+                        }
+                    }
+                }
+            },
+            "/api/export": {
+                "get": {
+                    "summary": "Export readings in bulk",
+                    "description": "Readings in [from, to) as a file download, streamed from the database cursor in batches. CSV timestamps are ISO 8601; Parquet and Arrow use microsecond timestamps. Parquet and Arrow need pyarrow on the server, and zstd compression of CSV/Arrow needs zstandard.",
+                    "parameters": [
+                        {
+                            "$ref": "#/components/parameters/Site"
+                        },
+                        {
+                            "name": "from",
+                            "in": "query",
+                            "required": False,
+                            "description": "Start of the range, ISO 8601 UTC (default: 30 days ago)",
+                            "schema": {
+                                "type": "string",
+                                "format": "date-time"
+                            }
+                        },
+                        {
+                            "name": "to",
+                            "in": "query",
+                            "required": False,
+                            "description": "End of the range (exclusive), ISO 8601 UTC (default: no limit)",
+                            "schema": {
+                                "type": "string",
+                                "format": "date-time"
+                            }
+                        },
+                        {
+                            "name": "device",
+                            "in": "query",
+                            "required": False,
+                            "description": "Only export readings from this device name",
+                            "schema": {
+                                "type": "string"
+                            }
+                        },
+                        {
+                            "name": "format",
+                            "in": "query",
+                            "required": False,
+                            "schema": {
+                                "type": "string",
+                                "enum": ["csv", "parquet", "arrow"],
+                                "default": "csv"
+                            }
+                        },
+                        {
+                            "name": "compression",
+                            "in": "query",
+                            "required": False,
+                            "description": "Compress the whole response (CSV, Arrow), or the column chunks (Parquet, default snappy)",
+                            "schema": {
+                                "type": "string",
+                                "enum": ["gzip", "zstd"]
+                            }
+                        },
+                        {
+                            "name": "fields",
+                            "in": "query",
+                            "required": False,
+                            "description": "Comma-separated reading fields to export (default: all)",
+                            "schema": {
+                                "type": "string"
+                            }
+                        }
+                    ],
+                    "responses": {
+                        "200": {
+                            "description": "Export file (Content-Disposition: attachment)",
+                            "content": {
+                                "text/csv": {"schema": {"type": "string"}},
+                                "application/vnd.apache.parquet": {"schema": {"type": "string", "format": "binary"}},
+                                "application/vnd.apache.arrow.stream": {"schema": {"type": "string", "format": "binary"}},
+                                "application/gzip": {"schema": {"type": "string", "format": "binary"}},
+                                "application/zstd": {"schema": {"type": "string", "format": "binary"}}
+                            }
+                        },
+                        "400": {
+                            "description": "Unknown format, compression or field, invalid timestamp, or a missing server package"
+                        }
+                    }
+                }
+            },
+            "/api/http/stats": {
+                "get": {
+                    "summary": "Get external API client statistics",
+                    "description": "Per-endpoint latency histograms and retry counters of this process's calls to Google OAuth, Smart Device Management and OpenWeatherMap, and each dependency's circuit breaker state",
+                    "responses": {
+                        "200": {
+                            "description": "HTTP client statistics",
+                            "content": {
+                                "application/json": {
+                                    "schema": {
+                                        "type": "object",
+                                        "properties": {
+                                            "endpoints": {
+                                                "type": "object",
+                                                "description": "Keyed by endpoint, e.g. sdm.devices.list",
+                                                "additionalProperties": {
+                                                    "type": "object",
+                                                    "properties": {
+                                                        "count": {
+                                                            "type": "integer",
+                                                            "description": "Attempts timed, including retries"
+                                                        },
+                                                        "sum_seconds": {
+                                                            "type": "number"
+                                                        },
+                                                        "buckets": {
+                                                            "type": "array",
+                                                            "description": "Cumulative [upper bound in seconds, attempts] pairs",
+                                                            "items": {
+                                                                "type": "array"
+                                                            }
+                                                        },
+                                                        "p50_seconds": {
+                                                            "type": "number"
+                                                        },
+                                                        "p95_seconds": {
+                                                            "type": "number"
+                                                        },
+                                                        "p99_seconds": {
+                                                            "type": "number"
+                                                        },
+                                                        "requests": {
+                                                            "type": "integer"
+                                                        },
+                                                        "retries": {
+                                                            "type": "integer"
+                                                        },
+                                                        "failures": {
+                                                            "type": "integer",
+                                                            "description": "Calls that still failed after every retry"
+                                                        },
+                                                        "short_circuited": {
+                                                            "type": "integer",
+                                                            "description": "Calls skipped while the circuit breaker was open"
+                                                        }
+                                                    }
+                                                }
+                                            },
+                                            "breakers": {
+                                                "type": "object",
+                                                "description": "Keyed by dependency: oauth, sdm, openweathermap",
+                                                "additionalProperties": {
+                                                    "type": "object",
+                                                    "properties": {
+                                                        "state": {
+                                                            "type": "string",
+                                                            "enum": ["closed", "open", "half_open"]
+                                                        },
+                                                        "consecutive_failures": {
+                                                            "type": "integer"
+                                                        }
+                                                    }
+                                                }
+                                            }
+                                        }
+                                    }
+                                }
+                            }
+                        }
+                    }
+                }
+            },
+            "/metrics": {
+                "get": {
+                    "summary": "Prometheus metrics",
+                    "description": "Metrics of the process that answers, in the Prometheus text format: request latency per route, SQL statement time and rows, storage rows, external API latency and circuit breakers, cache hit ratios and the spool backlog",
+                    "responses": {
+                        "200": {
+                            "description": "Prometheus text exposition format 0.0.4",
+                            "content": {
+                                "text/plain": {
+                                    "schema": {
+                                        "type": "string"
+                                    }
+                                }
+                            }
+                        }
+                    }
+                }
+            },
+            "/api/sites": {
+                "get": {
+                    "summary": "List sites",
+                    "description": "Homes served by this deployment; pass an id as the site parameter of the other endpoints",
+                    "responses": {
+                        "200": {
+                            "description": "Configured sites",
+                            "content": {
+                                "application/json": {
+                                    "schema": {
+                                        "type": "object",
+                                        "properties": {
+                                            "default": {
+                                                "type": "string",
+                                                "description": "Site used when no site parameter is given"
+                                            },
+                                            "sites": {
+                                                "type": "array",
+                                                "items": {
+                                                    "type": "object",
+                                                    "properties": {
+                                                        "id": {
+                                                            "type": "string"
+                                                        },
+                                                        "name": {
+                                                            "type": "string"
+                                                        },
+                                                        "sharded": {
+                                                            "type": "boolean",
+                                                            "description": "Whether the site has its own database file"
+                                                        }
+                                                    }
+                                                }
+                                            }
+                                        }
+                                    }
+                                }
+                            }
+                        }
+                    }
+                }
+            },
+            "/api/cache/stats": {
+                "get": {
+                    "summary": "Get response cache statistics",
+                    "description": "Hit/miss counters of the in-process response cache and the current data generation",
+                    "responses": {
+                        "200": {
+                            "description": "Cache statistics",
+                            "content": {
+                                "application/json": {
+                                    "schema": {
+                                        "type": "object",
+                                        "properties": {
+                                            "hits": {
+                                                "type": "integer",
+                                                "description": "Requests served from the cache"
+                                            },
+                                            "misses": {
+                                                "type": "integer",
+                                                "description": "Requests that rebuilt the response"
+                                            },
+                                            "hit_ratio": {
+                                                "type": "number",
+                                                "description": "Hits divided by lookups"
+                                            },
+                                            "entries": {
+                                                "type": "integer",
+                                                "description": "Responses currently cached"
+                                            },
+                                            "max_entries": {
+                                                "type": "integer",
+                                                "description": "LRU capacity"
+                                            },
+                                            "ttl_seconds": {
+                                                "type": "integer",
+                                                "description": "Maximum age of a cached response"
+                                            },
+                                            "generation": {
+                                                "type": "integer",
+                                                "description": "Data generation bumped by each collection cycle"
+                                            }
+                                        }
+                                    }
+                                }
+                            }
+                        }
+                    }
+                }
             }
         },
         "components": {
+            "parameters": {
+                "Site": {
+                    "name": "site",
+                    "in": "query",
+                    "required": False,
+                    "description": "Site (home) id from /api/sites (default: the first configured site)",
+                    "schema": {
+                        "type": "string"
+                    }
+                }
+            },
             "schemas": {
                 "NestDevice": {
                     "type": "object",
@@ -359,11 +893,121 @@ def get_swagger_spec():
                             "type": "number",
                             "description": "Maximum outside temperature in Celsius"
                         },
+                        "p5_temperature": {
+                            "type": "number",
+                            "description": "Approximate 5th percentile temperature in Celsius (6, 12, 24, 48 and 168 hour windows only)"
+                        },
+                        "p95_temperature": {
+                            "type": "number",
+                            "description": "Approximate 95th percentile temperature in Celsius (6, 12, 24, 48 and 168 hour windows only)"
+                        },
                         "period_hours": {
                             "type": "integer",
                             "description": "Period in hours for the statistics"
                         }
                     }
+                },
+                "Analytics": {
+                    "type": "object",
+                    "properties": {
+                        "period_hours": {
+                            "type": "integer",
+                            "description": "Requested period in hours"
+                        },
+                        "from": {
+                            "type": "string",
+                            "format": "date-time",
+                            "description": "Start of the window (UTC, on an hour boundary)"
+                        },
+                        "to": {
+                            "type": "string",
+                            "format": "date-time",
+                            "description": "End of the window (UTC, exclusive)"
+                        },
+                        "source": {
+                            "type": "string",
+                            "enum": ["raw", "raw+rollups", "rollups"],
+                            "description": "raw: computed from raw readings. rollups: the whole window is past the raw retention and estimated from hourly rollups. raw+rollups: estimated up to raw_from, raw after"
+                        },
+                        "raw_from": {
+                            "type": "string",
+                            "format": "date-time",
+                            "nullable": True,
+                            "description": "Start of the part computed from raw readings, or null if there is none"
+                        },
+                        "devices": {
+                            "type": "array",
+                            "items": {
+                                "$ref": "#/components/schemas/DeviceAnalytics"
+                            }
+                        }
+                    }
+                },
+                "DeviceAnalytics": {
+                    "type": "object",
+                    "properties": {
+                        "device_name": {"type": "string"},
+                        "covered_hours": {
+                            "type": "number",
+                            "description": "Time covered by readings, excluding gaps"
+                        },
+                        "estimated_hours": {
+                            "type": "number",
+                            "description": "Part of covered_hours estimated from hourly rollups, counted as whole hours with readings; their runtime is each hour's share of heating/cooling readings"
+                        },
+                        "heating_hours": {"type": "number"},
+                        "cooling_hours": {"type": "number"},
+                        "heating_duty_cycle": {
+                            "type": "number",
+                            "description": "Share of the covered time spent heating (0-1)"
+                        },
+                        "cooling_duty_cycle": {
+                            "type": "number",
+                            "description": "Share of the covered time spent cooling (0-1)"
+                        },
+                        "heating_cycles": {"type": "integer"},
+                        "cooling_cycles": {"type": "integer"},
+                        "avg_heating_cycle_minutes": {"type": "number"},
+                        "avg_cooling_cycle_minutes": {"type": "number"},
+                        "heat_up_c_per_hour": {
+                            "type": "number",
+                            "description": "Average indoor temperature rise while heating"
+                        },
+                        "cool_down_c_per_hour": {
+                            "type": "number",
+                            "description": "Average indoor temperature fall while cooling"
+                        },
+                        "thermal_model": {
+                            "type": "object",
+                            "properties": {
+                                "loss_per_hour": {
+                                    "type": "number",
+                                    "description": "Share of the indoor-outside difference lost per hour"
+                                },
+                                "time_constant_hours": {
+                                    "type": "number",
+                                    "description": "1 / loss_per_hour"
+                                },
+                                "internal_gain_c_per_hour": {
+                                    "type": "number",
+                                    "description": "Warming with the HVAC off and no indoor-outside difference"
+                                },
+                                "heating_power_c_per_hour": {
+                                    "type": "number",
+                                    "description": "What heating adds on top of the idle model"
+                                },
+                                "cooling_power_c_per_hour": {
+                                    "type": "number",
+                                    "description": "What cooling removes on top of the idle model"
+                                },
+                                "r_squared": {"type": "number"},
+                                "idle_hours": {
+                                    "type": "number",
+                                    "description": "Hours of idle intervals the model was fitted to"
+                                }
+                            }
+                        }
+                    }
                 }
             }
         }
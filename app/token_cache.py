@@ -0,0 +1,143 @@
+"""Process-wide OAuth access token cache.
+
+Tokens are kept until ``refresh_margin`` seconds before they expire. Only
+one thread refreshes a given token at a time; while that refresh is in
+flight other threads keep using the old token if it is still valid, or wait
+for the new one if it is not. With a ``path`` the cache is also shared
+through a JSON file (guarded by a lock file) so the web and collector
+containers reuse each other's tokens.
+"""
+import fcntl
+import hashlib
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+
+def token_key(*parts):
+    """Stable, non-secret cache key for a set of credentials"""
+    return hashlib.sha256(':'.join(p or '' for p in parts).encode()).hexdigest()[:16]
+
+
+class TokenCache:
+    def __init__(self, refresh_margin=300, path=None):
+        self.refresh_margin = refresh_margin
+        self.path = path
+        self.tokens = {}
+        self.locks = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.refreshes = 0
+
+    def _key_lock(self, key):
+        with self.lock:
+            return self.locks.setdefault(key, threading.Lock())
+
+    def _lookup(self, key):
+        """Return (token, expires_at) from memory, or (None, 0)"""
+        return self.tokens.get(key, (None, 0))
+
+    def _needs_refresh(self, expires_at):
+        return time.time() >= expires_at - self.refresh_margin
+
+    def get(self, key, fetch):
+        """Return a valid access token for ``key``.
+
+        ``fetch`` is called with no arguments to obtain a new token and must
+        return a dict with ``access_token`` and ``expires_in``, or None on
+        failure.
+        """
+        token, expires_at = self._lookup(key)
+        if token and not self._needs_refresh(expires_at):
+            self.hits += 1
+            return token
+
+        key_lock = self._key_lock(key)
+        still_valid = token is not None and time.time() < expires_at
+        # Someone else is already refreshing; keep using the current token meanwhile
+        if not key_lock.acquire(blocking=not still_valid):
+            return token
+
+        try:
+            token, expires_at = self._lookup(key)
+            if token and not self._needs_refresh(expires_at):
+                return token
+
+            with self._file_lock():
+                token, expires_at = self._load(key)
+                if token and not self._needs_refresh(expires_at):
+                    self.tokens[key] = (token, expires_at)
+                    return token
+
+                result = fetch()
+                if not result:
+                    # Fall back to the old token while it lasts
+                    return token if token and time.time() < expires_at else None
+
+                token = result['access_token']
+                expires_at = time.time() + result.get('expires_in', 3600)
+                self.tokens[key] = (token, expires_at)
+                self.refreshes += 1
+                self._save(key, token, expires_at)
+                return token
+        finally:
+            key_lock.release()
+
+    def invalidate(self, key):
+        """Drop a token the API rejected so the next call refreshes it"""
+        self.tokens.pop(key, None)
+        if self.path:
+            with self._file_lock():
+                entries = self._read_file()
+                if entries.pop(key, None) is not None:
+                    self._write_file(entries)
+
+    @contextmanager
+    def _file_lock(self):
+        if not self.path:
+            yield
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(f'{self.path}.lock', 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_file(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_file(self, entries):
+        tmp_path = f'{self.path}.tmp'
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(entries, f)
+        os.replace(tmp_path, self.path)
+
+    def _load(self, key):
+        if not self.path:
+            return self._lookup(key)
+        entry = self._read_file().get(key)
+        if not entry:
+            return self._lookup(key)
+        return entry['access_token'], entry['expires_at']
+
+    def _save(self, key, token, expires_at):
+        if not self.path:
+            return
+        entries = self._read_file()
+        entries[key] = {'access_token': token, 'expires_at': expires_at}
+        self._write_file(entries)
+
+
+token_cache = TokenCache(
+    refresh_margin=int(os.getenv('NEST_TOKEN_REFRESH_MARGIN', 300)),
+    path=os.getenv('NEST_TOKEN_CACHE_PATH') or None,
+)
@@ -0,0 +1,71 @@
+"""Mapping of Smart Device Management traits to TemperatureReading columns.
+
+Each extractor takes one trait's payload and returns the reading columns it
+provides. Register an extractor with ``register_trait`` to pick up another
+trait without touching the collector.
+"""
+
+TRAIT_EXTRACTORS = {}
+
+# A device without these traits cannot produce a reading
+REQUIRED_TRAITS = ('sdm.devices.traits.Temperature',)
+
+
+def register_trait(name):
+    def decorator(extractor):
+        TRAIT_EXTRACTORS[name] = extractor
+        return extractor
+    return decorator
+
+
+def celsius_to_fahrenheit(value):
+    return value * 9/5 + 32 if value is not None else None
+
+
+@register_trait('sdm.devices.traits.Temperature')
+def extract_temperature(trait):
+    temp_c = trait.get('ambientTemperatureCelsius')
+    return {'temperature_c': temp_c, 'temperature_f': celsius_to_fahrenheit(temp_c)}
+
+
+@register_trait('sdm.devices.traits.Humidity')
+def extract_humidity(trait):
+    return {'humidity': trait.get('ambientHumidityPercent')}
+
+
+@register_trait('sdm.devices.traits.ThermostatTemperatureSetpoint')
+def extract_setpoint(trait):
+    target_c = trait.get('heatCelsius') or trait.get('coolCelsius')
+    return {'target_temperature_c': target_c, 'target_temperature_f': celsius_to_fahrenheit(target_c)}
+
+
+@register_trait('sdm.devices.traits.ThermostatHvac')
+def extract_hvac(trait):
+    return {'hvac_state': trait.get('status'), 'hvac_mode': trait.get('mode')}
+
+
+# Registered after ThermostatHvac so its mode wins when both are present
+@register_trait('sdm.devices.traits.ThermostatMode')
+def extract_mode(trait):
+    return {'hvac_mode': trait.get('mode')}
+
+
+def has_required_traits(device_data):
+    traits = device_data.get('traits', {})
+    return all(traits.get(name) for name in REQUIRED_TRAITS)
+
+
+def extract_reading(device_data):
+    """Reading columns for one device payload, or None if it has no temperature"""
+    if not has_required_traits(device_data):
+        return None
+
+    traits = device_data['traits']
+    fields = {'device_name': device_data.get('displayName', 'Unknown')}
+    for name, extractor in TRAIT_EXTRACTORS.items():
+        if traits.get(name):
+            fields.update(extractor(traits[name]))
+
+    if fields.get('temperature_c') is None:
+        return None
+    return fields
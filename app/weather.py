@@ -0,0 +1,150 @@
+"""Weather observations shared by readings.
+
+OpenWeatherMap updates current conditions roughly every 10 minutes, so one
+observation serves every device in a collection cycle, every site at the
+same location and usually the next cycle too. ``observation_cache`` keeps
+the latest observation per location, with coordinates rounded to
+``LOCATION_PRECISION`` decimals (about 1 km). Entries live for
+``WEATHER_CACHE_TTL_SECONDS``, and only one thread fetches a given
+location at a time.
+
+Each observation is stored once in ``weather_observation``. Readings hold
+its id instead of copies of the outside temperature, and the SQL read path
+joins the temperature back in.
+"""
+import os
+import threading
+import time
+from datetime import datetime
+from sqlalchemy import insert, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from app import db
+from app.models import WeatherObservation
+
+LOCATION_PRECISION = 2
+
+# Reading fields that come from the linked observation
+OUTSIDE_FIELDS = {'outside_temperature_c': 'temperature_c', 'outside_temperature_f': 'temperature_f'}
+
+
+def location_key(lat, lon):
+    """Rounded (lat, lon) that observations are cached and stored under, or None without coordinates"""
+    try:
+        return round(float(lat), LOCATION_PRECISION), round(float(lon), LOCATION_PRECISION)
+    except (TypeError, ValueError):
+        return None
+
+
+class ObservationCache:
+    def __init__(self, ttl=600):
+        self.ttl = ttl
+        self.observations = {}
+        self.locks = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.fetches = 0
+
+    def _key_lock(self, location):
+        with self.lock:
+            return self.locks.setdefault(location, threading.Lock())
+
+    def get(self, location, fetch):
+        """Latest observation for ``location``, calling ``fetch`` once the cached one is ``ttl`` seconds old.
+
+        ``fetch`` returns an observation dict or None on failure; failures
+        are not cached, so the next caller tries again.
+        """
+        with self._key_lock(location):
+            observation, expires_at = self.observations.get(location, (None, 0))
+            if observation is not None and time.monotonic() < expires_at:
+                self.hits += 1
+                return observation
+            self.fetches += 1
+            observation = fetch()
+            if observation is not None:
+                self.observations[location] = (observation, time.monotonic() + self.ttl)
+            return observation
+
+    def clear(self):
+        with self.lock:
+            self.observations.clear()
+
+
+observation_cache = ObservationCache(ttl=int(os.getenv('WEATHER_CACHE_TTL_SECONDS', 600)))
+
+
+def _observation_values(location, observation):
+    latitude, longitude = location or (None, None)
+    fetched_at = observation.get('fetched_at') or datetime.utcnow()
+    return {
+        'latitude': latitude,
+        'longitude': longitude,
+        'observed_at': observation.get('observed_at') or fetched_at,
+        'fetched_at': fetched_at,
+        'temperature_c': observation.get('temperature_c'),
+        'temperature_f': observation.get('temperature_f'),
+        'humidity': observation.get('humidity'),
+        'wind_speed': observation.get('wind_speed'),
+        'description': observation.get('description'),
+    }
+
+
+def store_observation(location, observation):
+    """Id of ``observation`` in the current site's database, inserting it the first time it is seen"""
+    table = WeatherObservation.__table__
+    values = _observation_values(location, observation)
+    if location is None:
+        # NULL coordinates never conflict, so a replayed batch has to find its earlier copy
+        existing = db.session.execute(select(table.c.id).where(
+            table.c.latitude.is_(None),
+            table.c.fetched_at == values['fetched_at'],
+            table.c.observed_at == values['observed_at'],
+        ).limit(1)).scalar()
+        if existing is not None:
+            return existing
+        return db.session.execute(insert(table).values(values)).inserted_primary_key[0]
+
+    # Another site or process may already have stored the same report
+    db.session.execute(
+        sqlite_insert(table).values(values)
+        .on_conflict_do_nothing(index_elements=['latitude', 'longitude', 'observed_at'])
+    )
+    return db.session.execute(select(table.c.id).where(
+        table.c.latitude == values['latitude'],
+        table.c.longitude == values['longitude'],
+        table.c.observed_at == values['observed_at'],
+    )).scalar()
+
+
+def link_observations(rows):
+    """``rows`` as temperature_reading rows, with outside temperatures replaced by observation links.
+
+    Rows that already carry a ``weather_observation_id`` keep it. Rows with
+    only inline outside temperatures (e.g. synthetic data) get one
+    location-less observation per distinct timestamp and value.
+    """
+    table = WeatherObservation.__table__
+    inline = {}
+    for row in rows:
+        if row.get('weather_observation_id') is None and row.get('outside_temperature_c') is not None:
+            inline.setdefault((row['timestamp'], row['outside_temperature_c'], row.get('outside_temperature_f')))
+    if inline:
+        keys = list(inline)
+        ids = db.session.execute(
+            insert(table).returning(table.c.id, sort_by_parameter_order=True),
+            [
+                {'observed_at': timestamp, 'fetched_at': timestamp, 'temperature_c': c, 'temperature_f': f}
+                for timestamp, c, f in keys
+            ],
+        ).scalars().all()
+        inline = dict(zip(keys, ids))
+
+    linked = []
+    for row in rows:
+        observation_id = row.get('weather_observation_id')
+        if observation_id is None and row.get('outside_temperature_c') is not None:
+            observation_id = inline[(row['timestamp'], row['outside_temperature_c'], row.get('outside_temperature_f'))]
+        reading = {name: value for name, value in row.items() if name not in OUTSIDE_FIELDS}
+        reading['weather_observation_id'] = observation_id
+        linked.append(reading)
+    return linked
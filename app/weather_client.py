@@ -1,22 +1,42 @@
+import logging
 import os
 import requests
 from datetime import datetime
+from app.http_client import http_client
+from app.weather import location_key, observation_cache
+
+logger = logging.getLogger(__name__)
 
 class WeatherClient:
-    def __init__(self):
-        self.api_key = os.getenv('OPENWEATHER_API_KEY')
-        self.lat = os.getenv('LOCATION_LAT')
-        self.lon = os.getenv('LOCATION_LON')
-        self.base_url = "https://api.openweathermap.org/data/2.5/weather"
+    def __init__(self, api_key=None, lat=None, lon=None):
+        self.api_key = api_key or os.getenv('OPENWEATHER_API_KEY')
+        self.lat = lat if lat is not None else os.getenv('LOCATION_LAT')
+        self.lon = lon if lon is not None else os.getenv('LOCATION_LON')
+        self.base_url = os.getenv('OPENWEATHER_URL', "https://api.openweathermap.org/data/2.5/weather")
+    
+    @classmethod
+    def for_site(cls, site):
+        return cls(api_key=site.weather_api_key, lat=site.lat, lon=site.lon)
+    
+    @property
+    def location(self):
+        return location_key(self.lat, self.lon)
+    
+    def get_observation(self):
+        """Current weather, shared with every client at the same rounded location for the cache TTL"""
+        location = self.location
+        if location is None:
+            return self.get_current_weather()
+        return observation_cache.get(location, self.get_current_weather)
     
     def get_current_weather(self):
         """Fetch current weather data from OpenWeatherMap API"""
         if not self.api_key or self.api_key == 'YOUR_API_KEY_HERE':
-            print("OpenWeatherMap API key not configured")
+            logger.warning("OpenWeatherMap API key not configured")
             return None
         
         if not self.lat or not self.lon or self.lat == 'YOUR_LATITUDE' or self.lon == 'YOUR_LONGITUDE':
-            print("Location coordinates not configured")
+            logger.warning("Location coordinates not configured")
             return None
         
         try:
@@ -27,11 +47,14 @@ class WeatherClient:
                 'units': 'metric'  # Get temperature in Celsius
             }
             
-            response = requests.get(self.base_url, params=params, timeout=10)
+            response = http_client.get(self.base_url, 'openweathermap.weather', params=params)
             
             if response.status_code == 200:
                 data = response.json()
+                fetched_at = datetime.utcnow()
                 return {
+                    'observed_at': datetime.utcfromtimestamp(data['dt']) if 'dt' in data else fetched_at,
+                    'fetched_at': fetched_at,
                     'temperature_c': data['main']['temp'],
                     'temperature_f': data['main']['temp'] * 9/5 + 32,
                     'description': data['weather'][0]['description'],
@@ -39,13 +62,13 @@ class WeatherClient:
                     'wind_speed': data['wind']['speed']
                 }
             else:
-                print(f"Failed to get weather data: {response.status_code}")
-                print(f"Error response: {response.text}")
+                logger.warning("Failed to get weather data",
+                               extra={'status': response.status_code, 'response': response.text[:500]})
                 return None
                 
         except requests.RequestException as e:
-            print(f"Error fetching weather data: {e}")
+            logger.warning("Error fetching weather data: %s", e)
             return None
-        except Exception as e:
-            print(f"Unexpected error: {e}")
+        except Exception:
+            logger.exception("Unexpected error fetching weather data")
             return None
\ No newline at end of file
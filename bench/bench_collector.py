@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+"""Benchmark collection cycles against stub Nest and OpenWeatherMap servers.
+
+Reports Nest API calls and wall time per cycle for several device counts,
+next to the 1 + N calls of fetching every device individually, and the
+OpenWeatherMap calls left after the weather observation cache.
+
+Usage: python bench/bench_collector.py [--devices 1,4,16] [--delay 0.05] [--cycles 3]
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stub_servers import StubApiServer
+
+
+def run(devices, delay, cycles, devices_without_traits):
+    server = StubApiServer(devices=devices, delay=delay, devices_without_traits=devices_without_traits).start()
+    os.environ.update(server.environ())
+
+    from app import create_app
+    from app.collector import Collector
+    from app.weather import observation_cache
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        with contextlib.redirect_stdout(io.StringIO()):
+            collector = Collector(app=create_app(use_spool=True), interval=300, jitter=0)
+            for client, _ in collector.clients.values():
+                client.get_access_token()
+            server.calls.clear()
+            observation_cache.clear()
+            timings = []
+            for _ in range(cycles):
+                started = time.perf_counter()
+                collector.run_cycle()
+                timings.append(time.perf_counter() - started)
+
+    server.stop()
+    nest_calls = server.calls['devices.list'] + server.calls['devices.get']
+    return nest_calls / cycles, server.calls['weather'] / cycles, sum(timings) / cycles
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--devices', default='1,4,16')
+    parser.add_argument('--delay', type=float, default=0.05, help='stub API latency in seconds')
+    parser.add_argument('--cycles', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'devices':>7} {'missing traits':>14} {'Nest calls/cycle':>16} {'1+N baseline':>12} "
+          f"{'weather/cycle':>13} {'cycle (s)':>9}")
+    for devices in (int(d) for d in args.devices.split(',')):
+        for missing in sorted({0, devices // 4}):
+            calls, weather, seconds = run(devices, args.delay, args.cycles, missing)
+            print(f"{devices:>7} {missing:>14} {calls:>16.1f} {1 + devices:>12} {weather:>13.1f} {seconds:>9.3f}")
+
+
+if __name__ == '__main__':
+    main()
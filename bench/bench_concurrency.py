@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+"""Benchmark dashboard read latency while a collector process is writing.
+
+Reader processes run the /api/statistics and /api/temperatures queries in a
+loop while a writer process commits batches of readings, first with
+SQLite's defaults (rollback journal, synchronous=FULL) and then with the
+settings from app/database.py. Reports p50/p99/max read latency and
+"database is locked" errors.
+
+Usage: python bench/bench_concurrency.py [--rows 200000] [--readers 4] [--seconds 10]
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+from app.database import configure_sqlite, sqlite_settings_from_env
+from bench_indexes import QUERIES, load_rows
+
+DEFAULT_SETTINGS = {'journal_mode': 'DELETE', 'busy_timeout': 5000, 'synchronous': 'FULL', 'mmap_size': 0}
+
+READ_QUERIES = [QUERIES['/api/statistics?hours=24'], QUERIES['/api/temperatures?hours=24']]
+
+INSERT = text(
+    "INSERT INTO temperature_reading (timestamp, device_name, temperature_c, temperature_f, "
+    "humidity, hvac_state) VALUES (:timestamp, :device_name, :temperature_c, :temperature_f, "
+    ":humidity, :hvac_state)"
+)
+
+
+def make_engine(path, settings):
+    engine = create_engine(f'sqlite:///{path}')
+    configure_sqlite(engine, settings)
+    return engine
+
+
+def reader(path, settings, seconds, since, results):
+    engine = make_engine(path, settings)
+    latencies = []
+    errors = 0
+    deadline = time.monotonic() + seconds
+    with engine.connect() as conn:
+        while time.monotonic() < deadline:
+            sql = text(random.choice(READ_QUERIES))
+            started = time.perf_counter()
+            try:
+                conn.execute(sql, {'since': since}).fetchall()
+                conn.commit()
+            except OperationalError:
+                conn.rollback()
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - started)
+    results.put((latencies, errors))
+
+
+def writer(path, settings, seconds, batch, interval, results):
+    engine = make_engine(path, settings)
+    cycles = []
+    errors = 0
+    next_cycle = time.monotonic()
+    deadline = next_cycle + seconds
+    while next_cycle < deadline:
+        now = datetime.utcnow()
+        rows = [
+            {'timestamp': now, 'device_name': f'Thermostat {i % 4}', 'temperature_c': 20.0,
+             'temperature_f': 68.0, 'humidity': 40.0, 'hvac_state': 'OFF'}
+            for i in range(batch)
+        ]
+        started = time.perf_counter()
+        try:
+            with engine.begin() as conn:
+                conn.execute(INSERT, rows)
+            cycles.append(time.perf_counter() - started)
+        except OperationalError:
+            errors += 1
+        # Fixed schedule, so both settings write the same number of rows
+        next_cycle += interval
+        time.sleep(max(0, next_cycle - time.monotonic()))
+    results.put((cycles, errors))
+
+
+def percentile(values, pct):
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def run(seed, path, settings, args, since):
+    shutil.copy(seed, path)
+    results = multiprocessing.Queue()
+    write_results = multiprocessing.Queue()
+    # Apply the journal mode once up front; it persists in the database file
+    make_engine(path, settings).connect().close()
+
+    processes = [
+        multiprocessing.Process(target=reader, args=(path, settings, args.seconds, since, results))
+        for _ in range(args.readers)
+    ]
+    processes.append(multiprocessing.Process(
+        target=writer, args=(path, settings, args.seconds, args.batch, args.interval, write_results)
+    ))
+    for p in processes:
+        p.start()
+
+    latencies, read_errors = [], 0
+    for _ in range(args.readers):
+        batch, errors = results.get()
+        latencies.extend(batch)
+        read_errors += errors
+    cycles, write_errors = write_results.get()
+    for p in processes:
+        p.join()
+
+    return {
+        'reads': len(latencies),
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'max_ms': max(latencies, default=float('nan')) * 1000,
+        'read_errors': read_errors,
+        'write_cycles': len(cycles),
+        'write_p50_ms': percentile(cycles, 50) * 1000,
+        'write_errors': write_errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--batch', type=int, default=500, help='readings per write cycle')
+    parser.add_argument('--interval', type=float, default=0.1, help='seconds between write cycle starts')
+    args = parser.parse_args()
+
+    now = datetime.utcnow()
+    since = now - timedelta(hours=24)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        seed = os.path.join(tmp, 'seed.db')
+        load_rows(seed, args.rows, 4, now)
+        engine = create_engine(f'sqlite:///{seed}')
+        with engine.begin() as conn:
+            conn.execute(text(
+                "CREATE INDEX ix_temperature_reading_timestamp_device "
+                "ON temperature_reading (timestamp, device_name)"
+            ))
+        engine.dispose()
+
+        print(f"{args.rows:,} rows, {args.readers} readers, writer commits {args.batch} rows "
+              f"every {args.interval}s for {args.seconds}s")
+        print(f"{'settings':<10} {'reads':>7} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8} "
+              f"{'locked':>7} {'writes':>7} {'write p50 ms':>13} {'w locked':>9}")
+        for name, settings in (('default', DEFAULT_SETTINGS), ('tuned', sqlite_settings_from_env())):
+            r = run(seed, os.path.join(tmp, f'{name}.db'), settings, args, since)
+            print(f"{name:<10} {r['reads']:>7} {r['p50_ms']:>8.2f} {r['p99_ms']:>8.2f} {r['max_ms']:>8.2f} "
+                  f"{r['read_errors']:>7} {r['write_cycles']:>7} {r['write_p50_ms']:>13.2f} "
+                  f"{r['write_errors']:>9}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+"""Compare /api/export with the JSON /api/temperatures endpoint for a year of readings.
+
+Fills a throwaway database with a year of 5-minute readings, then fetches
+the whole year through /api/temperatures (raw resolution) and through
+/api/export in each format and compression. Reports bytes on the wire and
+the time to produce and read the full response.
+
+Usage: python bench/bench_export.py [--days 365] [--devices 4]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_storage import day_rows
+
+EXPORTS = (
+    ('csv', None), ('csv', 'gzip'), ('csv', 'zstd'),
+    ('parquet', None), ('parquet', 'zstd'),
+    ('arrow', None), ('arrow', 'zstd'),
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--devices', type=int, default=4)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        # Measure the work, not the response cache
+        os.environ['RESPONSE_CACHE_TTL'] = '0'
+
+        from app import create_app, db
+        from app.export import missing_dependency
+        from app.storage import storage
+
+        app = create_app()
+        today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+        with app.app_context():
+            random.seed(0)
+            for day in range(args.days, 0, -1):
+                storage.write(day_rows(today - timedelta(days=day), args.devices))
+                db.session.commit()
+
+        start = (today - timedelta(days=args.days)).isoformat()
+        hours = args.days * 24 + 24
+        requests = [('json', None, f'/api/temperatures?hours={hours}&resolution=raw')]
+        for fmt, compression in EXPORTS:
+            missing = missing_dependency(fmt, compression)
+            if missing:
+                print(f"skipping {fmt}/{compression}: {missing} is not installed")
+                continue
+            url = f'/api/export?from={start}&format={fmt}'
+            requests.append((fmt, compression, url + (f'&compression={compression}' if compression else '')))
+
+        client = app.test_client()
+        rows = args.days * 288 * args.devices
+        print(f"{args.days} days, {args.devices} devices, {rows:,} readings\n")
+        print(f"{'format':<10} {'compression':<12} {'MiB':>8} {'seconds':>8} {'vs json':>8}")
+        baseline = None
+        for fmt, compression, url in requests:
+            started = time.perf_counter()
+            response = client.get(url)
+            size = len(response.get_data())
+            seconds = time.perf_counter() - started
+            assert response.status_code == 200, (url, response.status_code)
+            baseline = baseline or size
+            print(f"{fmt:<10} {compression or '-':<12} {size / 2 ** 20:>8.1f} {seconds:>8.2f} {baseline / size:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
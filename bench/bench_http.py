@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+"""Exercise the shared HTTP client against a local stub API server.
+
+Checks that 503s and 429s are retried with backoff, that a hanging endpoint
+is cut off by its timeout, and that a dependency that keeps failing trips
+its circuit breaker, is skipped during the cooldown and recovers afterwards.
+Then reports per-call latency with pooled keep-alive connections against a
+new connection per call, and the latency histograms that were recorded.
+
+Usage: python bench/bench_http.py [--calls 200] [--delay 0.0]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests
+from stub_servers import StubApiServer
+
+
+def check(label, condition):
+    print(f"{'PASS' if condition else 'FAIL'}  {label}")
+    return condition
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--calls', type=int, default=200)
+    parser.add_argument('--delay', type=float, default=0.0, help='stub API latency in seconds')
+    args = parser.parse_args()
+
+    from app.http_client import CircuitOpenError, HttpClient
+
+    server = StubApiServer(delay=args.delay).start()
+    url = f'{server.url}/weather'
+    client = HttpClient(retries=3, backoff_base=0.05, failure_threshold=2, cooldown=1)
+    ok = True
+
+    server.fail('weather', 503, times=2)
+    response = client.get(url, 'openweathermap.weather')
+    stats = client.stats()['endpoints']['openweathermap.weather']
+    ok &= check(f"two 503s then 200 -> {response.status_code} after {stats['retries']} retries",
+                response.status_code == 200 and stats['retries'] == 2)
+
+    server.fail('weather', 429, times=1)
+    response = client.get(url, 'openweathermap.weather')
+    ok &= check(f"429 is retried -> {response.status_code}", response.status_code == 200)
+
+    hanging = StubApiServer(delay=2).start()
+    timeouts = HttpClient(retries=1, backoff_base=0.01, timeouts={'sdm': 0.2})
+    started = time.perf_counter()
+    try:
+        timeouts.get(f'{hanging.url}/weather', 'sdm.devices.list')
+        timed_out = False
+    except requests.Timeout:
+        timed_out = True
+    elapsed = time.perf_counter() - started
+    ok &= check(f"hanging endpoint gives up after 2 x 0.2s timeout ({elapsed:.2f}s)", timed_out and elapsed < 1)
+    hanging.stop()
+
+    server.fail('weather', 503, times=100)
+    for _ in range(2):
+        response = client.get(url, 'openweathermap.weather')
+    calls = server.calls['weather']
+    try:
+        client.get(url, 'openweathermap.weather')
+        skipped = False
+    except CircuitOpenError:
+        skipped = True
+    breaker = client.stats()['breakers']['openweathermap']
+    ok &= check(f"2 failed calls open the breaker ({breaker['state']}), next call skipped without a request",
+                skipped and breaker['state'] == 'open' and server.calls['weather'] == calls)
+
+    server.failures.clear()
+    time.sleep(1.1)
+    response = client.get(url, 'openweathermap.weather')
+    breaker = client.stats()['breakers']['openweathermap']
+    ok &= check(f"trial call after the cooldown closes it ({breaker['state']})",
+                response.status_code == 200 and breaker['state'] == 'closed')
+
+    pooled = HttpClient()
+    started = time.perf_counter()
+    for _ in range(args.calls):
+        pooled.get(url, 'openweathermap.weather')
+    keep_alive = (time.perf_counter() - started) / args.calls
+    started = time.perf_counter()
+    for _ in range(args.calls):
+        requests.get(url, timeout=10)
+    fresh = (time.perf_counter() - started) / args.calls
+    print(f"per-call latency: pooled {keep_alive * 1000:.2f}ms, new connection {fresh * 1000:.2f}ms")
+    print(f"histograms: {client.summary()}")
+
+    server.stop()
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+"""Benchmark read-query latency on temperature_reading before and after the
+v002 indexes.
+
+Usage: python bench/bench_indexes.py [--rows 1000000,10000000] [--devices 2]
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine
+from app.migrations import v002_reading_indexes
+
+SCHEMA = (
+    "CREATE TABLE temperature_reading ("
+    "id INTEGER PRIMARY KEY, timestamp DATETIME NOT NULL, device_name VARCHAR(100) NOT NULL, "
+    "temperature_c FLOAT NOT NULL, temperature_f FLOAT NOT NULL, humidity FLOAT, "
+    "target_temperature_c FLOAT, target_temperature_f FLOAT, hvac_mode VARCHAR(50), "
+    "hvac_state VARCHAR(50), outside_temperature_c FLOAT, outside_temperature_f FLOAT)"
+)
+
+# The SQL that app/routes.py issues through the ORM
+QUERIES = {
+    '/api/temperatures?hours=24': (
+        "SELECT * FROM temperature_reading WHERE timestamp >= :since ORDER BY timestamp"
+    ),
+    '/api/statistics?hours=24': (
+        "SELECT AVG(temperature_c), MIN(temperature_c), MAX(temperature_c), AVG(humidity), "
+        "AVG(outside_temperature_c), MIN(outside_temperature_c), MAX(outside_temperature_c) "
+        "FROM temperature_reading WHERE timestamp >= :since"
+    ),
+    '/api/current': (
+        "SELECT * FROM temperature_reading ORDER BY timestamp DESC LIMIT 1"
+    ),
+}
+
+
+def load_rows(path, rows, devices, now):
+    conn = sqlite3.connect(path)
+    conn.execute(SCHEMA)
+    per_device = rows // devices
+    start = now - timedelta(minutes=5 * per_device)
+
+    def generate():
+        for i in range(per_device):
+            ts = (start + timedelta(minutes=5 * i)).strftime('%Y-%m-%d %H:%M:%S.%f')
+            for d in range(devices):
+                temp = 20 + random.uniform(-2, 2)
+                outside = 5 + random.uniform(-10, 10)
+                yield (ts, f'Thermostat {d}', temp, temp * 9 / 5 + 32, random.uniform(30, 60),
+                       21.0, 69.8, 'HEAT', random.choice(('OFF', 'HEATING')),
+                       outside, outside * 9 / 5 + 32)
+
+    conn.executemany(
+        "INSERT INTO temperature_reading (timestamp, device_name, temperature_c, temperature_f, "
+        "humidity, target_temperature_c, target_temperature_f, hvac_mode, hvac_state, "
+        "outside_temperature_c, outside_temperature_f) VALUES (?,?,?,?,?,?,?,?,?,?,?)",
+        generate(),
+    )
+    conn.commit()
+    conn.close()
+
+
+def time_queries(path, since, repeat):
+    conn = sqlite3.connect(path)
+    results = {}
+    for name, sql in QUERIES.items():
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            conn.execute(sql, {'since': since}).fetchall()
+            timings.append(time.perf_counter() - started)
+        plan = conn.execute(f"EXPLAIN QUERY PLAN {sql}", {'since': since}).fetchall()
+        results[name] = (sorted(timings)[len(timings) // 2], plan[-1][-1])
+    conn.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', default='1000000,10000000')
+    parser.add_argument('--devices', type=int, default=2)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    now = datetime.utcnow()
+    since = (now - timedelta(hours=24)).strftime('%Y-%m-%d %H:%M:%S.%f')
+
+    for rows in (int(r) for r in args.rows.split(',')):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'bench.db')
+            print(f"\nLoading {rows:,} rows across {args.devices} devices...")
+            load_rows(path, rows, args.devices, now)
+
+            before = time_queries(path, since, args.repeat)
+
+            engine = create_engine(f'sqlite:///{path}')
+            with engine.begin() as conn:
+                v002_reading_indexes.upgrade(conn)
+            engine.dispose()
+
+            after = time_queries(path, since, args.repeat)
+
+            print(f"{'query':<30} {'before (ms)':>12} {'after (ms)':>12} {'speedup':>9}  plan after")
+            for name in QUERIES:
+                b, _ = before[name]
+                a, plan = after[name]
+                print(f"{name:<30} {b * 1000:>12.2f} {a * 1000:>12.2f} {b / a:>8.0f}x  {plan}")
+
+
+if __name__ == '__main__':
+    main()
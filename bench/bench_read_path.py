@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+"""Benchmark rows/sec of the ORM read path against the column-tuple fast path.
+
+Usage: python bench/bench_read_path.py [--rows 200000] [--devices 2]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_indexes import load_rows
+
+CHART_FIELDS = (
+    'timestamp', 'temperature_c', 'outside_temperature_c', 'target_temperature_c',
+    'humidity', 'hvac_state'
+)
+
+
+def best_of(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        payload = fn()
+        timings.append(time.perf_counter() - started)
+    return min(timings), len(payload)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--devices', type=int, default=2)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        now = datetime.utcnow()
+        load_rows(path, args.rows, args.devices, now)
+        os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+
+        from flask import jsonify
+        from app import create_app
+        from app.models import TemperatureReading
+        from app.queries import READING_FIELDS, as_columns, as_records, select_readings
+        from app.serialization import dumps
+
+        app = create_app()
+        since = now - timedelta(days=3650)
+
+        def orm_path():
+            readings = TemperatureReading.query.filter(
+                TemperatureReading.timestamp >= since
+            ).order_by(TemperatureReading.timestamp).all()
+            return jsonify([r.to_dict() for r in readings]).get_data()
+
+        def tuple_rows():
+            rows = select_readings(since, READING_FIELDS).all()
+            return dumps(as_records(rows, READING_FIELDS))
+
+        def tuple_columnar():
+            rows = select_readings(since, READING_FIELDS).all()
+            return dumps(as_columns(rows, READING_FIELDS))
+
+        def chart_columnar():
+            rows = select_readings(since, CHART_FIELDS).all()
+            return dumps(as_columns(rows, CHART_FIELDS))
+
+        paths = [
+            ('ORM + to_dict + jsonify', orm_path),
+            ('tuples + orjson (rows)', tuple_rows),
+            ('tuples + orjson (columnar)', tuple_columnar),
+            ('chart fields (columnar)', chart_columnar),
+        ]
+
+        print(f"{args.rows:,} rows across {args.devices} devices")
+        print(f"{'path':<30} {'seconds':>8} {'rows/sec':>12} {'bytes':>12}")
+        with app.app_context():
+            for name, fn in paths:
+                seconds, size = best_of(fn, args.repeat)
+                print(f"{name:<30} {seconds:>8.3f} {args.rows / seconds:>12,.0f} {size:>12,}")
+
+
+if __name__ == '__main__':
+    main()
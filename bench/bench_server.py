@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+"""Load test the web app under Flask's development server and gunicorn.
+
+Builds a throwaway database with a week of readings, then for each serving
+mode starts the server on a local port and has client processes hit
+/api/current and /api/temperatures?hours=168 over keep-alive connections.
+Reports requests/sec and p50/p99 latency per endpoint. The response cache
+is disabled unless --cache is given, so every request does the real work.
+
+Usage: python bench/bench_server.py [--workers 1,4] [--threads 8] [--clients 8] [--seconds 10]
+"""
+import argparse
+import http.client
+import multiprocessing
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+from bench_storage import day_rows
+
+ENDPOINTS = ('/api/current', '/api/temperatures?hours=168')
+
+DEV_SERVER = "from wsgi import app; app.run(host='127.0.0.1', port={port}, threaded=True)"
+
+
+def populate(env, days, devices):
+    os.environ.update(env)
+    from app import create_app, db
+    from app.cache import bump_generation
+    from app.storage import storage
+
+    app = create_app()
+    with app.app_context():
+        random.seed(0)
+        today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+        for day in range(days, -1, -1):
+            storage.write(day_rows(today - timedelta(days=day), devices))
+            bump_generation()
+            db.session.commit()
+
+
+def wait_for(port, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with {process.returncode}")
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+            conn.request('GET', '/health')
+            conn.getresponse().read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError('Server did not start')
+
+
+def client(port, path, seconds, results):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    latencies = []
+    errors = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        started = time.perf_counter()
+        try:
+            conn.request('GET', path)
+            response = conn.getresponse()
+            response.read()
+            if response.status != 200:
+                errors += 1
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            errors += 1
+            continue
+        latencies.append(time.perf_counter() - started)
+    results.put((path, latencies, errors))
+
+
+def load(port, args):
+    """Split the clients evenly between the endpoints; returns per-endpoint results"""
+    results = multiprocessing.Queue()
+    clients = [
+        multiprocessing.Process(target=client, args=(port, ENDPOINTS[i % len(ENDPOINTS)], args.seconds, results))
+        for i in range(args.clients)
+    ]
+    for c in clients:
+        c.start()
+    collected = [results.get() for _ in clients]
+    for c in clients:
+        c.join()
+
+    summary = {}
+    for path in ENDPOINTS:
+        latencies = sorted(l for p, ls, _ in collected if p == path for l in ls)
+        errors = sum(e for p, _, e in collected if p == path)
+        if not latencies:
+            summary[path] = (0, None, None, errors)
+            continue
+        summary[path] = (
+            len(latencies) / args.seconds,
+            latencies[len(latencies) // 2] * 1000,
+            latencies[int(len(latencies) * 0.99)] * 1000,
+            errors,
+        )
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', default='1,4', help='comma-separated gunicorn worker counts')
+    parser.add_argument('--threads', type=int, default=8, help='threads per gunicorn worker')
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--days', type=int, default=7)
+    parser.add_argument('--devices', type=int, default=4)
+    parser.add_argument('--port', type=int, default=5099)
+    parser.add_argument('--cache', action='store_true', help='keep the response cache enabled')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = {
+            'DATABASE_URL': f"sqlite:///{os.path.join(tmp, 'bench.db')}",
+            'RESPONSE_CACHE_TTL': os.getenv('RESPONSE_CACHE_TTL', '300') if args.cache else '0',
+        }
+        # Populate in a child so this process doesn't hold the database open
+        populate_process = multiprocessing.Process(target=populate, args=(env, args.days, args.devices))
+        populate_process.start()
+        populate_process.join()
+
+        modes = [('flask dev server', [sys.executable, '-c', DEV_SERVER.format(port=args.port)], {})]
+        for workers in (int(w) for w in args.workers.split(',')):
+            modes.append((
+                f'gunicorn {workers}x{args.threads}',
+                [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'wsgi:app'],
+                {'WEB_BIND': f'127.0.0.1:{args.port}', 'WEB_WORKERS': str(workers), 'WEB_THREADS': str(args.threads)},
+            ))
+
+        print(f"{args.days} days, {args.devices} devices, {args.clients} clients, "
+              f"response cache {'on' if args.cache else 'off'}")
+        print(f"\n{'mode':<20} {'endpoint':<28} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+        for label, command, extra_env in modes:
+            process = subprocess.Popen(
+                command, cwd=ROOT, env={**os.environ, **env, **extra_env},
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            )
+            try:
+                wait_for(args.port, process)
+                summary = load(args.port, args)
+            finally:
+                process.terminate()
+                process.wait()
+            for path, (rps, p50, p99, errors) in summary.items():
+                p50 = f'{p50:.1f}' if p50 is not None else '-'
+                p99 = f'{p99:.1f}' if p99 is not None else '-'
+                print(f"{label:<20} {path:<28} {rps:>8.1f} {p50:>8} {p99:>8} {errors:>7}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+"""Compare /api/statistics aggregates from the storage backend and the in-memory engine.
+
+Fills a throwaway database with a week of 5-minute readings, warms the
+statistics engine, then for each dashboard window times the backend's
+``statistics`` against ``stats_engine.statistics``, checks that the
+aggregates agree and reports how far the p5/p95 estimates are from the
+exact percentiles. Also times a warm-up and catching up with one
+collection cycle.
+
+Usage: python bench/bench_statistics.py [--devices 4] [--backend sql]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_storage import day_rows, median_ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--devices', type=int, default=4)
+    parser.add_argument('--days', type=int, default=8)
+    parser.add_argument('--backend', default='sql', choices=('sql', 'columnar'))
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        os.environ['STORAGE_BACKEND'] = args.backend
+        os.environ['COLUMNAR_STORAGE_PATH'] = os.path.join(tmp, 'columnar')
+
+        import numpy as np
+        from app import create_app, db
+        from app.cache import bump_generation
+        from app.stats_engine import PERCENTILES, WINDOWS, stats_engine
+        from app.storage import storage
+
+        app = create_app()
+        with app.app_context():
+            random.seed(0)
+            today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+            for day in range(args.days, 0, -1):
+                storage.write(day_rows(today - timedelta(days=day), args.devices))
+                bump_generation()
+                db.session.commit()
+            now = today
+
+            started = time.perf_counter()
+            stats_engine.warm(now)
+            print(f"warm-up: {(time.perf_counter() - started) * 1000:.1f} ms "
+                  f"({args.days} days, {args.devices} devices, {args.backend} backend)")
+
+            print(f"\n{'window':<8} {'storage ms':>11} {'engine ms':>10} {'match':>6} {'p5 err':>7} {'p95 err':>8}")
+            for hours in WINDOWS:
+                since = now - timedelta(hours=hours)
+                expected = storage.statistics(since)
+                actual = stats_engine.statistics(hours, now)
+                match = all(
+                    (v is None and actual[k] is None) or abs(v - actual[k]) < 1e-6 for k, v in expected.items()
+                )
+                temps = [r.temperature_c for r in storage.readings(since, ('temperature_c',))]
+                exact = np.percentile(temps, PERCENTILES)
+                errors = [abs(actual[f'p{p}_temp'] - e) for p, e in zip(PERCENTILES, exact)]
+                storage_ms = median_ms(lambda: storage.statistics(since), args.repeat)
+                engine_ms = median_ms(lambda: stats_engine.statistics(hours, now), args.repeat)
+                print(f"{hours:<8} {storage_ms:>11.3f} {engine_ms:>10.3f} {str(match):>6} "
+                      f"{errors[0]:>7.3f} {errors[1]:>8.3f}")
+
+            # One collection cycle: a new reading per device
+            rows = [dict(r, timestamp=now + timedelta(seconds=1)) for r in day_rows(now, args.devices)[:args.devices]]
+            storage.write(rows)
+            bump_generation()
+            db.session.commit()
+            started = time.perf_counter()
+            stats_engine.statistics(24, now + timedelta(seconds=1))
+            print(f"\ncatch up with one cycle: {(time.perf_counter() - started) * 1000:.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
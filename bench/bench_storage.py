@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+"""Compare the sql and columnar storage backends on multi-year histories.
+
+Writes the same synthetic 5-minute readings through each backend's
+``write`` one day at a time, then times range queries, window statistics
+and the latest reading, and reports the on-disk size.
+
+Usage: python bench/bench_storage.py [--years 1,3] [--devices 4]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_read_path import CHART_FIELDS
+
+READINGS_PER_DAY = 288
+
+
+def day_rows(day_start, devices):
+    rows = []
+    for i in range(READINGS_PER_DAY):
+        timestamp = day_start + timedelta(minutes=5 * i)
+        outside = 5 + random.uniform(-10, 10)
+        for d in range(devices):
+            temp = 20 + random.uniform(-2, 2)
+            rows.append({
+                'timestamp': timestamp, 'device_name': f'Thermostat {d}',
+                'temperature_c': temp, 'temperature_f': temp * 9 / 5 + 32,
+                'humidity': random.uniform(30, 60), 'target_temperature_c': 21.0,
+                'target_temperature_f': 69.8, 'hvac_mode': 'HEAT',
+                'hvac_state': random.choice(('OFF', 'HEATING')),
+                'outside_temperature_c': outside, 'outside_temperature_f': outside * 9 / 5 + 32,
+            })
+    return rows
+
+
+def median_ms(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return sorted(timings)[len(timings) // 2] * 1000
+
+
+def disk_size(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(d, f)) for d, _, files in os.walk(path) for f in files)
+
+
+def run(store, commit, days, args, now, size_path):
+    start = now - timedelta(days=days)
+    started = time.perf_counter()
+    for day in range(days):
+        store.write(day_rows(start + timedelta(days=day), args.devices))
+        commit()
+    write_seconds = time.perf_counter() - started
+
+    from app.queries import READING_FIELDS
+    results = {'write rows/s': days * READINGS_PER_DAY * args.devices / write_seconds}
+    windows = (('24h', timedelta(hours=24)), ('30d', timedelta(days=30)), ('1y', timedelta(days=365)))
+    for label, window in windows:
+        fields = READING_FIELDS if label == '24h' else CHART_FIELDS
+        results[f'range {label} ms'] = median_ms(lambda: list(store.readings(now - window, fields)), args.repeat)
+    for label, window in windows + (('all', timedelta(days=days + 1)),):
+        results[f'stats {label} ms'] = median_ms(lambda: store.statistics(now - window), args.repeat)
+    results['latest ms'] = median_ms(lambda: store.latest(READING_FIELDS), args.repeat)
+    results['disk MiB'] = disk_size(size_path) / 2 ** 20
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--years', default='1,3', help='comma-separated history lengths')
+    parser.add_argument('--devices', type=int, default=4)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    now = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+
+    for years in (float(y) for y in args.years.split(',')):
+        days = int(years * 365)
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = os.path.join(tmp, 'bench.db')
+            os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+
+            from app import create_app, db
+            from app.storage import ColumnarStore, SqlStore
+
+            app = create_app()
+            with app.app_context():
+                sql = run(SqlStore(), db.session.commit, days, args, now, db_path)
+                db.session.remove()
+                db.engine.dispose()
+            columnar_path = os.path.join(tmp, 'columnar')
+            columnar = run(ColumnarStore(columnar_path), lambda: None, days, args, now, columnar_path)
+
+        rows = days * READINGS_PER_DAY * args.devices
+        print(f"\n{years:g} years, {args.devices} devices, {rows:,} readings")
+        print(f"{'':<16} {'sql':>10} {'columnar':>10}")
+        for name in sql:
+            print(f"{name:<16} {sql[name]:>10.1f} {columnar[name]:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,291 @@
+#!/usr/bin/env python
+"""Repeatable benchmark suite with JSON results for comparing commits.
+
+Loads a throwaway database with synthetic readings (``bench/synthetic.py``)
+and times four groups of benchmarks, each after a warm-up run:
+
+- ``endpoints``: the read endpoints through Flask's test client, with the
+  response cache disabled so every request does the real work (the
+  analytics bucket cache stays on, so ``/api/analytics`` is the warm path)
+- ``queries``: storage, rollup and analytics queries behind those endpoints
+- ``serialization``: JSON shapes and export encoders over in-memory rows
+- ``collector``: collection cycles and spool replay against the stub Nest
+  and OpenWeatherMap servers
+
+A summary table goes to stderr. The results are JSON on stdout (or
+``--output``), along with the commit, Python and SQLite versions and
+the parameters. ``--compare`` takes the JSON from an earlier run and
+reports the median ratio per benchmark. The exit status is 1 when any
+benchmark is slower than ``--threshold`` times its baseline.
+
+Usage: python bench/bench_suite.py [--days 365] [--devices 4] [--repeat 15] [--groups endpoints,queries]
+           [--output results.json] [--compare baseline.json] [--threshold 1.25]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+GROUPS = ('endpoints', 'queries', 'serialization', 'collector')
+
+ENDPOINTS = (
+    '/api/current',
+    '/api/temperatures?hours=24',
+    '/api/temperatures?hours=24&shape=columnar',
+    '/api/temperatures?hours=24&stream=1',
+    '/api/temperatures?hours=168',
+    '/api/temperatures?hours=168&max_points=500',
+    '/api/temperatures?hours=720',
+    '/api/temperatures?hours=8760',
+    '/api/statistics?hours=24',
+    '/api/statistics?hours=168',
+    '/api/statistics?hours=720',
+    '/api/analytics?hours=24',
+    '/api/analytics?hours=720',
+    '/api/export?format=csv&from={month_ago}',
+    '/api/export?format=parquet&from={month_ago}',
+)
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True, text=True,
+                                check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=ROOT,
+                               capture_output=True, text=True, check=True).stdout.strip()
+        return commit + ('-dirty' if dirty else '')
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def measure(name, group, fn, repeat, **extra):
+    """Time ``fn`` ``repeat`` times after one warm-up call; ``fn`` returns a size (rows or bytes) or None"""
+    size = fn()
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    result = {
+        'name': name,
+        'group': group,
+        'iterations': repeat,
+        'median_ms': round(timings[len(timings) // 2] * 1000, 3),
+        'p95_ms': round(timings[min(len(timings) - 1, int(len(timings) * 0.95))] * 1000, 3),
+        'min_ms': round(timings[0] * 1000, 3),
+    }
+    if size is not None:
+        result['size'] = size
+    result.update(extra)
+    print(f"{group:<13} {name:<58} {result['median_ms']:>10.3f} {result['p95_ms']:>10.3f}", file=sys.stderr)
+    return result
+
+
+def endpoint_benchmarks(app, repeat):
+    client = app.test_client()
+    month_ago = (datetime.utcnow() - timedelta(days=30)).strftime('%Y-%m-%dT%H:%M:%S')
+
+    def request(path):
+        response = client.get(path)
+        body = response.get_data()
+        if response.status_code != 200:
+            raise RuntimeError(f"{path} returned {response.status_code}: {body[:200]!r}")
+        return len(body)
+
+    results = []
+    for path in ENDPOINTS:
+        if 'parquet' in path:
+            from app.export import missing_dependency
+            if missing_dependency('parquet'):
+                continue
+        url = path.format(month_ago=month_ago)
+        results.append(measure(path.replace('&from={month_ago}', ''), 'endpoints', lambda: request(url), repeat))
+    return results
+
+
+def query_benchmarks(app, repeat):
+    from app.analytics import analytics
+    from app.queries import READING_FIELDS
+    from app.rollups import DAY, HOUR, bucket_floor, rollup_history
+    from app.storage import storage
+
+    now = datetime.utcnow()
+    results = []
+    with app.app_context():
+        for hours in (24, 168, 720):
+            results.append(measure(
+                f'storage.readings({hours}h)', 'queries',
+                lambda: sum(1 for _ in storage.readings(now - timedelta(hours=hours), READING_FIELDS)), repeat))
+        for hours in (24, 720):
+            results.append(measure(
+                f'storage.statistics({hours}h)', 'queries',
+                lambda: storage.statistics(now - timedelta(hours=hours)) and None, repeat))
+        results.append(measure('storage.latest', 'queries', lambda: storage.latest(READING_FIELDS) and 1, repeat))
+        for label, resolution, days in (('hourly', HOUR, 30), ('daily', DAY, 365)):
+            results.append(measure(
+                f'rollup_history({label}, {days}d)', 'queries',
+                lambda: len(rollup_history(now - timedelta(days=days), resolution).all()), repeat))
+        hour = bucket_floor(now, HOUR)
+        for days in (1, 30):
+            # Every bucket from the readings, as on a cold analytics cache
+            results.append(measure(
+                f'analytics.compute({days}d)', 'queries',
+                lambda: len(analytics.compute(hour - timedelta(days=days), hour)[0]), repeat))
+    return results
+
+
+def serialization_benchmarks(app, repeat):
+    from app.export import export_chunks, missing_dependency
+    from app.queries import READING_FIELDS, shape_rows
+    from app.serialization import dumps
+    from app.storage import storage
+
+    with app.app_context():
+        week = list(storage.readings(datetime.utcnow() - timedelta(days=7), READING_FIELDS))
+    results = []
+    for shape in ('rows', 'columnar'):
+        results.append(measure(
+            f'shape_rows({shape}, 7d)', 'serialization',
+            lambda: len(shape_rows(week, READING_FIELDS, shape)), repeat, rows=len(week)))
+        payload = shape_rows(week, READING_FIELDS, shape)
+        results.append(measure(f'dumps({shape}, 7d)', 'serialization', lambda: len(dumps(payload)), repeat,
+                               rows=len(week)))
+    for fmt in ('csv', 'arrow', 'parquet'):
+        if missing_dependency(fmt):
+            continue
+        results.append(measure(
+            f'export_chunks({fmt}, 7d)', 'serialization',
+            lambda: sum(len(chunk) for chunk in export_chunks(iter(week), READING_FIELDS, fmt)), repeat,
+            rows=len(week)))
+    return results
+
+
+def collector_benchmarks(repeat, device_counts):
+    from stub_servers import StubApiServer
+
+    results = []
+    for devices in device_counts:
+        server = StubApiServer(devices=devices).start()
+        os.environ.update(server.environ())
+        with tempfile.TemporaryDirectory() as tmp:
+            os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tmp, 'collector.db')}"
+            os.environ.pop('SPOOL_PATH', None)
+            from app import create_app
+            from app.collector import Collector
+            from app.spool import spool_replayer
+            from app.weather import observation_cache
+
+            with contextlib.redirect_stdout(io.StringIO()):
+                app = create_app(use_spool=True)
+                collector = Collector(app=app, interval=300, jitter=0)
+
+                def cycle():
+                    # Every cycle fetches the weather, like one 10 minutes after the last
+                    observation_cache.clear()
+                    collector.run_cycle()
+
+                results.append(measure(f'collector.run_cycle({devices} devices)', 'collector', cycle, repeat))
+                results.append(measure(
+                    f'spool replay({devices} devices)', 'collector',
+                    lambda: (cycle(), spool_replayer.drain())[1], repeat,
+                    note='includes one collection cycle'))
+        server.stop()
+    return results
+
+
+def compare(results, baseline_path, threshold):
+    """Print median ratios against a baseline run; returns whether any benchmark regressed"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    previous = {(r['group'], r['name']): r for r in baseline['results']}
+    print(f"\nagainst {baseline_path} ({baseline['meta'].get('commit')}):", file=sys.stderr)
+    regressed = False
+    for result in results:
+        before = previous.get((result['group'], result['name']))
+        if before is None or not before['median_ms']:
+            continue
+        ratio = result['median_ms'] / before['median_ms']
+        flag = 'REGRESSION' if ratio > threshold else ('faster' if ratio < 1 / threshold else '')
+        regressed |= ratio > threshold
+        result['baseline_median_ms'] = before['median_ms']
+        result['ratio'] = round(ratio, 3)
+        print(f"{result['group']:<13} {result['name']:<58} {before['median_ms']:>10.3f} -> "
+              f"{result['median_ms']:>10.3f}  x{ratio:.2f} {flag}", file=sys.stderr)
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--devices', type=int, default=4)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=15)
+    parser.add_argument('--groups', default=','.join(GROUPS))
+    parser.add_argument('--collector-devices', default='4,16')
+    parser.add_argument('--output', help='write JSON here instead of stdout')
+    parser.add_argument('--compare', help='JSON from an earlier run to compare against')
+    parser.add_argument('--threshold', type=float, default=1.25, help='median ratio that counts as a regression')
+    args = parser.parse_args()
+    groups = [g for g in args.groups.split(',') if g]
+    unknown = set(groups) - set(GROUPS)
+    if unknown:
+        parser.error(f"Unknown groups: {', '.join(sorted(unknown))} (expected {', '.join(GROUPS)})")
+
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    os.environ['RESPONSE_CACHE_TTL'] = '0'
+    os.environ['COLLECTOR_METRICS_PORT'] = '0'
+    from app import create_app
+    import synthetic
+
+    meta = {
+        'commit': git_commit(),
+        'started_at': datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'params': vars(args),
+    }
+    print(f"{'group':<13} {'benchmark':<58} {'median ms':>10} {'p95 ms':>10}", file=sys.stderr)
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        if set(groups) & {'endpoints', 'queries', 'serialization'}:
+            os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tmp, 'synthetic.db')}"
+            os.environ['SPOOL_PATH'] = ''
+            app = create_app()
+            rows, seconds = synthetic.load(app, args.days, args.devices, args.seed)
+            meta['dataset'] = {'readings': rows, 'days': args.days, 'devices': args.devices,
+                               'load_seconds': round(seconds, 3)}
+            print(f"loaded {rows} synthetic readings in {seconds:.1f}s", file=sys.stderr)
+            if 'endpoints' in groups:
+                results += endpoint_benchmarks(app, args.repeat)
+            if 'queries' in groups:
+                results += query_benchmarks(app, args.repeat)
+            if 'serialization' in groups:
+                results += serialization_benchmarks(app, args.repeat)
+        if 'collector' in groups:
+            results += collector_benchmarks(args.repeat, [int(d) for d in args.collector_devices.split(',')])
+
+    regressed = compare(results, args.compare, args.threshold) if args.compare else False
+    report = json.dumps({'meta': meta, 'results': results}, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(report + '\n')
+    else:
+        print(report)
+    sys.exit(1 if regressed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+"""Exercise the Nest access token cache against a local stub token server.
+
+Checks that concurrent callers share a single refresh, that tokens are
+refreshed ahead of expiry, and that a second process-level cache picks the
+token up from disk, then reports per-call latency with and without the
+cache.
+
+Usage: python bench/bench_token_cache.py [--threads 50] [--delay 0.2]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stub_servers import StubApiServer
+
+
+def check(label, condition):
+    print(f"{'PASS' if condition else 'FAIL'}  {label}")
+    return condition
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=50)
+    parser.add_argument('--delay', type=float, default=0.2, help='stub token endpoint latency in seconds')
+    args = parser.parse_args()
+
+    server = StubApiServer(delay=args.delay, expires_in=4).start()
+
+    ok = True
+    with tempfile.TemporaryDirectory() as tmp:
+        cache_path = os.path.join(tmp, 'nest_token.json')
+        os.environ.update(server.environ())
+        os.environ.update({'NEST_TOKEN_CACHE_PATH': cache_path, 'NEST_TOKEN_REFRESH_MARGIN': '2'})
+
+        from app.nest_client import NestClient
+        from app.token_cache import TokenCache, token_cache as cache
+
+        # Stampede: every thread starts with a cold cache
+        with ThreadPoolExecutor(args.threads) as pool:
+            tokens = list(pool.map(lambda _: NestClient().get_access_token(), range(args.threads)))
+        ok &= check(f"{args.threads} concurrent cold calls -> 1 refresh (stub saw {server.calls['token']})",
+                    server.calls['token'] == 1 and cache.refreshes == 1 and set(tokens) == {'token-1'})
+
+        # Inside the refresh margin: one thread refreshes, the rest keep the old token
+        time.sleep(2.2)
+        with ThreadPoolExecutor(args.threads) as pool:
+            tokens = list(pool.map(lambda _: NestClient().get_access_token(), range(args.threads)))
+        ok &= check(f"refresh ahead of expiry -> 1 more refresh (stub saw {server.calls['token']})",
+                    server.calls['token'] == 2 and set(tokens) <= {'token-1', 'token-2'})
+
+        # A second process sharing the cache file reuses the token on disk
+        other = TokenCache(refresh_margin=2, path=cache_path)
+        token = other.get(NestClient().token_key(), lambda: None)
+        ok &= check(f"second cache loads token from disk (stub saw {server.calls['token']})",
+                    token == 'token-2' and server.calls['token'] == 2)
+
+        started = time.perf_counter()
+        for _ in range(1000):
+            NestClient().get_access_token()
+        cached = (time.perf_counter() - started) / 1000
+
+    client = NestClient()
+    started = time.perf_counter()
+    client.request_access_token()
+    uncached = time.perf_counter() - started
+
+    print(f"per-call latency: cached {cached * 1e6:.1f}us, token round trip {uncached * 1000:.1f}ms")
+    server.stop()
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
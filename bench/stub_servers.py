@@ -0,0 +1,173 @@
+"""Local stand-ins for the Google OAuth, Smart Device Management and
+OpenWeatherMap endpoints, for benchmarks that must not touch the real APIs.
+
+Point the clients at a running ``StubApiServer`` with ``server.environ()``.
+"""
+import json
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+PROJECT_ID = 'bench-project'
+
+
+def stub_device(index, with_traits=True):
+    device = {
+        'name': f'enterprises/{PROJECT_ID}/devices/device-{index}',
+        'type': 'sdm.devices.types.THERMOSTAT',
+        'displayName': f'Thermostat {index}',
+    }
+    if with_traits:
+        device['traits'] = {
+            'sdm.devices.traits.Temperature': {'ambientTemperatureCelsius': round(random.uniform(18, 23), 2)},
+            'sdm.devices.traits.Humidity': {'ambientHumidityPercent': random.randint(30, 60)},
+            'sdm.devices.traits.ThermostatMode': {'mode': 'HEAT'},
+            'sdm.devices.traits.ThermostatHvac': {'status': random.choice(('OFF', 'HEATING'))},
+            'sdm.devices.traits.ThermostatTemperatureSetpoint': {'heatCelsius': 21.0},
+        }
+    return device
+
+
+class StubApiServer(ThreadingHTTPServer):
+    """Serves token, devices.list, devices.get and weather with a fixed delay.
+
+    ``devices_without_traits`` leaves that many devices' traits out of the
+    list response, forcing the collector to fetch them individually.
+    ``calls`` counts requests per endpoint, and ``fail`` makes the next
+    requests to an endpoint return an error status, optionally with a
+    ``Retry-After`` header.
+    """
+    daemon_threads = True
+
+    def __init__(self, devices=2, delay=0.0, expires_in=3600, devices_without_traits=0):
+        super().__init__(('127.0.0.1', 0), StubApiHandler)
+        self.devices = devices
+        self.delay = delay
+        self.expires_in = expires_in
+        self.devices_without_traits = devices_without_traits
+        self.calls = Counter()
+        self.failures = {}
+        self.lock = threading.Lock()
+        self.thread = None
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+    def environ(self):
+        return {
+            'NEST_TOKEN_URL': f'{self.url}/token',
+            'NEST_API_URL': self.url,
+            'NEST_PROJECT_ID': PROJECT_ID,
+            'NEST_CLIENT_ID': 'bench-client',
+            'NEST_CLIENT_SECRET': 'bench-secret',
+            'NEST_REFRESH_TOKEN': 'bench-refresh',
+            'OPENWEATHER_URL': f'{self.url}/weather',
+            'OPENWEATHER_API_KEY': 'bench-key',
+            'LOCATION_LAT': '40.7',
+            'LOCATION_LON': '-74.0',
+        }
+
+    def count(self, endpoint):
+        with self.lock:
+            self.calls[endpoint] += 1
+            return self.calls[endpoint]
+
+    def fail(self, endpoint, status=503, times=1, retry_after=None):
+        """Answer the next ``times`` requests to ``endpoint`` with ``status``"""
+        with self.lock:
+            self.failures[endpoint] = [(status, retry_after)] * times
+
+    def next_failure(self, endpoint):
+        with self.lock:
+            pending = self.failures.get(endpoint)
+            return pending.pop(0) if pending else None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def handle_error(self, request, client_address):
+        # Clients that timed out close the connection before the response is written
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class StubApiHandler(BaseHTTPRequestHandler):
+    # Keep connections open between requests, like the real APIs
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out as separate writes; don't let Nagle hold the body back
+    disable_nagle_algorithm = True
+
+    def _send(self, payload, status=200, retry_after=None):
+        time.sleep(self.server.delay)
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        if retry_after is not None:
+            self.send_header('Retry-After', str(retry_after))
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _failed(self, endpoint):
+        """Send an injected error for ``endpoint`` if one is pending"""
+        failure = self.server.next_failure(endpoint)
+        if failure is None:
+            return False
+        status, retry_after = failure
+        self._send({'error': {'code': status, 'message': 'injected failure'}}, status, retry_after)
+        return True
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if self.path != '/token':
+            return self._send({'error': 'not found'}, 404)
+        count = self.server.count('token')
+        if self._failed('token'):
+            return
+        self._send({'access_token': f'token-{count}', 'expires_in': self.server.expires_in})
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        server = self.server
+        if path == '/weather':
+            server.count('weather')
+            if self._failed('weather'):
+                return
+            temp = round(random.uniform(-5, 15), 2)
+            return self._send({
+                # OpenWeatherMap refreshes current conditions about every 10 minutes
+                'dt': int(time.time()) // 600 * 600,
+                'main': {'temp': temp, 'humidity': 70},
+                'weather': [{'description': 'clear sky'}],
+                'wind': {'speed': 3.1},
+            })
+        if path == f'/enterprises/{PROJECT_ID}/devices':
+            server.count('devices.list')
+            if self._failed('devices.list'):
+                return
+            devices = [
+                stub_device(i, with_traits=i >= server.devices_without_traits)
+                for i in range(server.devices)
+            ]
+            return self._send({'devices': devices})
+        prefix = f'/enterprises/{PROJECT_ID}/devices/device-'
+        if path.startswith(prefix):
+            server.count('devices.get')
+            if self._failed('devices.get'):
+                return
+            return self._send(stub_device(int(path[len(prefix):])))
+        self._send({'error': 'not found'}, 404)
+
+    def log_message(self, *args):
+        pass
@@ -0,0 +1,291 @@
+#!/usr/bin/env python
+"""Generate realistic synthetic readings and bulk-load them into a database.
+
+Outside temperature follows a seasonal cycle (coldest mid-January), a daily
+cycle (warmest mid-afternoon) and a few days of correlated weather-front
+noise. Each thermostat is a small heat-loss model: the house drifts towards
+the outside temperature, and the HVAC runs with a deadband around a
+day/night setpoint schedule, so duty cycles lengthen in cold and hot
+weather. Heating runs in the cold season, cooling in the warm season, and
+the HVAC is off in between. Devices differ in insulation, heating and
+cooling power, and setpoints. The same seed always gives the same data.
+
+Readings are 5 minutes apart and end at the current time, so the API's
+``hours`` windows find data. Outside conditions are stored in
+``weather_observation`` once per 10 minutes and linked from the readings,
+as the collector does. The SQL backend is loaded with direct executemany
+inserts, and its rollups are rebuilt once at the end. Other backends go
+through ``storage.write`` a day at a time.
+
+Usage: python bench/synthetic.py --database data/synthetic.db [--days 1095] [--devices 4] [--seed 0]
+"""
+import argparse
+import math
+import os
+import sqlite3
+import sys
+import time
+from datetime import datetime
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+STEP_MINUTES = 5
+STEPS_PER_DAY = 24 * 60 // STEP_MINUTES
+# Readings per weather observation (OpenWeatherMap updates about every 10 minutes)
+STEPS_PER_OBSERVATION = 2
+LOCATION = (40.7, -74.0)
+DESCRIPTIONS = ('clear sky', 'few clouds', 'scattered clouds', 'overcast clouds', 'light rain')
+
+# Climate of the synthetic location, in °C
+ANNUAL_MEAN = 11.0
+ANNUAL_AMPLITUDE = 12.0
+DAILY_AMPLITUDE = 5.0
+FRONT_SIGMA = 3.0
+# Season's mean outside temperature below which the HVAC heats, above which it cools
+HEAT_BELOW = 15.0
+COOL_ABOVE = 21.0
+DEADBAND = 0.5
+
+
+def timeline(days, end=None):
+    """5-minute timestamps (numpy datetime64[us]) covering ``days`` up to ``end``"""
+    end = end or datetime.utcnow()
+    end = end.replace(second=0, microsecond=0, minute=end.minute - end.minute % STEP_MINUTES)
+    steps = days * STEPS_PER_DAY
+    offsets = np.arange(-steps + 1, 1, dtype='int64') * STEP_MINUTES * 60_000_000
+    return np.datetime64(end, 'us') + offsets.astype('timedelta64[us]')
+
+
+def outside_temperatures(times, rng):
+    """(outside temperature, seasonal mean) per timestamp"""
+    days = (times - times.astype('datetime64[Y]')).astype('timedelta64[m]').astype('float64') / 1440
+    hours = (times - times.astype('datetime64[D]')).astype('timedelta64[m]').astype('float64') / 60
+    seasonal = ANNUAL_MEAN - ANNUAL_AMPLITUDE * np.cos(2 * math.pi * (days - 15) / 365.25)
+    daily = DAILY_AMPLITUDE * np.cos(2 * math.pi * (hours - 15) / 24)
+
+    # Weather fronts: a mean-reverting daily anomaly, interpolated across each day
+    day_count = int(np.ceil(len(times) / STEPS_PER_DAY)) + 1
+    anomalies = np.empty(day_count)
+    anomaly = 0.0
+    for day, shock in enumerate(rng.normal(0, FRONT_SIGMA * 0.6, day_count)):
+        anomaly = 0.6 * anomaly + shock
+        anomalies[day] = anomaly
+    fronts = np.interp(np.arange(len(times)) / STEPS_PER_DAY, np.arange(day_count), anomalies)
+    return seasonal + daily + fronts, seasonal
+
+
+def device_profile(rng):
+    return {
+        'loss_per_hour': rng.uniform(0.05, 0.12),
+        'heat_per_hour': rng.uniform(2.5, 4.0),
+        'cool_per_hour': rng.uniform(1.5, 2.5),
+        'internal_per_hour': rng.uniform(0.1, 0.4),
+        'day_setpoint': round(rng.uniform(20, 22), 1),
+        'night_setpoint': round(rng.uniform(17, 19), 1),
+        'cool_setpoint': round(rng.uniform(23.5, 25.5), 1),
+        'start_hour': int(rng.integers(5, 8)),
+        'end_hour': int(rng.integers(21, 24)),
+    }
+
+
+def simulate_device(outside, seasonal, hours, rng, profile):
+    """Indoor temperature, target, mode and HVAC state per step for one thermostat"""
+    steps = len(outside)
+    dt = STEP_MINUTES / 60
+    loss = profile['loss_per_hour'] * dt
+    heat = profile['heat_per_hour'] * dt
+    cool = profile['cool_per_hour'] * dt
+    internal = profile['internal_per_hour'] * dt
+    awake = (hours >= profile['start_hour']) & (hours < profile['end_hour'])
+    modes = np.where(seasonal < HEAT_BELOW, 1, np.where(seasonal > COOL_ABOVE, 2, 0))
+    targets = np.where(modes == 2, profile['cool_setpoint'],
+                       np.where(awake, profile['day_setpoint'], profile['night_setpoint']))
+
+    temperature = np.empty(steps)
+    running = np.zeros(steps, dtype=bool)
+    current = float(targets[0])
+    on = False
+    for i, (out, mode, target) in enumerate(zip(outside.tolist(), modes.tolist(), targets.tolist())):
+        if mode == 1:
+            on = current < target - DEADBAND or (on and current < target + DEADBAND)
+        elif mode == 2:
+            on = current > target + DEADBAND or (on and current > target - DEADBAND)
+        else:
+            on = False
+        current += loss * (out - current) + internal
+        if on:
+            current += heat if mode == 1 else -cool
+        temperature[i] = current
+        running[i] = on
+
+    temperature = np.round(temperature + rng.normal(0, 0.05, steps), 2)
+    humidity = np.clip(np.round(42 + 0.5 * (outside - 10) + rng.normal(0, 2, steps)), 20, 70)
+    return {
+        'temperature_c': temperature,
+        'humidity': humidity,
+        'target_temperature_c': np.where(modes == 0, np.nan, targets),
+        'mode': modes,
+        'running': running,
+    }
+
+
+def generate(days, devices, seed=0, end=None):
+    """Synthetic readings as column arrays: ``times`` plus per-device and weather columns"""
+    rng = np.random.default_rng(seed)
+    times = timeline(days, end)
+    outside, seasonal = outside_temperatures(times, rng)
+    hours = (times - times.astype('datetime64[D]')).astype('timedelta64[h]').astype('int64')
+    return {
+        'times': times,
+        'outside': np.round(outside, 2),
+        'devices': [
+            (f'Thermostat {d}', simulate_device(outside, seasonal, hours, rng, device_profile(rng)))
+            for d in range(devices)
+        ],
+        'wind_speed': np.round(np.abs(rng.normal(3, 2, len(times))), 1),
+        'description': rng.integers(0, len(DESCRIPTIONS), len(times)),
+    }
+
+
+MODE_NAMES = ('OFF', 'HEAT', 'COOL')
+STATE_NAMES = ('OFF', 'HEATING', 'COOLING')
+
+
+def _fahrenheit(values):
+    return np.round(values * 9 / 5 + 32, 2)
+
+
+def _none_for_nan(values):
+    return [None if v != v else v for v in values.tolist()]
+
+
+def _device_columns(device):
+    state = np.where(device['running'], device['mode'], 0)
+    return (
+        device['temperature_c'].tolist(),
+        _fahrenheit(device['temperature_c']).tolist(),
+        device['humidity'].tolist(),
+        _none_for_nan(device['target_temperature_c']),
+        _none_for_nan(_fahrenheit(device['target_temperature_c'])),
+        [MODE_NAMES[m] for m in device['mode'].tolist()],
+        [STATE_NAMES[s] for s in state.tolist()],
+    )
+
+
+def reading_dicts(data, start, stop):
+    """Rows for steps [start, stop) in the shape ``storage.write`` takes"""
+    times = data['times'][start:stop].astype(datetime).tolist()
+    outside = data['outside'][start:stop]
+    outside_c, outside_f = outside.tolist(), _fahrenheit(outside).tolist()
+    rows = []
+    columns = [(name, _device_columns({k: v[start:stop] for k, v in device.items()}))
+               for name, device in data['devices']]
+    for i, timestamp in enumerate(times):
+        for name, (c, f, humidity, target_c, target_f, mode, state) in columns:
+            rows.append({
+                'timestamp': timestamp, 'device_name': name,
+                'temperature_c': c[i], 'temperature_f': f[i], 'humidity': humidity[i],
+                'target_temperature_c': target_c[i], 'target_temperature_f': target_f[i],
+                'hvac_mode': mode[i], 'hvac_state': state[i],
+                'outside_temperature_c': outside_c[i], 'outside_temperature_f': outside_f[i],
+            })
+    return rows
+
+
+def _sqlite_timestamps(times):
+    # The format SQLAlchemy's SQLite DateTime type stores
+    return np.char.replace(np.datetime_as_string(times, unit='us'), 'T', ' ').tolist()
+
+
+def load_sqlite(path, data, site_id):
+    """Insert ``data`` straight into the temperature_reading/weather_observation tables at ``path``"""
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA synchronous=OFF')
+    # Building the reading indexes once afterwards beats updating them per row
+    indexes = conn.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = 'temperature_reading' "
+        "AND sql IS NOT NULL"
+    ).fetchall()
+    for name, _ in indexes:
+        conn.execute(f'DROP INDEX {name}')
+    first_id = (conn.execute('SELECT MAX(id) FROM weather_observation').fetchone()[0] or 0) + 1
+    timestamps = _sqlite_timestamps(data['times'])
+    outside = data['outside']
+    observed = range(0, len(timestamps), STEPS_PER_OBSERVATION)
+    conn.executemany(
+        "INSERT INTO weather_observation (id, latitude, longitude, observed_at, fetched_at, temperature_c, "
+        "temperature_f, humidity, wind_speed, description) VALUES (?,?,?,?,?,?,?,?,?,?)",
+        (
+            (first_id + n, *LOCATION, timestamps[i], timestamps[i], float(outside[i]),
+             float(_fahrenheit(outside[i])), 70.0, float(data['wind_speed'][i]),
+             DESCRIPTIONS[data['description'][i]])
+            for n, i in enumerate(observed)
+        ),
+    )
+    observation_ids = (first_id + np.arange(len(timestamps)) // STEPS_PER_OBSERVATION).tolist()
+    columns = [(name, _device_columns(device)) for name, device in data['devices']]
+
+    def rows():
+        for i, timestamp in enumerate(timestamps):
+            for name, (c, f, humidity, target_c, target_f, mode, state) in columns:
+                yield (site_id, timestamp, name, c[i], f[i], humidity[i], target_c[i], target_f[i],
+                       mode[i], state[i], observation_ids[i])
+
+    conn.executemany(
+        "INSERT INTO temperature_reading (site_id, timestamp, device_name, temperature_c, temperature_f, "
+        "humidity, target_temperature_c, target_temperature_f, hvac_mode, hvac_state, weather_observation_id) "
+        "VALUES (?,?,?,?,?,?,?,?,?,?,?)",
+        rows(),
+    )
+    for _, sql in indexes:
+        conn.execute(sql)
+    conn.commit()
+    conn.close()
+
+
+def load(app, days, devices, seed=0, end=None):
+    """Generate and store readings for the app's default site; returns (rows, seconds)"""
+    from app import db
+    from app.cache import bump_generation
+    from app.rollups import rebuild_rollups
+    from app.sites import sites, site_engine, use_site
+    from app.storage import storage
+
+    started = time.perf_counter()
+    data = generate(days, devices, seed, end)
+    with app.app_context(), use_site(sites.default_id):
+        if storage.backend == 'sql':
+            engine = site_engine()
+            load_sqlite(engine.url.database, data, sites.default_id)
+            with engine.begin() as conn:
+                rebuild_rollups(conn)
+                conn.exec_driver_sql('ANALYZE')
+        else:
+            for start in range(0, len(data['times']), STEPS_PER_DAY):
+                storage.write(reading_dicts(data, start, start + STEPS_PER_DAY))
+        bump_generation()
+        db.session.commit()
+    return len(data['times']) * devices, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database', required=True, help='SQLite file to create or add to')
+    parser.add_argument('--days', type=int, default=1095)
+    parser.add_argument('--devices', type=int, default=4)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    os.environ['DATABASE_URL'] = f'sqlite:///{os.path.abspath(args.database)}'
+    os.environ.setdefault('SPOOL_PATH', '')
+    from app import create_app
+
+    rows, seconds = load(create_app(), args.days, args.devices, args.seed)
+    print(f"Loaded {rows} readings ({args.days} days x {args.devices} devices) into {args.database} "
+          f"in {seconds:.1f}s ({rows / seconds:,.0f} rows/s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,12 @@
+#!/usr/bin/env python
+"""Apply the retention policy to stored readings and reclaim the freed space."""
+from dotenv import load_dotenv
+load_dotenv()
+
+from app import create_app
+from app.retention import compact
+
+if __name__ == '__main__':
+    app = create_app()
+    with app.app_context():
+        compact()
@@ -0,0 +1,32 @@
+"""Gunicorn settings for the web service: gunicorn -c gunicorn.conf.py wsgi:app"""
+import os
+
+bind = os.getenv('WEB_BIND', '0.0.0.0:5001')
+workers = int(os.getenv('WEB_WORKERS', 2))
+# Threaded workers: each open /api/stream connection holds a thread. A
+# worker accepts at most SSE_MAX_SUBSCRIBERS streams (default: half of
+# WEB_THREADS) and answers the rest with 503, so the other threads always
+# serve API requests. Dashboards turned away poll with a cursor instead.
+# Live dashboards per deployment: WEB_WORKERS x SSE_MAX_SUBSCRIBERS (8 by default).
+worker_class = 'gthread'
+threads = int(os.getenv('WEB_THREADS', 8))
+timeout = int(os.getenv('WEB_TIMEOUT', 30))
+keepalive = 5
+
+# Build the app, run migrations and warm the statistics engine once in the
+# master; workers fork from it instead of repeating that work
+preload_app = True
+
+accesslog = os.getenv('WEB_ACCESS_LOG') or None
+errorlog = '-'
+
+
+def post_fork(server, worker):
+    # Connections opened while preloading belong to the master; give each
+    # worker a pool of its own without closing the master's sockets
+    from app import db
+    from wsgi import app
+
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
@@ -0,0 +1,38 @@
+#!/usr/bin/env python
+"""Apply pending schema migrations to the temperature database.
+
+--status lists pending migrations without applying them.
+--incremental-vacuum also switches databases created before incremental
+auto-vacuum to it. That takes one full VACUUM, which rewrites the file
+under an exclusive lock, so stop the collector first.
+"""
+import sys
+from dotenv import load_dotenv
+load_dotenv()
+
+from app import create_app, db
+from app.migrations import current_version, latest_version, pending_migrations, prepare
+from app.retention import enable_incremental_vacuum
+
+if __name__ == '__main__':
+    app = create_app(run_migrations=False)
+
+    with app.app_context():
+        # The main database and each sharded site's database
+        for bind_key, engine in db.engines.items():
+            print(f"{bind_key or 'main database'} ({engine.url.database}):")
+            if '--status' in sys.argv:
+                with engine.connect() as conn:
+                    print(f"Current schema version: {current_version(conn)}")
+                    print(f"Latest schema version: {latest_version()}")
+                    for migration in pending_migrations(conn):
+                        print(f"  pending {migration.VERSION:03d}: {migration.DESCRIPTION}")
+            else:
+                prepare(engine, db.metadata)
+                with engine.connect() as conn:
+                    print(f"Schema is at version {current_version(conn)}")
+                if '--incremental-vacuum' in sys.argv and engine.dialect.name == 'sqlite':
+                    if enable_incremental_vacuum(engine):
+                        print("Switched to incremental auto-vacuum")
+                    else:
+                        print("Already in incremental auto-vacuum mode")
@@ -1,6 +1,7 @@
-from app import create_app
-
-app = create_app()
+import os
+from wsgi import app
 
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5001)
\ No newline at end of file
+    # Flask's development server; production runs gunicorn (gunicorn.conf.py)
+    debug = os.getenv('FLASK_DEBUG', '').lower() in ('1', 'true', 'yes')
+    app.run(debug=debug, host='0.0.0.0', port=5001)
@@ -0,0 +1,9 @@
+#!/usr/bin/env python
+"""Run the long-lived temperature collector."""
+from dotenv import load_dotenv
+load_dotenv()
+
+from app.collector import Collector
+
+if __name__ == '__main__':
+    Collector().start()
@@ -1,65 +1,153 @@
 let temperatureChart = null;
 
+// The server downsamples the chart to at most this many points in total
+// (a week of 5-minute readings is about 2000); the HVAC bands come
+// separately, from every reading
+const MAX_CHART_POINTS = 200;
+
+// Columns the chart plots, fetched in the columnar response shape
+const CHART_FIELDS = [
+  "timestamp",
+  "temperature_c",
+  "outside_temperature_c",
+  "target_temperature_c",
+  "humidity",
+  "hvac_state",
+].join(",");
+
+// Site (home) picked in the page URL; every API call is scoped to it
+const SITE = new URLSearchParams(window.location.search).get("site");
+
+function apiUrl(url) {
+  if (!SITE) {
+    return url;
+  }
+  return url + (url.includes("?") ? "&" : "?") + `site=${encodeURIComponent(SITE)}`;
+}
+
+// Live updates pushed by /api/stream after each collection cycle
+let eventSource = null;
+// Window shown by the chart, the timestamps of its points, and the HVAC
+// bands from the server; a band reaching the newest reading stays open
+// so streamed readings can extend it
+let chartHours = null;
+let chartTimestamps = [];
+let chartBands = [];
+// Timestamp of the newest reading merged into the chart; passed as `after`
+// to fetch only what has been stored since
+let chartCursor = null;
+// Rollup bucket size (seconds) the server drew the chart at, or null for
+// raw readings; streamed raw readings can't be mixed into buckets, so a
+// bucketed chart fetches its open bucket again instead
+let chartResolution = null;
+
 async function loadCurrent() {
   try {
-    const response = await fetch("/api/current");
-    const data = await response.json();
-
-    document.getElementById("current-temp").textContent = data.temperature_c
-      ? `${Math.round(data.temperature_c * 2) / 2}°C`
-      : "--°C";
-    document.getElementById("current-humidity").textContent = data.humidity
-      ? `${Math.round(data.humidity)}%`
-      : "--%";
-    document.getElementById("target-temp").textContent =
-      data.target_temperature_c
-        ? `${Math.round(data.target_temperature_c * 2) / 2}°C`
-        : "--°C";
-    document.getElementById("hvac-status").textContent =
-      data.hvac_state || "--";
-    document.getElementById("outside-temp").textContent =
-      data.outside_temperature_c
-        ? `${Math.round(data.outside_temperature_c * 2) / 2}°C`
-        : "--°C";
+    const response = await fetch(apiUrl("/api/current"));
+    renderCurrent(await response.json());
   } catch (error) {
     console.error("Error loading current data:", error);
   }
 }
 
+function renderCurrent(data) {
+  document.getElementById("current-temp").textContent = data.temperature_c
+    ? `${Math.round(data.temperature_c * 2) / 2}°C`
+    : "--°C";
+  document.getElementById("current-humidity").textContent = data.humidity
+    ? `${Math.round(data.humidity)}%`
+    : "--%";
+  document.getElementById("target-temp").textContent =
+    data.target_temperature_c
+      ? `${Math.round(data.target_temperature_c * 2) / 2}°C`
+      : "--°C";
+  document.getElementById("hvac-status").textContent =
+    data.hvac_state || "--";
+  document.getElementById("outside-temp").textContent =
+    data.outside_temperature_c
+      ? `${Math.round(data.outside_temperature_c * 2) / 2}°C`
+      : "--°C";
+}
+
 async function loadStatistics(hours) {
   try {
-    const response = await fetch(`/api/statistics?hours=${hours}`);
-    const data = await response.json();
+    const response = await fetch(apiUrl(`/api/statistics?hours=${hours}`));
+    renderStatistics(await response.json());
+  } catch (error) {
+    console.error("Error loading statistics:", error);
+  }
+}
 
-    document.getElementById("avg-temp").textContent = data.avg_temperature
-      ? `${Math.round(data.avg_temperature * 2) / 2}°C`
+function renderStatistics(data) {
+  document.getElementById("avg-temp").textContent = data.avg_temperature
+    ? `${Math.round(data.avg_temperature * 2) / 2}°C`
+    : "--°C";
+  document.getElementById("min-temp").textContent = data.min_temperature
+    ? `${Math.round(data.min_temperature * 2) / 2}°C`
+    : "--°C";
+  document.getElementById("max-temp").textContent = data.max_temperature
+    ? `${Math.round(data.max_temperature * 2) / 2}°C`
+    : "--°C";
+  document.getElementById("avg-humidity").textContent = data.avg_humidity
+    ? `${data.avg_humidity}%`
+    : "--%";
+  document.getElementById("avg-outside-temp").textContent =
+    data.avg_outside_temperature
+      ? `${Math.round(data.avg_outside_temperature * 2) / 2}°C`
       : "--°C";
-    document.getElementById("min-temp").textContent = data.min_temperature
-      ? `${Math.round(data.min_temperature * 2) / 2}°C`
+  document.getElementById("min-outside-temp").textContent =
+    data.min_outside_temperature
+      ? `${Math.round(data.min_outside_temperature * 2) / 2}°C`
       : "--°C";
-    document.getElementById("max-temp").textContent = data.max_temperature
-      ? `${Math.round(data.max_temperature * 2) / 2}°C`
+  document.getElementById("max-outside-temp").textContent =
+    data.max_outside_temperature
+      ? `${Math.round(data.max_outside_temperature * 2) / 2}°C`
       : "--°C";
-    document.getElementById("avg-humidity").textContent = data.avg_humidity
-      ? `${data.avg_humidity}%`
-      : "--%";
-    document.getElementById("avg-outside-temp").textContent =
-      data.avg_outside_temperature
-        ? `${Math.round(data.avg_outside_temperature * 2) / 2}°C`
-        : "--°C";
-    document.getElementById("min-outside-temp").textContent =
-      data.min_outside_temperature
-        ? `${Math.round(data.min_outside_temperature * 2) / 2}°C`
-        : "--°C";
-    document.getElementById("max-outside-temp").textContent =
-      data.max_outside_temperature
-        ? `${Math.round(data.max_outside_temperature * 2) / 2}°C`
-        : "--°C";
+}
+
+async function loadAnalytics(hours) {
+  try {
+    const response = await fetch(apiUrl(`/api/analytics?hours=${hours}`));
+    renderAnalytics(await response.json());
   } catch (error) {
-    console.error("Error loading statistics:", error);
+    console.error("Error loading analytics:", error);
   }
 }
 
+function formatOrDash(value, format) {
+  return value === null || value === undefined ? "--" : format(value);
+}
+
+// Duty cycle, rates and the fitted thermal model per thermostat
+function renderAnalytics(data) {
+  const grid = document.getElementById("hvac-analytics");
+  grid.replaceChildren();
+  const prefix = data.devices.length > 1;
+  data.devices.forEach((device) => {
+    const model = device.thermal_model;
+    const items = [
+      ["Heating Duty", formatOrDash(device.heating_duty_cycle, (v) => `${Math.round(v * 100)}%`)],
+      ["Cooling Duty", formatOrDash(device.cooling_duty_cycle, (v) => `${Math.round(v * 100)}%`)],
+      ["Heating Cycles", `${device.heating_cycles}`],
+      ["Heat-up Rate", formatOrDash(device.heat_up_c_per_hour, (v) => `${v.toFixed(1)}°C/h`)],
+      ["Cool-down Rate", formatOrDash(device.cool_down_c_per_hour, (v) => `${v.toFixed(1)}°C/h`)],
+      ["Time Constant", formatOrDash(model.time_constant_hours, (v) => `${v.toFixed(1)} h`)],
+    ];
+    items.forEach(([label, value]) => {
+      const item = document.createElement("div");
+      item.className = "stat-item";
+      const labelElement = document.createElement("span");
+      labelElement.className = "stat-label";
+      labelElement.textContent = `${prefix ? device.device_name + " " : ""}${label}:`;
+      const valueElement = document.createElement("span");
+      valueElement.className = "stat-data";
+      valueElement.textContent = value;
+      item.append(labelElement, valueElement);
+      grid.append(item);
+    });
+  });
+}
+
 async function loadData(hours, buttonElement = null) {
   // Update active button
   document.querySelectorAll(".time-btn").forEach((btn) => {
@@ -86,102 +174,126 @@ async function loadData(hours, buttonElement = null) {
   }
 
   try {
-    const response = await fetch(`/api/temperatures?hours=${hours}`);
+    const response = await fetch(
+      apiUrl(
+        `/api/temperatures?hours=${hours}&max_points=${MAX_CHART_POINTS}` +
+          `&shape=columnar&bands=1&fields=${CHART_FIELDS}`
+      )
+    );
     const data = await response.json();
 
-    updateChart(data);
+    updateChart(data.readings, data.hvac_bands);
+    chartCursor = response.headers.get("X-Next-After");
+    chartResolution = Number(response.headers.get("X-Resolution")) || null;
     await loadStatistics(hours);
+    await loadAnalytics(hours);
+    if (chartHours !== hours) {
+      chartHours = hours;
+      connectStream(hours);
+    }
   } catch (error) {
     console.error("Error loading data:", error);
   }
 }
 
-function updateChart(data) {
-  const ctx = document.getElementById("temperatureChart").getContext("2d");
-
-  // Create annotations for HVAC states
-  const annotations = [];
-  let currentAnnotation = null;
-
-  data.forEach((point, index) => {
-    const hvacState = point.hvac_state;
-    const timestamp = new Date(point.timestamp + "Z").toLocaleString("en-US", {
-      timeZone: "America/New_York",
-    });
+const BAND_COLORS = {
+  HEATING: ["rgba(255, 99, 71, 0.2)", "rgba(255, 99, 71, 0.5)"], // Tomato
+  COOLING: ["rgba(135, 206, 235, 0.2)", "rgba(135, 206, 235, 0.5)"], // Sky blue
+};
 
-    if (hvacState === "HEATING" || hvacState === "COOLING") {
-      if (!currentAnnotation || currentAnnotation.type !== hvacState) {
-        // Start new annotation
-        currentAnnotation = {
-          type: hvacState,
-          startIndex: index,
-          endIndex: index,
-          startLabel: timestamp,
-          endLabel: timestamp,
-        };
-      } else {
-        // Extend current annotation
-        currentAnnotation.endIndex = index;
-        currentAnnotation.endLabel = timestamp;
-      }
+// Index of the first chart point at or after `date` (chartTimestamps is sorted)
+function pointIndexAtOrAfter(date) {
+  let low = 0;
+  let high = chartTimestamps.length;
+  while (low < high) {
+    const middle = (low + high) >> 1;
+    if (chartTimestamps[middle] < date) {
+      low = middle + 1;
     } else {
-      // End current annotation if exists
-      if (currentAnnotation) {
-        annotations.push({
-          type: "box",
-          xMin: currentAnnotation.startIndex,
-          xMax: currentAnnotation.endIndex,
-          backgroundColor:
-            currentAnnotation.type === "HEATING"
-              ? "rgba(255, 99, 71, 0.2)" // Tomato for heating
-              : "rgba(135, 206, 235, 0.2)", // Sky blue for cooling
-          borderColor:
-            currentAnnotation.type === "HEATING"
-              ? "rgba(255, 99, 71, 0.5)"
-              : "rgba(135, 206, 235, 0.5)",
-          borderWidth: 1,
-          label: {
-            content: currentAnnotation.type,
-            enabled: false,
-          },
-        });
-        currentAnnotation = null;
-      }
+      high = middle;
     }
-  });
+  }
+  return low;
+}
 
-  // Add final annotation if exists
-  if (currentAnnotation) {
+// Shaded boxes over the HEATING/COOLING bands, placed on the nearest points
+function hvacAnnotations(bands) {
+  const annotations = [];
+  bands.forEach((band) => {
+    const xMin = pointIndexAtOrAfter(band.start);
+    if (xMin >= chartTimestamps.length) {
+      return;
+    }
+    // The band ends at the first reading after the run
+    const xMax = Math.max(xMin, pointIndexAtOrAfter(band.end) - (band.open ? 0 : 1));
+    const [backgroundColor, borderColor] = BAND_COLORS[band.state];
     annotations.push({
       type: "box",
-      xMin: currentAnnotation.startIndex,
-      xMax: currentAnnotation.endIndex,
-      backgroundColor:
-        currentAnnotation.type === "HEATING"
-          ? "rgba(255, 99, 71, 0.2)"
-          : "rgba(135, 206, 235, 0.2)",
-      borderColor:
-        currentAnnotation.type === "HEATING"
-          ? "rgba(255, 99, 71, 0.5)"
-          : "rgba(135, 206, 235, 0.5)",
+      xMin: xMin,
+      xMax: Math.min(xMax, chartTimestamps.length - 1),
+      backgroundColor: backgroundColor,
+      borderColor: borderColor,
       borderWidth: 1,
       label: {
-        content: currentAnnotation.type,
+        content: band.state,
         enabled: false,
       },
     });
+  });
+  return annotations;
+}
+
+// Extend the bands with one newer reading, in timestamp order
+function extendBands(state, timestamp) {
+  const last = chartBands[chartBands.length - 1];
+  if (last && last.open) {
+    last.end = timestamp;
+    if (last.state === state) {
+      return;
+    }
+    last.open = false;
+  }
+  if (state === "HEATING" || state === "COOLING") {
+    chartBands.push({ state: state, start: timestamp, end: timestamp, open: true });
   }
+}
+
+const roundHalf = (t) => Math.round(t * 2) / 2;
+
+// The API returns naive UTC timestamps
+function parseTimestamp(timestamp) {
+  return new Date(timestamp + "Z");
+}
+
+function formatLabel(date) {
+  return date.toLocaleString("en-US", {
+    timeZone: "America/New_York",
+  });
+}
+
+function updateChart(columns, bands) {
+  const ctx = document.getElementById("temperatureChart").getContext("2d");
+
+  const labels = columns.timestamp.map((timestamp) =>
+    formatLabel(parseTimestamp(timestamp))
+  );
+
+  chartTimestamps = columns.timestamp.map(parseTimestamp);
+  const newest = columns.timestamp[columns.timestamp.length - 1];
+  chartBands = bands.map((band) => ({
+    state: band.state,
+    start: parseTimestamp(band.start),
+    end: parseTimestamp(band.end),
+    open: band.end === newest,
+  }));
+  const annotations = hvacAnnotations(chartBands);
 
   const chartData = {
-    labels: data.map((d) =>
-      new Date(d.timestamp + "Z").toLocaleString("en-US", {
-        timeZone: "America/New_York",
-      })
-    ),
+    labels: labels,
     datasets: [
       {
         label: "Temperature (°C)",
-        data: data.map((d) => Math.round(d.temperature_c * 2) / 2),
+        data: columns.temperature_c.map(roundHalf),
         borderColor: "#3498db",
         backgroundColor: "rgba(52, 152, 219, 0.1)",
         tension: 0.4,
@@ -189,10 +301,8 @@ function updateChart(data) {
       },
       {
         label: "Outside Temperature (°C)",
-        data: data.map((d) =>
-          d.outside_temperature_c
-            ? Math.round(d.outside_temperature_c * 2) / 2
-            : null
+        data: columns.outside_temperature_c.map((t) =>
+          t ? roundHalf(t) : null
         ),
         borderColor: "#9b59b6",
         backgroundColor: "rgba(155, 89, 182, 0.1)",
@@ -202,7 +312,7 @@ function updateChart(data) {
       },
       {
         label: "Target Temperature (°C)",
-        data: data.map((d) => Math.round(d.target_temperature_c * 2) / 2),
+        data: columns.target_temperature_c.map(roundHalf),
         borderColor: "#e74c3c",
         backgroundColor: "rgba(231, 76, 60, 0.1)",
         borderDash: [5, 5],
@@ -211,7 +321,7 @@ function updateChart(data) {
       },
       {
         label: "Humidity (%)",
-        data: data.map((d) => d.humidity),
+        data: columns.humidity,
         borderColor: "#2ecc71",
         backgroundColor: "rgba(46, 204, 113, 0.1)",
         tension: 0.4,
@@ -279,17 +389,183 @@ function updateChart(data) {
   temperatureChart = new Chart(ctx, config);
 }
 
+function chartValues(reading) {
+  return [
+    roundHalf(reading.temperature_c),
+    reading.outside_temperature_c
+      ? roundHalf(reading.outside_temperature_c)
+      : null,
+    roundHalf(reading.target_temperature_c),
+    reading.humidity,
+  ];
+}
+
+function insertPoint(index, timestamp, reading) {
+  chartTimestamps.splice(index, 0, timestamp);
+  temperatureChart.data.labels.splice(index, 0, formatLabel(timestamp));
+  const values = chartValues(reading);
+  temperatureChart.data.datasets.forEach((dataset, i) =>
+    dataset.data.splice(index, 0, values[i])
+  );
+}
+
+// Add new readings to the existing chart and drop points that have
+// scrolled out of the window, without rebuilding it. Late readings (e.g.
+// replayed from the collector's spool) go in at their place in time.
+function appendReadings(readings) {
+  if (!temperatureChart) {
+    return;
+  }
+  const newest = chartTimestamps[chartTimestamps.length - 1];
+  readings.forEach((reading) => {
+    const timestamp = parseTimestamp(reading.timestamp);
+    if (!newest || timestamp > newest) {
+      chartCursor = reading.timestamp;
+      extendBands(reading.hvac_state, timestamp);
+      insertPoint(chartTimestamps.length, timestamp, reading);
+      return;
+    }
+    const index = pointIndexAtOrAfter(timestamp);
+    // Already on the chart from the initial load or an earlier delta
+    if (chartTimestamps[index] && chartTimestamps[index].getTime() === timestamp.getTime()) {
+      return;
+    }
+    insertPoint(index, timestamp, reading);
+  });
+  redrawChart();
+}
+
+// Replace the chart's points from the first of `buckets` on with the
+// buckets, which come whole from the rollups (the last one still filling)
+function replaceBuckets(buckets) {
+  if (!temperatureChart || !buckets.length) {
+    return;
+  }
+  const index = pointIndexAtOrAfter(parseTimestamp(buckets[0].timestamp));
+  chartTimestamps.splice(index);
+  temperatureChart.data.labels.splice(index);
+  temperatureChart.data.datasets.forEach((dataset) => dataset.data.splice(index));
+  buckets.forEach((bucket) => {
+    const timestamp = parseTimestamp(bucket.timestamp);
+    extendBands(bucket.hvac_state, timestamp);
+    insertPoint(chartTimestamps.length, timestamp, bucket);
+  });
+  redrawChart();
+}
+
+function redrawChart() {
+  const cutoff = Date.now() - chartHours * 3600 * 1000;
+  while (chartTimestamps.length && chartTimestamps[0] < cutoff) {
+    chartTimestamps.shift();
+    temperatureChart.data.labels.shift();
+    temperatureChart.data.datasets.forEach((dataset) => dataset.data.shift());
+  }
+  chartBands = chartBands.filter((band) => band.end >= cutoff);
+
+  temperatureChart.options.plugins.annotation.annotations =
+    hvacAnnotations(chartBands);
+  temperatureChart.update("none");
+}
+
+// Merge whatever was stored after chartCursor into the chart; the live
+// stream sends its own statistics, so it skips reloading them
+async function loadDelta(withStatistics = true) {
+  if (!chartCursor) {
+    return loadData(chartHours);
+  }
+  try {
+    const response = await fetch(
+      apiUrl(
+        `/api/temperatures?hours=${chartHours}` +
+          `&after=${encodeURIComponent(chartCursor)}&fields=${CHART_FIELDS}`
+      )
+    );
+    const data = await response.json();
+
+    if (data.readings.length) {
+      if (chartResolution) {
+        replaceBuckets(data.readings);
+      } else {
+        appendReadings(data.readings);
+        renderCurrent(data.readings[data.readings.length - 1]);
+      }
+      if (withStatistics) {
+        if (chartResolution) {
+          await loadCurrent();
+        }
+        await loadStatistics(chartHours);
+        await loadAnalytics(chartHours);
+      }
+    }
+    chartCursor = data.next.after || chartCursor;
+    if (data.next.more) {
+      await loadDelta(withStatistics);
+    }
+  } catch (error) {
+    console.error("Error loading new readings:", error);
+  }
+}
+
+// Cursor polling for when the server has no stream slot left (503) or the
+// browser has no EventSource
+const POLL_INTERVAL_MS = 30000;
+let pollTimer = null;
+
+function startPolling() {
+  if (!pollTimer) {
+    pollTimer = setInterval(loadDelta, POLL_INTERVAL_MS);
+  }
+}
+
+function stopPolling() {
+  clearInterval(pollTimer);
+  pollTimer = null;
+}
+
+function connectStream(hours) {
+  stopPolling();
+  if (eventSource) {
+    eventSource.close();
+    eventSource = null;
+  }
+  if (!window.EventSource) {
+    startPolling();
+    return;
+  }
+  eventSource = new EventSource(apiUrl(`/api/stream?hours=${hours}`));
+  let dropped = false;
+
+  eventSource.addEventListener("readings", (event) => {
+    const readings = JSON.parse(event.data);
+    if (chartResolution) {
+      loadDelta(false);
+    } else {
+      appendReadings(readings);
+    }
+    renderCurrent(readings[readings.length - 1]);
+  });
+  eventSource.addEventListener("statistics", (event) => {
+    renderStatistics(JSON.parse(event.data));
+    loadAnalytics(hours);
+  });
+  // Readings committed while disconnected were never pushed, so catch up
+  // from the cursor once the browser has reconnected
+  eventSource.addEventListener("error", (event) => {
+    dropped = true;
+    // EventSource gives up for good on an error status such as 503
+    if (event.target.readyState === EventSource.CLOSED) {
+      startPolling();
+    }
+  });
+  eventSource.addEventListener("open", () => {
+    if (dropped) {
+      dropped = false;
+      loadDelta();
+    }
+  });
+}
+
 // Initial load
 loadCurrent();
 loadData(6);
 loadStatistics(6);
-
-// Refresh current data every minute
-setInterval(loadCurrent, 60000);
-
-// Refresh chart data every 5 minutes
-setInterval(() => {
-  const activeBtn = document.querySelector(".time-btn.active");
-  const hours = parseInt(activeBtn.textContent) || 24;
-  loadData(hours);
-}, 300000);
@@ -0,0 +1,34 @@
+import os
+import sys
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'bench'))
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    """The app on a throwaway SQLite database, with the response cache and spool off"""
+    monkeypatch.setenv('DATABASE_URL', f"sqlite:///{tmp_path / 'test.db'}")
+    monkeypatch.setenv('SPOOL_PATH', '')
+    monkeypatch.setenv('RESPONSE_CACHE_TTL', '0')
+    monkeypatch.setenv('LOG_LEVEL', 'WARNING')
+    monkeypatch.delenv('SITES_FILE', raising=False)
+    monkeypatch.delenv('STORAGE_BACKEND', raising=False)
+    from app import create_app
+    return create_app()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def stub_server():
+    """A local stand-in for the OAuth, SDM and weather APIs"""
+    from stub_servers import StubApiServer
+    server = StubApiServer().start()
+    yield server
+    server.stop()
@@ -0,0 +1,56 @@
+from datetime import datetime
+import pytest
+from app.analytics import Analytics
+from app.retention import RetentionPolicy, compact
+from synthetic import load
+
+NOW = datetime(2026, 3, 1)
+
+
+@pytest.fixture
+def loaded(app):
+    load(app, days=40, devices=2, seed=1, end=NOW)
+    return app
+
+
+def window(app, hours, device=None):
+    with app.app_context():
+        return Analytics().window(hours, device=device, now=NOW)
+
+
+def test_recent_window_comes_from_raw_readings(loaded):
+    result = window(loaded, 24 * 7)
+    assert result['source'] == 'raw'
+    assert result['raw_from'] == result['from']
+    assert all(d['estimated_hours'] == 0 for d in result['devices'])
+
+
+def test_hours_past_raw_retention_are_estimated_from_rollups(loaded):
+    before = window(loaded, 24 * 38)
+    with loaded.app_context():
+        compact(RetentionPolicy(raw_days=10), now=NOW)
+    after = window(loaded, 24 * 38)
+
+    assert after['source'] == 'raw+rollups'
+    assert after['from'] < after['raw_from'] < after['to']
+    assert len(after['devices']) == len(before['devices']) == 2
+    for old, new in zip(before['devices'], after['devices']):
+        # Retention keeps whole days, so at least the 27 days before the cutoff are estimated
+        assert new['estimated_hours'] >= 27 * 24
+        assert new['covered_hours'] == pytest.approx(old['covered_hours'], rel=0.02)
+        assert new['heating_hours'] == pytest.approx(old['heating_hours'], rel=0.05)
+        assert new['heating_duty_cycle'] == pytest.approx(old['heating_duty_cycle'], abs=0.02)
+        # Cycles need consecutive readings, which only the raw part has
+        assert new['heating_cycles'] < old['heating_cycles']
+
+
+def test_window_entirely_past_raw_retention(loaded):
+    with loaded.app_context():
+        compact(RetentionPolicy(raw_days=10), now=NOW)
+        result = Analytics().window(24, now=datetime(2026, 2, 1))
+    assert result['source'] == 'rollups'
+    assert result['raw_from'] is None
+    for device in result['devices']:
+        assert device['estimated_hours'] == device['covered_hours'] == 25
+        assert device['heating_cycles'] == 0
+        assert device['thermal_model']['loss_per_hour'] is None
@@ -0,0 +1,68 @@
+from datetime import datetime
+from types import SimpleNamespace
+import pytest
+from app import cache as cache_module
+from app import db
+from app.cache import ResponseCache, bump_generation, response_cache
+from app.storage import storage
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = SimpleNamespace(value=1000.0)
+    monkeypatch.setattr(cache_module, 'time', SimpleNamespace(monotonic=lambda: now.value))
+    return now
+
+
+def test_entries_expire_after_the_ttl(clock):
+    cache = ResponseCache(ttl=60)
+    cache.set('key', 1, 'body')
+    clock.value += 59
+    assert cache.get('key', 1) == 'body'
+    clock.value += 2
+    assert cache.get('key', 1) is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_least_recently_used_entry_is_evicted(clock):
+    cache = ResponseCache(max_entries=2, ttl=60)
+    cache.set('a', 1, 'A')
+    cache.set('b', 1, 'B')
+    assert cache.get('a', 1) == 'A'
+    cache.set('c', 1, 'C')
+    assert list(cache.entries) == ['a', 'c']
+    assert cache.get('b', 1) is None
+
+
+def test_entries_from_an_older_generation_miss(clock):
+    cache = ResponseCache(ttl=60)
+    cache.set('key', 1, 'body')
+    assert cache.get('key', 2) is None
+
+
+@pytest.fixture
+def cached(app, monkeypatch):
+    monkeypatch.setattr(response_cache, 'ttl', 300)
+    response_cache.clear()
+    yield app.test_client()
+    response_cache.clear()
+
+
+def test_new_readings_invalidate_cached_responses(app, cached):
+    first = cached.get('/api/statistics?hours=6')
+    again = cached.get('/api/statistics?hours=6')
+    assert (first.headers['X-Cache'], again.headers['X-Cache']) == ('MISS', 'HIT')
+    assert again.get_json() == first.get_json()
+    # Parameter order and empty values don't make a new entry
+    assert cached.get('/api/statistics?site=&hours=6').headers['X-Cache'] == 'HIT'
+
+    with app.app_context():
+        storage.write([{
+            'timestamp': datetime.utcnow(), 'device_name': 'Thermostat 0', 'temperature_c': 21.0,
+            'temperature_f': 69.8, 'humidity': 40.0, 'hvac_state': 'OFF',
+        }])
+        bump_generation()
+        db.session.commit()
+    fresh = cached.get('/api/statistics?hours=6')
+    assert fresh.headers['X-Cache'] == 'MISS'
+    assert fresh.get_json()['avg_temperature'] == 21.0
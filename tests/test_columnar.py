@@ -0,0 +1,123 @@
+from datetime import datetime, timedelta
+import pytest
+from app import db
+from app.storage import storage
+from app.storage.columnar import ColumnarStore
+
+START = datetime(2026, 1, 5, 22, 0)
+COLUMNS = ('timestamp', 'device_name', 'temperature_c', 'humidity', 'hvac_mode', 'hvac_state',
+           'outside_temperature_c')
+
+
+def reading(minutes, device='Thermostat 0', temperature=None, humidity=40.0, state='OFF', outside=4.0):
+    temperature = 20.0 + minutes % 7 / 4 if temperature is None else temperature
+    return {
+        'timestamp': START + timedelta(minutes=minutes), 'device_name': device, 'temperature_c': temperature,
+        'temperature_f': temperature * 9 / 5 + 32, 'humidity': humidity, 'target_temperature_c': 21.0,
+        'target_temperature_f': 69.8, 'hvac_mode': 'HEAT' if state != 'COOLING' else 'COOL',
+        'hvac_state': state, 'outside_temperature_c': outside,
+        'outside_temperature_f': None if outside is None else outside * 9 / 5 + 32,
+    }
+
+
+def readings():
+    """Two devices every 5 minutes across midnight, with some missing humidity and outside values"""
+    return [
+        reading(m, device, humidity=None if m % 30 == 0 else 40.0 + m % 11,
+                state='HEATING' if m % 20 == 0 else 'OFF', outside=None if m % 45 == 0 else 4.0 - m / 100)
+        for m in range(0, 240, 5) for device in ('Thermostat 0', 'Thermostat 1')
+    ]
+
+
+def as_tuples(rows):
+    return [tuple(row[column] for column in COLUMNS) for row in rows]
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ColumnarStore(str(tmp_path / 'columnar'))
+
+
+def test_readings_round_trip_across_day_partitions(store):
+    rows = readings()
+    store.write(rows)
+    expected = sorted(as_tuples(rows), key=lambda row: row[0])
+    assert [tuple(row) for row in store.readings(START, COLUMNS)] == expected
+
+    # [since, until), one device, read back by another process
+    since, until = START + timedelta(hours=1), START + timedelta(hours=3)
+    other = ColumnarStore(store.root)
+    window = [tuple(row) for row in other.readings(since, COLUMNS, until=until, device='Thermostat 1')]
+    assert window == [row for row in expected if since <= row[0] < until and row[1] == 'Thermostat 1']
+
+
+def test_late_rows_are_merged_in_timestamp_order(store):
+    store.write([reading(m) for m in (0, 5, 10, 15)])
+    late = reading(7, temperature=25.0)
+    late['timestamp'] += timedelta(seconds=30)
+    store.write([late])
+    store.write([reading(20)])
+
+    rows = list(store.readings(START, ('timestamp', 'temperature_c')))
+    assert [row.timestamp for row in rows] == sorted(row.timestamp for row in rows)
+    assert len(rows) == 6
+    assert (late['timestamp'], 25.0) in [tuple(row) for row in rows]
+
+
+def test_existing_keys_only_reports_stored_readings(store):
+    store.write([reading(m, device) for m in (0, 5) for device in ('Thermostat 0', 'Thermostat 1')])
+    candidates = [reading(5), reading(10), reading(0, 'Thermostat 1'), reading(0, 'Thermostat 2')]
+    assert store.existing_keys(candidates) == {
+        ('Thermostat 0', START + timedelta(minutes=5)), ('Thermostat 1', START),
+    }
+    assert store.existing_keys([]) == set()
+
+
+def test_latest_is_the_newest_reading_of_any_device(store):
+    assert store.latest(COLUMNS) is None
+    store.write([reading(m) for m in range(0, 180, 5)])
+    store.write([reading(m, 'Thermostat 1', humidity=None) for m in range(0, 185, 5)])
+    latest = store.latest(COLUMNS)
+    assert (latest.timestamp, latest.device_name, latest.humidity) == (
+        START + timedelta(minutes=180), 'Thermostat 1', None)
+
+
+@pytest.mark.parametrize('since_minutes', [0, 62, 150])
+def test_statistics_match_the_sql_backend(app, store, since_minutes):
+    rows = readings()
+    store.write(rows)
+    with app.app_context():
+        storage.write(rows)
+        db.session.commit()
+        since = START + timedelta(minutes=since_minutes)
+        expected = storage.statistics(since)
+    assert store.statistics(since) == pytest.approx(expected)
+
+
+@pytest.fixture
+def columnar_client(tmp_path, monkeypatch):
+    monkeypatch.setenv('DATABASE_URL', f"sqlite:///{tmp_path / 'test.db'}")
+    monkeypatch.setenv('SPOOL_PATH', '')
+    monkeypatch.setenv('RESPONSE_CACHE_TTL', '0')
+    monkeypatch.setenv('STORAGE_BACKEND', 'columnar')
+    monkeypatch.setenv('COLUMNAR_STORAGE_PATH', str(tmp_path / 'columnar'))
+    monkeypatch.delenv('SITES_FILE', raising=False)
+    from app import create_app
+    app = create_app()
+    now = datetime.utcnow().replace(microsecond=0)
+    with app.app_context():
+        storage.write([dict(reading(0), timestamp=now - timedelta(minutes=m)) for m in range(0, 120, 5)])
+    return app.test_client()
+
+
+@pytest.mark.parametrize('resolution', ['5min', 'hour', 'day'])
+def test_rollup_resolutions_are_rejected_without_rollups(columnar_client, resolution):
+    response = columnar_client.get(f'/api/temperatures?hours=24&resolution={resolution}')
+    assert response.status_code == 400
+    assert 'no rollups' in response.get_json()['error']
+
+
+def test_raw_and_auto_resolutions_read_the_arrays(columnar_client):
+    for resolution in ('raw', 'auto'):
+        body = columnar_client.get(f'/api/temperatures?hours=24&resolution={resolution}').get_json()
+        assert len(body) == 24
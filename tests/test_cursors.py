@@ -0,0 +1,95 @@
+from datetime import datetime, timedelta
+import pytest
+from app import db
+from app import routes
+from app.storage import storage
+
+
+def reading(timestamp, device='Thermostat 0', temperature=20.0):
+    return {
+        'timestamp': timestamp, 'device_name': device, 'temperature_c': temperature,
+        'temperature_f': temperature * 9 / 5 + 32, 'humidity': 40.0, 'target_temperature_c': None,
+        'target_temperature_f': None, 'hvac_mode': 'HEAT', 'hvac_state': 'OFF',
+        'outside_temperature_c': None, 'outside_temperature_f': None,
+    }
+
+
+@pytest.fixture
+def stored(app):
+    """Readings from 30 days ago (outside a 24h window) and from the last 10 hours, two devices"""
+    now = datetime.utcnow().replace(microsecond=0)
+    with app.app_context():
+        storage.write([reading(now - timedelta(days=30, minutes=m)) for m in range(0, 500, 5)])
+        storage.write([reading(now - timedelta(minutes=m), device)
+                       for m in range(0, 600, 5) for device in ('Thermostat 0', 'Thermostat 1')])
+        db.session.commit()
+    return now
+
+
+def test_since_id_only_returns_rows_inside_the_window(client, stored):
+    body = client.get('/api/temperatures?hours=24&since_id=0').get_json()
+    assert len(body['readings']) == 240
+    assert min(r['timestamp'] for r in body['readings']) >= (stored - timedelta(hours=24)).isoformat()
+    assert body['next']['more'] is False
+
+
+def test_since_id_pages_without_skipping_late_readings(app, client, stored, monkeypatch):
+    monkeypatch.setattr(routes, 'DELTA_PAGE_SIZE', 50)
+    with app.app_context():
+        # Stored last but older than most readings in the window
+        storage.write([reading(stored - timedelta(hours=5, minutes=1), 'Thermostat 2')])
+        db.session.commit()
+
+    seen = []
+    since_id = 0
+    while True:
+        body = client.get(f'/api/temperatures?hours=24&since_id={since_id}').get_json()
+        assert len(body['readings']) <= 50
+        seen.extend((r['device_name'], r['timestamp']) for r in body['readings'])
+        since_id = body['next']['since_id']
+        if not body['next']['more']:
+            break
+    assert len(seen) == len(set(seen)) == 241
+    assert ('Thermostat 2', (stored - timedelta(hours=5, minutes=1)).isoformat()) in seen
+
+
+def test_after_pages_never_split_a_timestamp(client, stored, monkeypatch):
+    monkeypatch.setattr(routes, 'DELTA_PAGE_SIZE', 25)
+    after = (stored - timedelta(hours=24)).isoformat()
+    seen = []
+    while True:
+        body = client.get(f'/api/temperatures?hours=24&after={after}').get_json()
+        assert len(body['readings']) <= 25
+        seen.extend((r['device_name'], r['timestamp']) for r in body['readings'])
+        after = body['next']['after']
+        if not body['next']['more']:
+            break
+    assert len(seen) == len(set(seen)) == 240
+
+
+def test_after_with_a_rollup_resolution_returns_whole_buckets(app, client, stored):
+    initial = client.get('/api/temperatures?hours=24&resolution=hour&fields=timestamp,device_name,temperature_c')
+    assert initial.headers['X-Resolution'] == '3600'
+    after = initial.headers['X-Next-After']
+    with app.app_context():
+        storage.write([reading(stored + timedelta(minutes=1), 'Thermostat 0', temperature=30.0)])
+        db.session.commit()
+
+    body = client.get(f'/api/temperatures?hours=24&resolution=hour&after={after}'
+                      '&fields=timestamp,device_name,temperature_c').get_json()
+    open_bucket = stored.replace(minute=0, second=0)
+    assert body['resolution'] == 3600
+    assert {r['timestamp'] for r in body['readings']} >= {open_bucket.isoformat()}
+    assert min(r['timestamp'] for r in body['readings']) == open_bucket.isoformat()
+    # The open bucket comes back with every reading in it, not just the new one
+    bucket = [r for r in body['readings']
+              if r['timestamp'] == open_bucket.isoformat() and r['device_name'] == 'Thermostat 0']
+    with app.app_context():
+        in_bucket = [r.temperature_c for r in storage.readings(open_bucket, ('temperature_c',), device='Thermostat 0')]
+    assert bucket[0]['temperature_c'] == pytest.approx(sum(in_bucket) / len(in_bucket))
+    assert body['next']['after'] == (stored + timedelta(minutes=1)).isoformat()
+
+    # Raw charts still get only the new readings
+    raw = client.get(f'/api/temperatures?hours=24&resolution=raw&after={after}').get_json()
+    assert [r['temperature_c'] for r in raw['readings']] == [30.0]
+    assert 'X-Resolution' not in client.get('/api/temperatures?hours=24&resolution=raw').headers
@@ -0,0 +1,82 @@
+from collections import namedtuple
+from datetime import datetime, timedelta
+import numpy as np
+import pytest
+from app.downsample import downsample_readings, hvac_bands
+
+Reading = namedtuple('Reading', 'timestamp device_name temperature_c hvac_state')
+
+START = datetime(2024, 1, 1)
+
+
+def series(hours, devices=2, seed=0):
+    """Five-minute readings that switch the heating on and off every 20-40 minutes"""
+    rng = np.random.default_rng(seed)
+    steps = hours * 12
+    readings = []
+    for d in range(devices):
+        runs = np.cumsum(rng.integers(4, 9, steps))
+        heating = np.searchsorted(runs, np.arange(steps), side='right') % 2 == 1
+        temperatures = 20 + np.cumsum(np.where(heating, 0.1, -0.08))
+        readings.extend(
+            Reading(START + timedelta(minutes=5 * i), f'Thermostat {d}', float(temperatures[i]),
+                    'HEATING' if heating[i] else 'OFF')
+            for i in range(steps)
+        )
+    readings.sort(key=lambda r: r.timestamp)
+    return readings
+
+
+@pytest.mark.parametrize('method', ['lttb', 'minmax'])
+@pytest.mark.parametrize('hours, max_points', [(720, 50), (48, 300), (168, 500), (48, 3)])
+def test_budget_is_respected(hours, max_points, method):
+    readings = series(hours)
+    result = downsample_readings(readings, max_points, method)
+    assert len(result) <= max_points
+    assert result == sorted(result, key=lambda r: r.timestamp)
+    assert set(result) <= set(readings)
+
+
+def test_ten_times_smaller_for_long_windows():
+    for hours in (48, 168):
+        readings = series(hours)
+        assert len(downsample_readings(readings, len(readings) // 10, 'lttb')) <= len(readings) // 10
+
+
+def test_short_series_are_returned_whole():
+    readings = series(2)
+    assert downsample_readings(readings, 1000) == readings
+
+
+def test_bands_cover_every_run_of_the_full_series():
+    readings = series(48)
+    bands = hvac_bands(readings)
+    result = downsample_readings(readings, 300)
+    assert len(result) <= 300 + len(bands)
+
+    for device in ('Thermostat 0', 'Thermostat 1'):
+        own = [r for r in readings if r.device_name == device]
+        starts = [b['start'] for b in bands if b['device_name'] == device]
+        expected = [
+            r.timestamp for previous, r in zip([None] + own, own)
+            if r.hvac_state == 'HEATING' and (previous is None or previous.hvac_state != 'HEATING')
+        ]
+        assert starts == expected
+
+    by_time = {(r.device_name, r.timestamp): r for r in readings}
+    for band in bands:
+        assert band['state'] == 'HEATING'
+        assert by_time[band['device_name'], band['start']].hvac_state == 'HEATING'
+        # Ends at the first reading in another state
+        assert by_time[band['device_name'], band['end']].hvac_state == 'OFF'
+
+
+def test_band_reaching_the_end_ends_at_the_last_reading():
+    readings = [
+        Reading(START + timedelta(minutes=5 * i), 'Thermostat 0', 20.0, state)
+        for i, state in enumerate(['OFF', 'COOLING', 'COOLING'])
+    ]
+    assert hvac_bands(readings) == [{
+        'device_name': 'Thermostat 0', 'state': 'COOLING',
+        'start': readings[1].timestamp, 'end': readings[2].timestamp,
+    }]
@@ -0,0 +1,87 @@
+import csv
+import gzip
+import io
+from datetime import datetime, timedelta
+import pytest
+from app import db
+from app.storage import storage
+
+START = datetime(2026, 1, 5, 12, 0)
+FIELDS = 'timestamp,device_name,temperature_c,humidity,hvac_state'
+
+
+@pytest.fixture
+def stored(app):
+    rows = [{
+        'timestamp': START + timedelta(minutes=m), 'device_name': device, 'temperature_c': 20.0 + m / 100,
+        'temperature_f': 68.0, 'humidity': None if m % 20 == 0 else 40.0, 'hvac_state': 'HEATING' if m % 10 else 'OFF',
+    } for m in range(0, 120, 5) for device in ('Thermostat 0', 'Thermostat 1')]
+    with app.app_context():
+        storage.write(rows)
+        db.session.commit()
+    return [
+        (row['timestamp'], row['device_name'], row['temperature_c'], row['humidity'], row['hvac_state'])
+        for row in sorted(rows, key=lambda r: (r['timestamp'], r['device_name']))
+    ]
+
+
+def export(client, **params):
+    params = dict({'from': START.isoformat(), 'fields': FIELDS}, **params)
+    return client.get('/api/export', query_string=params)
+
+
+def parse_csv(data):
+    reader = csv.reader(io.StringIO(data.decode()))
+    assert next(reader) == FIELDS.split(',')
+    return [
+        (datetime.fromisoformat(ts), device, float(t), float(h) if h else None, state)
+        for ts, device, t, h, state in reader
+    ]
+
+
+def test_csv_export_covers_the_half_open_range(client, stored):
+    end = START + timedelta(hours=1)
+    response = export(client, to=end.isoformat(), device='Thermostat 1')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/csv'
+    assert 'readings-20260105-20260105.csv' in response.headers['Content-Disposition']
+    assert parse_csv(response.data) == [row for row in stored if row[0] < end and row[1] == 'Thermostat 1']
+
+
+@pytest.mark.parametrize('compression', ['gzip', 'zstd'])
+def test_compressed_csv_decompresses_to_the_plain_export(client, stored, compression):
+    if compression == 'zstd':
+        zstandard = pytest.importorskip('zstandard')
+        decompress = lambda data: zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    else:
+        decompress = gzip.decompress
+    response = export(client, compression=compression)
+    suffix = {'gzip': 'gz', 'zstd': 'zst'}[compression]
+    assert response.headers['Content-Disposition'].endswith(f'.csv.{suffix}"')
+    assert parse_csv(decompress(response.data)) == stored
+
+
+@pytest.mark.parametrize('fmt, compression', [('arrow', None), ('arrow', 'gzip'), ('parquet', None),
+                                              ('parquet', 'zstd')])
+def test_arrow_and_parquet_exports_round_trip(client, stored, fmt, compression):
+    pa = pytest.importorskip('pyarrow')
+    import pyarrow.parquet as pq
+    response = export(client, format=fmt, compression=compression or '')
+    assert response.status_code == 200
+    data = response.data
+    if fmt == 'arrow':
+        table = pa.ipc.open_stream(gzip.decompress(data) if compression else data).read_all()
+    else:
+        # Parquet compresses column chunks, not the file
+        assert response.mimetype == 'application/vnd.apache.parquet'
+        table = pq.read_table(io.BytesIO(data))
+        assert pq.ParquetFile(io.BytesIO(data)).metadata.row_group(0).column(0).compression == \
+            (compression or 'snappy').upper()
+    assert table.column_names == FIELDS.split(',')
+    assert [tuple(row.values()) for row in table.to_pylist()] == stored
+
+
+def test_unknown_format_and_compression_are_rejected(client):
+    assert client.get('/api/export?format=xlsx').status_code == 400
+    assert client.get('/api/export?compression=brotli').status_code == 400
+    assert client.get('/api/export?from=yesterday').status_code == 400
@@ -0,0 +1,192 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+import pytest
+import requests
+from app import http_client as http_module
+from app.http_client import CircuitBreaker, CircuitOpenError, HttpClient
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Backoff delays the client asked for, without actually sleeping"""
+    slept = []
+    # Patch the module's view of time only; the stub server sleeps too
+    clock = SimpleNamespace(sleep=slept.append, monotonic=time.monotonic, perf_counter=time.perf_counter)
+    monkeypatch.setattr(http_module, 'time', clock)
+    return slept
+
+
+@pytest.fixture
+def weather_url(stub_server):
+    return f'{stub_server.url}/weather'
+
+
+def endpoint_stats(client):
+    return client.stats()['endpoints']['openweathermap.weather']
+
+
+@pytest.mark.parametrize('status', [429, 500, 502, 503, 504])
+def test_transient_statuses_are_retried(stub_server, weather_url, sleeps, status):
+    client = HttpClient(retries=3)
+    stub_server.fail('weather', status, times=2)
+    response = client.get(weather_url, 'openweathermap.weather')
+    assert response.status_code == 200
+    assert stub_server.calls['weather'] == 3
+    assert endpoint_stats(client)['retries'] == 2
+    assert len(sleeps) == 2
+
+
+def test_client_errors_are_not_retried(stub_server, weather_url, sleeps):
+    client = HttpClient(retries=3)
+    stub_server.fail('weather', 404)
+    assert client.get(weather_url, 'openweathermap.weather').status_code == 404
+    assert stub_server.calls['weather'] == 1
+    assert not sleeps
+
+
+def test_backoff_is_full_jitter_capped_exponential(stub_server, weather_url, sleeps):
+    client = HttpClient(retries=5, backoff_base=0.5, backoff_max=3)
+    stub_server.fail('weather', 503, times=5)
+    client.get(weather_url, 'openweathermap.weather')
+    assert len(sleeps) == 5
+    for attempt, delay in enumerate(sleeps):
+        assert 0 <= delay <= min(3, 0.5 * 2 ** attempt)
+
+
+def test_retry_after_overrides_the_backoff(stub_server, weather_url, sleeps):
+    client = HttpClient(retries=2, backoff_base=0.01, backoff_max=8)
+    stub_server.fail('weather', 429, times=1, retry_after=5)
+    assert client.get(weather_url, 'openweathermap.weather').status_code == 200
+    assert sleeps == [5.0]
+
+    # Capped at backoff_max, so a server can't park the collector
+    stub_server.fail('weather', 503, times=1, retry_after=120)
+    client.get(weather_url, 'openweathermap.weather')
+    assert sleeps[-1] == 8
+
+    # HTTP-date values fall back to the jittered backoff
+    stub_server.fail('weather', 503, times=1, retry_after='Wed, 21 Oct 2026 07:28:00 GMT')
+    client.get(weather_url, 'openweathermap.weather')
+    assert sleeps[-1] <= 0.01
+
+
+def test_exhausted_retries_return_the_last_response(stub_server, weather_url, sleeps):
+    client = HttpClient(retries=2)
+    stub_server.fail('weather', 503, times=3)
+    assert client.get(weather_url, 'openweathermap.weather').status_code == 503
+    assert stub_server.calls['weather'] == 3
+    assert endpoint_stats(client)['failures'] == 1
+    assert client.breaker('openweathermap').failures == 1
+
+
+def test_connection_errors_are_retried_then_raised(sleeps):
+    client = HttpClient(retries=2)
+    with pytest.raises(requests.ConnectionError):
+        client.get('http://127.0.0.1:9/weather', 'openweathermap.weather')
+    assert endpoint_stats(client)['requests'] == 3
+    assert client.breaker('openweathermap').failures == 1
+
+
+def test_success_resets_the_failure_count(stub_server, weather_url, sleeps):
+    client = HttpClient(retries=0, failure_threshold=3)
+    stub_server.fail('weather', 503, times=2)
+    for _ in range(2):
+        client.get(weather_url, 'openweathermap.weather')
+    client.get(weather_url, 'openweathermap.weather')
+    breaker = client.breaker('openweathermap')
+    assert (breaker.state, breaker.failures) == (CircuitBreaker.CLOSED, 0)
+
+
+def test_breaker_opens_and_skips_calls_during_the_cooldown(stub_server, weather_url, sleeps):
+    client = HttpClient(retries=0, failure_threshold=2, cooldown=30)
+    stub_server.fail('weather', 503, times=2)
+    for _ in range(2):
+        client.get(weather_url, 'openweathermap.weather')
+    assert client.breaker('openweathermap').state == CircuitBreaker.OPEN
+
+    with pytest.raises(CircuitOpenError) as raised:
+        client.get(weather_url, 'openweathermap.weather')
+    assert 29 < raised.value.retry_after <= 30
+    assert stub_server.calls['weather'] == 2
+    assert endpoint_stats(client)['short_circuited'] == 1
+
+    # Other dependencies are unaffected
+    sdm = client.get(f'{stub_server.url}/enterprises/bench-project/devices', 'sdm.devices.list')
+    assert sdm.status_code == 200
+
+
+def open_breaker(client, dependency):
+    breaker = client.breaker(dependency)
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+    # Pretend the cooldown has passed
+    breaker.opened_at -= breaker.cooldown
+    return breaker
+
+
+def test_half_open_lets_one_trial_call_through():
+    breaker = open_breaker(HttpClient(failure_threshold=2, cooldown=30), 'openweathermap')
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow()
+    assert breaker.retry_after() == 0
+
+
+def test_successful_trial_call_closes_the_breaker(stub_server, weather_url):
+    client = HttpClient(retries=0, failure_threshold=2, cooldown=30)
+    breaker = open_breaker(client, 'openweathermap')
+    assert client.get(weather_url, 'openweathermap.weather').status_code == 200
+    assert (breaker.state, breaker.failures) == (CircuitBreaker.CLOSED, 0)
+
+
+def test_failed_trial_call_reopens_the_breaker(stub_server, weather_url, sleeps):
+    client = HttpClient(retries=3, failure_threshold=2, cooldown=30)
+    breaker = open_breaker(client, 'openweathermap')
+    stub_server.fail('weather', 503, times=4)
+    assert client.get(weather_url, 'openweathermap.weather').status_code == 503
+    assert breaker.state == CircuitBreaker.OPEN
+    assert 29 < breaker.retry_after() <= 30
+    with pytest.raises(CircuitOpenError):
+        client.get(weather_url, 'openweathermap.weather')
+
+
+@pytest.mark.parametrize('error', [requests.TooManyRedirects, requests.exceptions.ContentDecodingError])
+def test_other_request_errors_settle_a_trial_call(sleeps, monkeypatch, error):
+    client = HttpClient(retries=3, failure_threshold=2, cooldown=30)
+    breaker = open_breaker(client, 'openweathermap')
+
+    def fail(*args, **kwargs):
+        raise error()
+    monkeypatch.setattr(client.session, 'request', fail)
+    with pytest.raises(error):
+        client.get('http://example.invalid/weather', 'openweathermap.weather')
+    assert breaker.state == CircuitBreaker.OPEN
+    assert (endpoint_stats(client)['requests'], endpoint_stats(client)['failures']) == (1, 1)
+    assert not sleeps
+
+
+def test_truncated_chunked_responses_are_retried(stub_server, weather_url, sleeps, monkeypatch):
+    client = HttpClient(retries=2)
+    send = client.session.request
+    calls = []
+
+    def flaky(*args, **kwargs):
+        calls.append(1)
+        if len(calls) == 1:
+            raise requests.exceptions.ChunkedEncodingError()
+        return send(*args, **kwargs)
+    monkeypatch.setattr(client.session, 'request', flaky)
+    assert client.get(weather_url, 'openweathermap.weather').status_code == 200
+    assert endpoint_stats(client)['retries'] == 1
+
+
+def test_endpoint_counters_are_safe_across_threads():
+    stats = http_module.EndpointStats()
+
+    def count(_):
+        for _ in range(1000):
+            stats.count('requests')
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(count, range(8)))
+    assert stats.snapshot()['requests'] == 8000
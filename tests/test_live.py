@@ -0,0 +1,92 @@
+import json
+from datetime import datetime, timedelta
+import pytest
+from app import db
+from app.cache import bump_generation
+from app.live import Subscription, broadcaster
+from app.storage import storage
+
+
+@pytest.fixture
+def app(app, monkeypatch):
+    broadcaster.max_subscribers = 2
+    monkeypatch.setattr(broadcaster, 'generation', {})
+    monkeypatch.setattr(broadcaster, 'cursor', {})
+    yield app
+    broadcaster.stop()
+    broadcaster.subscriptions.clear()
+
+
+def test_streams_beyond_the_limit_get_503(client):
+    first = client.get('/api/stream?hours=6')
+    second = client.get('/api/stream?hours=6')
+    assert first.status_code == second.status_code == 200
+    assert len(broadcaster.subscriptions) == 2
+
+    refused = client.get('/api/stream?hours=6')
+    assert refused.status_code == 503
+    assert refused.headers['Retry-After'] == '60'
+    assert 'error' in refused.get_json()
+
+    # Closing a stream frees its slot, even before any event was read
+    first.close()
+    assert len(broadcaster.subscriptions) == 1
+    third = client.get('/api/stream?hours=6')
+    assert third.status_code == 200
+    second.close()
+    third.close()
+    assert not broadcaster.subscriptions
+
+
+def test_default_limit_leaves_half_the_threads_for_api_requests(monkeypatch, tmp_path):
+    monkeypatch.setenv('DATABASE_URL', f"sqlite:///{tmp_path / 'limit.db'}")
+    monkeypatch.setenv('SPOOL_PATH', '')
+    monkeypatch.setenv('WEB_THREADS', '12')
+    monkeypatch.delenv('SSE_MAX_SUBSCRIBERS', raising=False)
+    from app import create_app
+    assert create_app().config['SSE_MAX_SUBSCRIBERS'] == 6
+
+
+def reading(timestamp, device='Thermostat 0'):
+    return {
+        'timestamp': timestamp, 'device_name': device, 'temperature_c': 20.0, 'temperature_f': 68.0,
+        'humidity': 40.0, 'target_temperature_c': None, 'target_temperature_f': None,
+        'hvac_mode': 'HEAT', 'hvac_state': 'OFF', 'outside_temperature_c': None, 'outside_temperature_f': None,
+    }
+
+
+def store(rows):
+    storage.write(rows)
+    bump_generation()
+    db.session.commit()
+
+
+def published_readings(subscription):
+    events = []
+    while not subscription.events.empty():
+        event, data = subscription.events.get_nowait().decode().splitlines()[1:3]
+        if event == 'event: readings':
+            events.append([(r['device_name'], r['timestamp']) for r in json.loads(data[len('data: '):])])
+    return events
+
+
+def test_late_readings_are_published_once(app):
+    now = datetime.utcnow().replace(microsecond=0)
+    # Registered directly so no broadcaster thread polls alongside the test
+    subscription = Subscription('default', 6, 32)
+    broadcaster.subscriptions.add(subscription)
+    with app.app_context():
+        store([reading(now - timedelta(minutes=10))])
+        broadcaster.poll('default')
+
+        store([reading(now)])
+        broadcaster.poll('default')
+        # Replayed from the spool after the newer cycle, and one from outside the window
+        store([reading(now - timedelta(minutes=5), 'Thermostat 1'), reading(now - timedelta(hours=7))])
+        broadcaster.poll('default')
+        broadcaster.poll('default')
+
+    assert published_readings(subscription) == [
+        [('Thermostat 0', now.isoformat())],
+        [('Thermostat 1', (now - timedelta(minutes=5)).isoformat())],
+    ]
@@ -0,0 +1,82 @@
+import re
+from datetime import datetime
+import pytest
+from app import db
+from app.metrics import CONTENT_TYPE, Family
+from app.storage import storage
+
+SAMPLE = re.compile(r'^(?P<name>[a-z_]+)(?:\{(?P<labels>.*)\})? (?P<value>\S+)$')
+LABEL = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+def scrape(client):
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.headers['Content-Type'] == CONTENT_TYPE
+    return parse(response.get_data(as_text=True))
+
+
+def parse(text):
+    """{name: [(labels, value)]} of every sample, checking each family is declared first"""
+    samples = {}
+    declared = {}
+    for line in text.splitlines():
+        if line.startswith('# TYPE '):
+            _, _, name, kind = line.split()
+            declared[name] = kind
+            continue
+        if line.startswith('#'):
+            continue
+        match = SAMPLE.match(line)
+        assert match, line
+        name = match['name']
+        family = re.sub(r'_(bucket|count|sum)$', '', name) if name not in declared else name
+        assert family in declared, line
+        samples.setdefault(name, []).append((dict(LABEL.findall(match['labels'] or '')), float(match['value'])))
+    return samples
+
+
+def value(samples, name, **labels):
+    matches = [v for sample_labels, v in samples.get(name, []) if labels.items() <= sample_labels.items()]
+    return sum(matches) if matches else None
+
+
+def test_metrics_cover_requests_queries_storage_and_caches(app, client):
+    before = scrape(client)
+    with app.app_context():
+        storage.write([{'timestamp': datetime.utcnow(), 'device_name': 'Hall', 'temperature_c': 20.0,
+                        'temperature_f': 68.0, 'humidity': 40.0, 'hvac_state': 'OFF'}])
+        db.session.commit()
+    for _ in range(3):
+        assert client.get('/api/statistics?hours=6').status_code == 200
+    client.get('/api/temperatures?resolution=bogus')
+    samples = scrape(client)
+
+    route = {'route': '/api/statistics', 'method': 'GET', 'status': '200'}
+    assert value(samples, 'http_request_duration_seconds_count', **route) == \
+        (value(before, 'http_request_duration_seconds_count', **route) or 0) + 3
+    assert value(samples, 'http_request_duration_seconds_count', route='/api/temperatures', status='400') >= 1
+
+    # Cumulative buckets end in +Inf, which equals the count
+    buckets = [(labels['le'], v) for labels, v in samples['http_request_duration_seconds_bucket']
+               if labels.items() >= route.items()]
+    counts = [v for _, v in buckets]
+    assert counts == sorted(counts)
+    assert buckets[-1] == ('+Inf', value(samples, 'http_request_duration_seconds_count', **route))
+
+    assert value(samples, 'db_query_duration_seconds_count', statement='SELECT') > 0
+    assert value(samples, 'db_rows_total', statement='INSERT') >= 1
+    assert value(samples, 'storage_rows_total', backend='sql', operation='write') >= 1
+    assert {labels['cache'] for labels, _ in samples['cache_requests_total']} >= {'response', 'weather_observation'}
+
+
+def test_label_values_are_escaped():
+    family = Family('example_total', 'counter', 'Example')
+    family.add(1, device='Living "room"\\upstairs\n')
+    assert family.render().splitlines()[-1] == 'example_total{device="Living \\"room\\"\\\\upstairs\\n"} 1'
+
+
+@pytest.mark.parametrize('raw, expected', [(None, 'NaN'), (float('inf'), '+Inf'), (0.25, '0.25'), (3, '3')])
+def test_values_use_the_text_format(raw, expected):
+    family = Family('example', 'gauge', 'Example', [('', {}, raw)])
+    assert family.render().splitlines()[-1] == f'example {expected}'
@@ -0,0 +1,78 @@
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import create_engine, text
+from app.migrations import current_version, discover_migrations, latest_version, prepare
+
+
+def test_new_database_is_stamped_instead_of_migrated(app):
+    from app import db
+    with app.app_context(), db.engine.connect() as conn:
+        assert current_version(conn) == latest_version()
+        versions = [row[0] for row in conn.execute(text("SELECT version FROM schema_version ORDER BY version"))]
+        columns = {row[1] for row in conn.execute(text("PRAGMA table_info(temperature_reading)"))}
+    assert versions == [m.VERSION for m in discover_migrations()]
+    # v001 would have added these back before v006 moved them out
+    assert 'outside_temperature_c' not in columns
+
+
+def legacy_database(path):
+    """A database from before the first migration"""
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE temperature_reading (id INTEGER PRIMARY KEY, timestamp DATETIME NOT NULL, "
+        "device_name VARCHAR(100) NOT NULL, temperature_c FLOAT NOT NULL, temperature_f FLOAT NOT NULL, "
+        "humidity FLOAT, target_temperature_c FLOAT, target_temperature_f FLOAT, hvac_mode VARCHAR(50), "
+        "hvac_state VARCHAR(50), outside_temperature_c FLOAT, outside_temperature_f FLOAT)"
+    )
+    conn.execute(
+        "INSERT INTO temperature_reading (timestamp, device_name, temperature_c, temperature_f, outside_temperature_c) "
+        "VALUES ('2026-01-01 00:00:00.000000', 'Hall', 20.5, 68.9, 4.0)"
+    )
+    conn.commit()
+    conn.close()
+
+
+def test_concurrent_startups_migrate_once(tmp_path):
+    from app import db
+    path = tmp_path / 'legacy.db'
+    legacy_database(path)
+
+    def start(_):
+        return prepare(create_engine(f'sqlite:///{path}'), db.metadata)
+
+    with ThreadPoolExecutor(4) as pool:
+        results = list(pool.map(start, range(4)))
+    assert sorted(results, key=len) == [[], [], [], [m.VERSION for m in discover_migrations()]]
+
+    engine = create_engine(f'sqlite:///{path}')
+    with engine.connect() as conn:
+        assert current_version(conn) == latest_version()
+        assert conn.execute(text("SELECT COUNT(*) FROM temperature_reading")).scalar() == 1
+        assert conn.execute(text("SELECT COUNT(*) FROM reading_rollup")).scalar() > 0
+
+
+def schema(engine, tables=('reading_rollup', 'data_generation', 'weather_observation')):
+    """Columns (name, type, not null, default) and index columns of ``tables``"""
+    with engine.connect() as conn:
+        columns = {
+            table: [tuple(row[1:5]) for row in conn.exec_driver_sql(f"PRAGMA table_info({table})")]
+            for table in tables
+        }
+        indexes = {
+            table: sorted(
+                tuple(row[2] for row in conn.exec_driver_sql(f"PRAGMA index_info('{index[1]}')"))
+                for index in conn.exec_driver_sql(f"PRAGMA index_list({table})")
+            )
+            for table in tables
+        }
+    return columns, indexes
+
+
+def test_migrated_tables_match_a_new_database(tmp_path):
+    from app import db
+    legacy_database(tmp_path / 'legacy.db')
+    migrated = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    prepare(migrated, db.metadata)
+    new = create_engine(f"sqlite:///{tmp_path / 'new.db'}")
+    prepare(new, db.metadata)
+    assert schema(migrated) == schema(new)
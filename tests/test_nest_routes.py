@@ -0,0 +1,68 @@
+import json
+import time
+import pytest
+from app.http_client import CircuitBreaker, http_client
+from app.nest_client import NestClient
+
+
+@pytest.fixture
+def app(app, monkeypatch):
+    monkeypatch.setenv('NEST_CLIENT_ID', 'client')
+    monkeypatch.setenv('NEST_REFRESH_TOKEN', f'refresh-{time.monotonic()}')
+    # Nothing listens here, so every call fails to connect
+    monkeypatch.setenv('NEST_TOKEN_URL', 'http://127.0.0.1:9/token')
+    monkeypatch.setattr(http_client, 'breakers', {})
+    monkeypatch.setattr(http_client, 'retries', 0)
+    return app
+
+
+def open_breaker(dependency, cooldown=30):
+    breaker = http_client.breaker(dependency)
+    breaker.cooldown = cooldown
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    return breaker
+
+
+@pytest.mark.parametrize('path', ['/api/nest/devices', '/api/nest/device/enterprises/p/devices/d'])
+def test_open_breaker_returns_503_with_retry_after(client, path):
+    open_breaker('oauth')
+    response = client.get(path)
+    assert response.status_code == 503
+    assert 'circuit is open' in response.get_json()['error']
+    assert 29 <= int(response.headers['Retry-After']) <= 30
+
+
+def test_retry_after_is_at_least_one_second(client):
+    breaker = open_breaker('oauth', cooldown=30)
+    breaker.opened_at -= 29.9
+    response = client.get('/api/nest/devices')
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+
+
+@pytest.mark.parametrize('path', ['/api/nest/devices', '/api/nest/device/enterprises/p/devices/d'])
+def test_unreachable_api_returns_503(client, path):
+    response = client.get(path)
+    assert response.status_code == 503
+    assert response.get_json() == {'error': 'External API unreachable; try again later'}
+    assert http_client.breaker('oauth').failures == 1
+
+
+def test_device_route_uses_the_selected_sites_credentials(tmp_path, monkeypatch):
+    sites_file = tmp_path / 'sites.json'
+    sites_file.write_text(json.dumps({'sites': [
+        {'id': 'home', 'nest': {'client_id': 'a', 'refresh_token': 'home-token'}},
+        {'id': 'cabin', 'nest': {'client_id': 'b', 'refresh_token': 'cabin-token'}},
+    ]}))
+    monkeypatch.setenv('DATABASE_URL', f"sqlite:///{tmp_path / 'sites.db'}")
+    monkeypatch.setenv('SPOOL_PATH', '')
+    monkeypatch.setenv('SITES_FILE', str(sites_file))
+    monkeypatch.setattr(NestClient, 'get_thermostat_data',
+                        lambda self, device_id: {'name': device_id, 'token': self.refresh_token})
+    from app import create_app
+    client = create_app().test_client()
+
+    assert client.get('/api/nest/device/d1?site=cabin').get_json() == {'name': 'd1', 'token': 'cabin-token'}
+    assert client.get('/api/nest/device/d1').get_json() == {'name': 'd1', 'token': 'home-token'}
@@ -0,0 +1,201 @@
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import delete, event, func, update
+from app import db
+from app.models import ReadingRollup, TemperatureReading, WeatherObservation
+from app.retention import (
+    INCREMENTAL, RetentionPolicy, _rollups_cover, compact, enable_incremental_vacuum, incremental_vacuum,
+    incremental_vacuum_enabled,
+)
+from app.rollups import HOUR
+from app.storage import storage
+from app.weather import store_observation
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    """A database created before incremental auto-vacuum was the default"""
+    monkeypatch.setenv('DATABASE_URL', f"sqlite:///{tmp_path / 'legacy.db'}")
+    monkeypatch.setenv('SPOOL_PATH', '')
+    monkeypatch.setenv('SQLITE_AUTO_VACUUM', '')
+    monkeypatch.delenv('SITES_FILE', raising=False)
+    from app import create_app
+    return create_app()
+
+
+def auto_vacuum():
+    with db.engine.connect() as conn:
+        return conn.exec_driver_sql("PRAGMA auto_vacuum").scalar()
+
+
+def test_scheduled_compaction_never_runs_a_full_vacuum(app, caplog):
+    with app.app_context():
+        assert auto_vacuum() != INCREMENTAL
+        summary = compact()['main']
+        assert auto_vacuum() != INCREMENTAL
+        assert summary['reclaimed_bytes'] == 0
+    assert 'migrate.py --incremental-vacuum' in caplog.text
+
+
+def test_enabling_incremental_vacuum_is_a_one_time_conversion(app):
+    with app.app_context():
+        assert enable_incremental_vacuum(db.engine)
+        assert incremental_vacuum_enabled(db.engine)
+        assert not enable_incremental_vacuum(db.engine)
+
+
+NOW = datetime(2026, 3, 1, 12, 0)
+
+
+@pytest.fixture
+def current(tmp_path, monkeypatch):
+    """A new database, so in incremental auto-vacuum mode"""
+    monkeypatch.setenv('DATABASE_URL', f"sqlite:///{tmp_path / 'current.db'}")
+    monkeypatch.setenv('SPOOL_PATH', '')
+    monkeypatch.setenv('COLUMNAR_STORAGE_PATH', str(tmp_path / 'columnar'))
+    monkeypatch.delenv('SQLITE_AUTO_VACUUM', raising=False)
+    monkeypatch.delenv('SITES_FILE', raising=False)
+    monkeypatch.delenv('STORAGE_BACKEND', raising=False)
+    from app import create_app
+    return create_app()
+
+
+def reading(timestamp, device='Thermostat 0'):
+    return {
+        'timestamp': timestamp, 'device_name': device, 'temperature_c': 20.0, 'temperature_f': 68.0,
+        'humidity': 40.0, 'target_temperature_c': 21.0, 'target_temperature_f': 69.8, 'hvac_mode': 'HEAT',
+        'hvac_state': 'HEATING', 'outside_temperature_c': None, 'outside_temperature_f': None,
+    }
+
+
+def store_days(first, last, step_minutes=60):
+    """Readings for two devices every ``step_minutes`` from ``first`` to ``last`` days ago"""
+    start = NOW - timedelta(days=first)
+    rows = [reading(start + timedelta(minutes=m), device)
+            for m in range(0, (first - last) * 24 * 60, step_minutes)
+            for device in ('Thermostat 0', 'Thermostat 1')]
+    storage.write(rows)
+    db.session.commit()
+    return rows
+
+
+def raw_count(**filters):
+    query = db.session.query(func.count(TemperatureReading.id))
+    if 'before' in filters:
+        query = query.filter(TemperatureReading.timestamp < filters['before'])
+    return query.scalar()
+
+
+def hourly_counts(start, end):
+    r = ReadingRollup
+    return dict(db.session.query(r.bucket_start, func.sum(r.count)).filter(
+        r.resolution == HOUR, r.bucket_start >= start, r.bucket_start < end,
+    ).group_by(r.bucket_start).all())
+
+
+def test_raw_readings_past_retention_are_deleted_in_batches(current):
+    policy = RetentionPolicy(raw_days=30, batch_size=50)
+    cutoff = policy.raw_cutoff(NOW)
+    with current.app_context():
+        store_days(35, 25)
+        expired = raw_count(before=cutoff)
+        kept = raw_count() - expired
+        history = hourly_counts(cutoff - timedelta(days=5), cutoff)
+
+        deletes = []
+        def count_deletes(conn, cursor, statement, parameters, context, executemany):
+            if statement.startswith('DELETE FROM temperature_reading'):
+                deletes.append(cursor.rowcount)
+        event.listen(db.engine, 'after_cursor_execute', count_deletes)
+        try:
+            summary = compact(policy, NOW)['main']
+        finally:
+            event.remove(db.engine, 'after_cursor_execute', count_deletes)
+
+        assert (summary['raw_deleted'], summary['rebuilt_days']) == (expired, 0)
+        assert raw_count(before=cutoff) == 0
+        assert raw_count() == kept
+        assert max(deletes) <= 50 and len(deletes) >= expired // 50
+        # The rollups still answer for the deleted days
+        assert hourly_counts(cutoff - timedelta(days=5), cutoff) == history
+
+
+def test_rollups_are_rebuilt_before_uncovered_raw_readings_go(current):
+    policy = RetentionPolicy(raw_days=30)
+    day = policy.raw_cutoff(NOW) - timedelta(days=1)
+    with current.app_context():
+        store_days(32, 30)
+        history = hourly_counts(day, day + timedelta(days=1))
+        with db.engine.begin() as conn:
+            assert _rollups_cover(conn, day, day + timedelta(days=1), policy, NOW)
+            # As if an hour's rollup missed some ingests
+            conn.execute(update(ReadingRollup.__table__)
+                         .where(ReadingRollup.resolution == HOUR, ReadingRollup.bucket_start == day)
+                         .values(count=ReadingRollup.count - 1))
+            assert not _rollups_cover(conn, day, day + timedelta(days=1), policy, NOW)
+
+        summary = compact(policy, NOW)['main']
+        assert summary['rebuilt_days'] >= 1
+        assert hourly_counts(day, day + timedelta(days=1)) == history
+
+
+def test_observations_go_with_the_raw_readings(current):
+    policy = RetentionPolicy(raw_days=30)
+    cutoff = policy.raw_cutoff(NOW)
+    with current.app_context():
+        for days in (40, 31, 1):
+            fetched_at = cutoff - timedelta(days=1) if days == 31 else NOW - timedelta(days=days)
+            store_observation(None, {'fetched_at': fetched_at, 'temperature_c': 4.0})
+        # Within a cache TTL of the cutoff, so a retained reading may still link to it
+        store_observation(None, {'fetched_at': cutoff - timedelta(seconds=60), 'temperature_c': 4.0})
+        db.session.commit()
+
+        assert compact(policy, NOW)['main']['observations_deleted'] == 2
+        remaining = db.session.query(WeatherObservation.fetched_at).order_by(WeatherObservation.fetched_at).all()
+        assert [row[0] for row in remaining] == [cutoff - timedelta(seconds=60), NOW - timedelta(days=1)]
+
+
+def test_incremental_vacuum_frees_a_batch_of_pages_per_commit(current):
+    with current.app_context():
+        assert incremental_vacuum_enabled(db.engine)
+        store_days(60, 0, step_minutes=5)
+        summary = compact(RetentionPolicy(raw_days=1, five_minute_days=1), NOW)['main']
+        assert summary['reclaimed_bytes'] > 0
+        with db.engine.connect() as conn:
+            assert conn.exec_driver_sql("PRAGMA freelist_count").scalar() == 0
+
+        # Free the pages again and count the vacuum statements it takes
+        db.session.execute(delete(ReadingRollup.__table__))
+        db.session.commit()
+        with db.engine.connect() as conn:
+            free = conn.exec_driver_sql("PRAGMA freelist_count").scalar()
+        assert free > 100
+        statements = []
+        def trace(dbapi_connection, record, proxy):
+            dbapi_connection.set_trace_callback(statements.append)
+        event.listen(db.engine, 'checkout', trace)
+        try:
+            incremental_vacuum(50)
+        finally:
+            event.remove(db.engine, 'checkout', trace)
+            db.engine.dispose()
+        vacuums = [s for s in statements if s.startswith('PRAGMA incremental_vacuum')]
+        assert len(vacuums) == -(-free // 50)
+        with db.engine.connect() as conn:
+            assert conn.exec_driver_sql("PRAGMA freelist_count").scalar() == 0
+
+
+def test_columnar_readings_are_kept_unless_a_retention_is_set(current, monkeypatch):
+    monkeypatch.setattr(storage, 'backend', 'columnar')
+    monkeypatch.setattr(storage, 'stores', {})
+    with current.app_context():
+        rows = store_days(40, 20)
+        assert compact(RetentionPolicy(), NOW)['columnar:default']['raw_deleted'] == 0
+
+        policy = RetentionPolicy(columnar_days=30)
+        cutoff = policy.cutoff(30, NOW)
+        summary = compact(policy, NOW)['columnar:default']
+        assert summary['raw_deleted'] == sum(row['timestamp'] < cutoff for row in rows)
+        left = list(storage.readings(NOW - timedelta(days=60), ('timestamp',)))
+        assert min(row.timestamp for row in left) == cutoff
+        assert len(left) == len(rows) - summary['raw_deleted']
@@ -0,0 +1,152 @@
+from datetime import datetime, timedelta
+import pytest
+from app import db
+from app.models import ReadingRollup
+from app.rollups import (
+    DAY, FIVE_MINUTES, HOUR, RESOLUTIONS, _raw_totals, _rollup_totals, bucket_floor, rebuild_rollups,
+    window_statistics,
+)
+from app.storage import storage
+
+START = datetime(2026, 1, 5, 23, 0)
+
+ROLLUP_COLUMNS = (
+    'count', 'temperature_sum', 'temperature_min', 'temperature_max', 'humidity_count', 'humidity_sum',
+    'humidity_min', 'humidity_max', 'outside_count', 'outside_sum', 'outside_min', 'outside_max',
+    'target_count', 'target_sum', 'heating_count', 'cooling_count',
+)
+
+
+def reading(minutes, device='Thermostat 0', temperature=20.0, humidity=40.0, outside=4.0, target=21.0,
+            state='OFF'):
+    return {
+        'timestamp': START + timedelta(minutes=minutes), 'device_name': device, 'temperature_c': temperature,
+        'temperature_f': temperature * 9 / 5 + 32, 'humidity': humidity, 'target_temperature_c': target,
+        'target_temperature_f': None if target is None else target * 9 / 5 + 32, 'hvac_mode': 'HEAT',
+        'hvac_state': state, 'outside_temperature_c': outside,
+        'outside_temperature_f': None if outside is None else outside * 9 / 5 + 32,
+    }
+
+
+def readings():
+    """Two devices for two hours across midnight, with gaps in the optional columns"""
+    return [
+        reading(m, device, temperature=19 + m % 13 / 2 + (device == 'Thermostat 1'),
+                humidity=None if m % 25 == 0 else 35.0 + m % 9, outside=None if m % 40 == 0 else 3.0 - m / 60,
+                target=None if m % 35 == 0 else 21.0, state=('HEATING', 'OFF', 'COOLING')[m // 5 % 3])
+        for m in range(0, 120, 2) for device in ('Thermostat 0', 'Thermostat 1')
+    ]
+
+
+def rollups():
+    """{(resolution, device, bucket start): column values} for every stored bucket"""
+    return {
+        (r.resolution, r.device_name, r.bucket_start): tuple(getattr(r, c) for c in ROLLUP_COLUMNS)
+        for r in ReadingRollup.query.all()
+    }
+
+
+def expected_bucket(rows):
+    def values(name):
+        return [row[name] for row in rows if row[name] is not None]
+    temperature, humidity = values('temperature_c'), values('humidity')
+    outside, target = values('outside_temperature_c'), values('target_temperature_c')
+    return (
+        len(rows), sum(temperature), min(temperature), max(temperature),
+        len(humidity), sum(humidity), min(humidity, default=None), max(humidity, default=None),
+        len(outside), sum(outside) if outside else None, min(outside, default=None), max(outside, default=None),
+        len(target), sum(target) if target else None,
+        sum(row['hvac_state'] == 'HEATING' for row in rows), sum(row['hvac_state'] == 'COOLING' for row in rows),
+    )
+
+
+def assert_same_buckets(actual, expected):
+    assert set(actual) == set(expected)
+    for key, values in expected.items():
+        assert actual[key] == pytest.approx(values), key
+
+
+def assert_buckets_match(actual, rows):
+    grouped = {}
+    for resolution in RESOLUTIONS:
+        for row in rows:
+            key = (resolution, row['device_name'], bucket_floor(row['timestamp'], resolution))
+            grouped.setdefault(key, []).append(row)
+    assert_same_buckets(actual, {key: expected_bucket(bucket_rows) for key, bucket_rows in grouped.items()})
+
+
+def test_ingest_accumulates_every_resolution_across_writes(app):
+    rows = readings()
+    with app.app_context():
+        # One cycle at a time, as the collector writes, so most rows hit an existing bucket
+        for timestamp in sorted({row['timestamp'] for row in rows}):
+            storage.write([row for row in rows if row['timestamp'] == timestamp])
+            db.session.commit()
+        actual = rollups()
+    assert_buckets_match(actual, rows)
+    # Midnight splits the daily buckets
+    assert {key[2] for key in actual if key[0] == DAY} == {datetime(2026, 1, 5), datetime(2026, 1, 6)}
+
+
+def test_upsert_keeps_min_max_when_a_later_reading_lacks_the_value(app):
+    with app.app_context():
+        storage.write([reading(0, humidity=None, outside=None)])
+        storage.write([reading(1, humidity=50.0, outside=2.0), reading(2, humidity=None, outside=None)])
+        db.session.commit()
+        bucket = ReadingRollup.query.filter_by(resolution=FIVE_MINUTES).one()
+    assert (bucket.count, bucket.humidity_count, bucket.humidity_min, bucket.humidity_max) == (3, 1, 50.0, 50.0)
+    assert (bucket.outside_count, bucket.outside_min, bucket.outside_max) == (1, 2.0, 2.0)
+
+
+def test_rebuild_matches_what_ingest_maintained(app):
+    rows = readings()
+    with app.app_context():
+        storage.write(rows)
+        db.session.commit()
+        ingested = rollups()
+
+        with db.engine.begin() as conn:
+            rebuild_rollups(conn)
+        db.session.expire_all()
+        assert_same_buckets(rollups(), ingested)
+
+        # A ranged rebuild only touches its own days
+        day = datetime(2026, 1, 6)
+        with db.engine.begin() as conn:
+            conn.execute(ReadingRollup.__table__.update().values(count=0))
+            rebuild_rollups(conn, day, day + timedelta(days=1))
+        db.session.expire_all()
+        rebuilt = rollups()
+    assert all(values[0] == 0 for key, values in rebuilt.items() if key[2] < day)
+    assert_same_buckets({key: values for key, values in rebuilt.items() if key[2] >= day},
+                        {key: values for key, values in ingested.items() if key[2] >= day})
+
+
+@pytest.mark.parametrize('resolution, start, end', [
+    (FIVE_MINUTES, START + timedelta(minutes=35), START + timedelta(minutes=95)),
+    (HOUR, START, START + timedelta(hours=2)),
+    (DAY, datetime(2026, 1, 5), datetime(2026, 1, 7)),
+])
+def test_rollup_totals_match_the_raw_aggregates(app, resolution, start, end):
+    with app.app_context():
+        storage.write(readings())
+        db.session.commit()
+        rolled = _rollup_totals(resolution, start, end)._asdict()
+        raw = _raw_totals(start, end)._asdict()
+    assert rolled == pytest.approx(raw)
+
+
+@pytest.mark.parametrize('offset', [timedelta(0), timedelta(minutes=7, seconds=30), timedelta(minutes=61)])
+def test_window_statistics_match_the_raw_aggregates(app, offset):
+    since = START + offset
+    rows = [row for row in readings() if row['timestamp'] >= since]
+    with app.app_context():
+        storage.write(readings())
+        db.session.commit()
+        stats = window_statistics(since)
+    temperature = [row['temperature_c'] for row in rows]
+    outside = [row['outside_temperature_c'] for row in rows if row['outside_temperature_c'] is not None]
+    assert stats['avg_temp'] == pytest.approx(sum(temperature) / len(temperature))
+    assert (stats['min_temp'], stats['max_temp']) == (min(temperature), max(temperature))
+    assert stats['avg_outside_temp'] == pytest.approx(sum(outside) / len(outside))
+    assert (stats['min_outside_temp'], stats['max_outside_temp']) == (min(outside), max(outside))
@@ -0,0 +1,124 @@
+import json
+import os
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.exc import OperationalError
+from app import db
+from app.models import WeatherObservation
+from app.sites import current_site_id, use_site
+from app.spool import spool, spool_replayer
+from app.storage import storage
+
+
+def test_only_collecting_processes_create_the_spool(tmp_path, monkeypatch):
+    monkeypatch.setenv('DATABASE_URL', f"sqlite:///{tmp_path / 'temperatures.db'}")
+    monkeypatch.delenv('SPOOL_PATH', raising=False)
+    monkeypatch.delenv('SITES_FILE', raising=False)
+    from app import create_app
+
+    create_app()
+    assert not spool.enabled
+    assert not os.path.exists(tmp_path / 'temperatures.db-spool')
+
+    create_app(use_spool=True)
+    assert spool.path == str(tmp_path / 'temperatures.db-spool')
+    assert os.path.isdir(spool.path)
+    create_app()
+    assert not spool.enabled
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    """The app with two sites sharing one database and a spool under ``tmp_path``"""
+    sites_file = tmp_path / 'sites.json'
+    sites_file.write_text(json.dumps({'sites': [{'id': 'home'}, {'id': 'cabin'}]}))
+    monkeypatch.setenv('DATABASE_URL', f"sqlite:///{tmp_path / 'test.db'}")
+    monkeypatch.setenv('SPOOL_PATH', str(tmp_path / 'spool'))
+    monkeypatch.setenv('RESPONSE_CACHE_TTL', '0')
+    monkeypatch.setenv('LOG_LEVEL', 'WARNING')
+    monkeypatch.setenv('SITES_FILE', str(sites_file))
+    monkeypatch.delenv('STORAGE_BACKEND', raising=False)
+    from app import create_app
+    app = create_app(use_spool=True)
+    # Replay by hand instead of from the background thread
+    monkeypatch.setattr(spool_replayer, 'notify', lambda: None)
+    return app
+
+
+NOW = datetime(2026, 1, 5, 12, 0)
+
+
+def reading(device, minutes=0):
+    return {
+        'timestamp': NOW + timedelta(minutes=minutes), 'device_name': device, 'temperature_c': 20.0,
+        'temperature_f': 68.0, 'humidity': 40.0, 'target_temperature_c': None,
+        'target_temperature_f': None, 'hvac_mode': 'HEAT', 'hvac_state': 'OFF',
+        'outside_temperature_c': 4.0, 'outside_temperature_f': 39.2,
+    }
+
+
+def weather(minutes=0):
+    return {'observed_at': NOW + timedelta(minutes=minutes), 'fetched_at': NOW + timedelta(minutes=minutes),
+            'temperature_c': 4.0, 'temperature_f': 39.2, 'humidity': 80, 'wind_speed': 3.0, 'description': 'rain'}
+
+
+def stored(app, site_id):
+    with app.app_context(), use_site(site_id):
+        readings = storage.readings(NOW - timedelta(days=1), ('device_name', 'weather_observation_id'))
+        observations = db.session.execute(select(func.count()).select_from(WeatherObservation)).scalar()
+        return sorted(readings), observations
+
+
+def test_replaying_a_segment_again_stores_nothing_twice(app):
+    spool.append('home', [reading('Thermostat 0'), reading('Thermostat 1')], weather(), None)
+    spool.append('home', [reading('Thermostat 0', 5)], weather(5), (51.5, -0.1))
+    segment = spool.seal()[0]
+    with open(segment, 'rb') as f:
+        saved = f.read()
+
+    with app.app_context():
+        assert spool.replay() == 3
+    first = stored(app, 'home')
+    assert first[1] == 2
+
+    # As if the process died between the commit and deleting the segment
+    with open(segment, 'wb') as f:
+        f.write(saved)
+    with app.app_context():
+        assert spool.replay() == 0
+    assert stored(app, 'home') == first
+    assert not os.path.exists(segment)
+
+
+def test_a_torn_last_line_is_skipped(app):
+    spool.append('home', [reading('Thermostat 0')], weather(), None)
+    spool.file.write(b'{"site_id":"home","readings":[{"timestamp":"2026-01')
+    spool.file.flush()
+    with app.app_context():
+        assert spool.replay() == 1
+    assert stored(app, 'home')[0] == [('Thermostat 0', 1)]
+
+
+def test_a_failing_site_is_retried_without_duplicating_the_others(app, monkeypatch):
+    spool.append('home', [reading('Thermostat 0')], weather(), None)
+    spool.append('cabin', [reading('Thermostat 9')], weather(), None)
+    write = storage.write
+
+    def cabin_locked(rows):
+        if current_site_id() == 'cabin':
+            raise OperationalError('INSERT', {}, Exception('database is locked'))
+        return write(rows)
+    monkeypatch.setattr(storage, 'write', cabin_locked)
+    with app.app_context(), pytest.raises(OperationalError):
+        spool.replay()
+    assert stored(app, 'cabin')[0] == []
+    assert len(spool.segments()) == 2
+
+    monkeypatch.setattr(storage, 'write', write)
+    with app.app_context():
+        assert spool.replay() == 1
+    assert [device for device, _ in stored(app, 'home')[0]] == ['Thermostat 0']
+    assert [device for device, _ in stored(app, 'cabin')[0]] == ['Thermostat 9']
+    # The sites share a database, so the identical report is stored once for both
+    assert stored(app, 'home')[1] == 1
@@ -0,0 +1,110 @@
+import random
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import delete
+from app import db
+from app.cache import bump_generation
+from app.models import TemperatureReading
+from app.stats_engine import WINDOWS, SiteStatistics
+from app.storage import storage
+
+DEVICES = ('Thermostat 0', 'Thermostat 1')
+
+
+def readings(start, end):
+    rows = []
+    timestamp = start
+    while timestamp < end:
+        for device in DEVICES:
+            temperature = round(random.uniform(15, 25), 2)
+            rows.append({
+                'timestamp': timestamp, 'device_name': device, 'temperature_c': temperature,
+                'temperature_f': temperature * 9 / 5 + 32, 'humidity': round(random.uniform(30, 60), 1),
+                'target_temperature_c': None, 'target_temperature_f': None, 'hvac_mode': 'HEAT',
+                'hvac_state': 'OFF', 'outside_temperature_c': round(random.uniform(-5, 10), 2),
+                'outside_temperature_f': None,
+            })
+        timestamp += timedelta(minutes=5)
+    return rows
+
+
+def write(rows):
+    storage.write(rows)
+    bump_generation()
+    db.session.commit()
+
+
+@pytest.fixture
+def engine(app, monkeypatch):
+    """A warmed engine over 8 days of readings, counting its re-warms"""
+    random.seed(0)
+    now = datetime(2026, 10, 1)
+    with app.app_context():
+        write(readings(now - timedelta(days=8), now))
+        engine = SiteStatistics()
+        engine.warm(now)
+        warm = engine.warm
+        engine.warms = 0
+
+        def counting_warm(now=None):
+            engine.warms += 1
+            return warm(now)
+        monkeypatch.setattr(engine, 'warm', counting_warm)
+        yield engine, now
+
+
+def assert_matches_storage(engine, now):
+    """Compare every window with the raw readings (storage.statistics may use rollups)"""
+    for hours in WINDOWS:
+        rows = list(storage.readings(now - timedelta(hours=hours), ('temperature_c', 'humidity', 'outside_temperature_c'),
+                                     until=now + timedelta(microseconds=1)))
+        temperatures = [r.temperature_c for r in rows]
+        outside = [r.outside_temperature_c for r in rows]
+        actual = engine.statistics(hours, now)
+        assert actual['avg_temp'] == pytest.approx(sum(temperatures) / len(rows)), hours
+        assert (actual['min_temp'], actual['max_temp']) == (min(temperatures), max(temperatures)), hours
+        assert actual['avg_humidity'] == pytest.approx(sum(r.humidity for r in rows) / len(rows)), hours
+        assert actual['avg_outside_temp'] == pytest.approx(sum(outside) / len(rows)), hours
+        assert (actual['min_outside_temp'], actual['max_outside_temp']) == (min(outside), max(outside)), hours
+
+
+def test_every_window_matches_storage(engine):
+    engine, now = engine
+    assert_matches_storage(engine, now)
+    assert engine.warms == 0
+
+
+def test_new_readings_are_added_without_a_rewarm(engine):
+    engine, now = engine
+    later = now + timedelta(hours=2)
+    write(readings(now, later))
+    assert_matches_storage(engine, later)
+    assert engine.warms == 0
+
+
+def test_generation_change_without_new_readings_keeps_the_windows(engine):
+    engine, now = engine
+    # What compaction does when it only touched readings older than every window
+    db.session.execute(delete(TemperatureReading).where(TemperatureReading.timestamp < now - timedelta(days=7, hours=1)))
+    bump_generation()
+    db.session.commit()
+    assert_matches_storage(engine, now)
+    assert engine.warms == 0
+
+
+def test_deleting_readings_inside_the_window_rewarms(engine):
+    engine, now = engine
+    db.session.execute(delete(TemperatureReading).where(TemperatureReading.timestamp < now - timedelta(days=6)))
+    bump_generation()
+    db.session.commit()
+    assert_matches_storage(engine, now)
+    assert engine.warms == 1
+
+
+def test_late_reading_rewarms(engine):
+    engine, now = engine
+    late = readings(now - timedelta(hours=4), now - timedelta(hours=4, minutes=-1))[0]
+    write([dict(late, timestamp=late['timestamp'] + timedelta(seconds=30), temperature_c=40.0)])
+    assert engine.statistics(6, now)['max_temp'] == 40.0
+    assert_matches_storage(engine, now)
+    assert engine.warms == 1
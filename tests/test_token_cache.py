@@ -0,0 +1,93 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+import requests
+from app.token_cache import TokenCache
+
+KEY = 'site-key'
+
+
+@pytest.fixture
+def fetch(stub_server):
+    """Fetch a token from the stub, returning None on an error status like NestClient does"""
+    def fetch():
+        response = requests.post(f'{stub_server.url}/token', timeout=5)
+        return response.json() if response.status_code == 200 else None
+    return fetch
+
+
+def concurrently(cache, fetch, threads=20):
+    with ThreadPoolExecutor(threads) as pool:
+        return list(pool.map(lambda _: cache.get(KEY, fetch), range(threads)))
+
+
+def test_concurrent_cold_callers_share_one_refresh(stub_server, fetch):
+    stub_server.delay = 0.1
+    cache = TokenCache()
+    tokens = concurrently(cache, fetch)
+    assert tokens == ['token-1'] * 20
+    assert stub_server.calls['token'] == 1
+    assert cache.refreshes == 1
+
+
+def test_cached_token_is_reused_until_the_refresh_margin(stub_server, fetch):
+    cache = TokenCache(refresh_margin=300)
+    assert cache.get(KEY, fetch) == 'token-1'
+    assert cache.get(KEY, fetch) == 'token-1'
+    assert (stub_server.calls['token'], cache.refreshes, cache.hits) == (1, 1, 1)
+
+    # Inside the margin but not yet expired: refresh ahead of expiry
+    cache.tokens[KEY] = ('token-1', time.time() + 60)
+    assert cache.get(KEY, fetch) == 'token-2'
+    assert stub_server.calls['token'] == 2
+
+
+def test_callers_keep_the_old_token_while_one_thread_refreshes(stub_server, fetch):
+    stub_server.delay = 0.2
+    cache = TokenCache(refresh_margin=300)
+    cache.tokens[KEY] = ('old', time.time() + 60)
+    tokens = concurrently(cache, fetch)
+    assert set(tokens) <= {'old', 'token-1'}
+    assert tokens.count('old') >= 1
+    assert stub_server.calls['token'] == 1
+    assert cache.tokens[KEY][0] == 'token-1'
+
+
+def test_callers_wait_for_the_refresh_once_the_token_expired(stub_server, fetch):
+    stub_server.delay = 0.1
+    cache = TokenCache()
+    cache.tokens[KEY] = ('old', time.time() - 1)
+    assert concurrently(cache, fetch) == ['token-1'] * 20
+    assert stub_server.calls['token'] == 1
+
+
+def test_failed_refresh_falls_back_to_a_still_valid_token(stub_server, fetch):
+    cache = TokenCache(refresh_margin=300)
+    cache.tokens[KEY] = ('old', time.time() + 60)
+    stub_server.fail('token', 500)
+    assert cache.get(KEY, fetch) == 'old'
+    assert cache.refreshes == 0
+
+    cache.tokens[KEY] = ('old', time.time() - 1)
+    stub_server.fail('token', 500)
+    assert cache.get(KEY, fetch) is None
+
+
+def test_invalidate_forces_a_refresh(stub_server, fetch):
+    cache = TokenCache()
+    assert cache.get(KEY, fetch) == 'token-1'
+    cache.invalidate(KEY)
+    assert cache.get(KEY, fetch) == 'token-2'
+
+
+def test_caches_share_tokens_through_the_file(stub_server, fetch, tmp_path):
+    path = str(tmp_path / 'nest_token.json')
+    first = TokenCache(path=path)
+    assert first.get(KEY, fetch) == 'token-1'
+
+    second = TokenCache(path=path)
+    assert second.get(KEY, fetch) == 'token-1'
+    assert stub_server.calls['token'] == 1
+
+    second.invalidate(KEY)
+    assert TokenCache(path=path).get(KEY, fetch) == 'token-2'
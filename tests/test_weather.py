@@ -0,0 +1,94 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import func
+from app import db
+from app.models import WeatherObservation
+from app.sites import use_site
+from app.spool import store_batches
+from app.storage import storage
+from app.weather import ObservationCache, location_key
+
+NOW = datetime(2026, 1, 5, 12, 0)
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    """Two sites sharing the main database and one in its own shard"""
+    sites_file = tmp_path / 'sites.json'
+    sites_file.write_text(json.dumps({'sites': [
+        {'id': 'home'}, {'id': 'neighbour'}, {'id': 'cabin', 'database': 'cabin.db'},
+    ]}))
+    monkeypatch.setenv('DATABASE_URL', f"sqlite:///{tmp_path / 'test.db'}")
+    monkeypatch.setenv('SPOOL_PATH', '')
+    monkeypatch.setenv('SITES_FILE', str(sites_file))
+    monkeypatch.delenv('STORAGE_BACKEND', raising=False)
+    from app import create_app
+    return create_app()
+
+
+def reading(device, timestamp=NOW):
+    return {
+        'timestamp': timestamp, 'device_name': device, 'temperature_c': 20.0, 'temperature_f': 68.0,
+        'humidity': 40.0, 'hvac_state': 'OFF', 'outside_temperature_c': 4.0, 'outside_temperature_f': 39.2,
+    }
+
+
+def weather(observed_at=NOW):
+    return {'observed_at': observed_at, 'fetched_at': NOW, 'temperature_c': 4.0, 'temperature_f': 39.2,
+            'humidity': 80, 'wind_speed': 3.0, 'description': 'rain'}
+
+
+def collect(site_id, devices, observation, location=(40.71, -74.01), timestamp=NOW):
+    with use_site(site_id):
+        store_batches([{'readings': [reading(d, timestamp) for d in devices], 'weather': observation,
+                        'location': location}])
+        db.session.commit()
+
+
+def observations(site_id):
+    with use_site(site_id):
+        return db.session.query(func.count(WeatherObservation.id)).scalar()
+
+
+def outside_temperatures(site_id):
+    with use_site(site_id):
+        rows = storage.readings(NOW - timedelta(hours=1), ('device_name', 'outside_temperature_c'))
+        return sorted(tuple(row) for row in rows)
+
+
+def test_one_observation_serves_every_device_and_site_at_a_location(app):
+    with app.app_context():
+        collect('home', ['Hall', 'Bedroom'], weather())
+        collect('neighbour', ['Lounge'], weather())
+        # The next cycle got the same report from the cache
+        collect('home', ['Hall', 'Bedroom'], weather(), timestamp=NOW + timedelta(minutes=5))
+        assert observations('home') == 1
+
+        # A newer report is a new observation
+        collect('neighbour', ['Lounge'], weather(NOW + timedelta(minutes=10)), timestamp=NOW + timedelta(minutes=10))
+        assert observations('home') == 2
+
+        # A sharded site stores its own copy in its own database
+        collect('cabin', ['Stove'], weather())
+        assert observations('cabin') == 1
+
+        assert outside_temperatures('home') == [('Bedroom', 4.0), ('Bedroom', 4.0), ('Hall', 4.0), ('Hall', 4.0)]
+        assert outside_temperatures('cabin') == [('Stove', 4.0)]
+
+
+def test_sites_at_the_same_rounded_location_share_one_fetch():
+    cache = ObservationCache(ttl=600)
+    fetched = []
+
+    def fetch():
+        fetched.append(1)
+        return weather()
+
+    locations = [location_key('40.7128', '-74.0060'), location_key(40.7131, -74.0058)] * 10
+    with ThreadPoolExecutor(8) as pool:
+        results = list(pool.map(lambda location: cache.get(location, fetch), locations))
+    assert len(fetched) == 1
+    assert all(result is results[0] for result in results)
+    assert location_key(None, '-74.0') is None
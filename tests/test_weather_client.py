@@ -0,0 +1,15 @@
+import logging
+from types import SimpleNamespace
+from app import weather_client
+from app.weather_client import WeatherClient
+
+
+def test_unexpected_errors_are_logged_with_the_traceback(monkeypatch, caplog):
+    malformed = SimpleNamespace(status_code=200, json=lambda: {'main': {}})
+    monkeypatch.setattr(weather_client.http_client, 'get', lambda *args, **kwargs: malformed)
+    client = WeatherClient(api_key='key', lat='40.7', lon='-74.0')
+
+    with caplog.at_level(logging.ERROR, logger='app.weather_client'):
+        assert client.get_current_weather() is None
+    record, = caplog.records
+    assert record.exc_info[0] is KeyError
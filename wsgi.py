@@ -0,0 +1,11 @@
+"""WSGI entry point for production serving: gunicorn -c gunicorn.conf.py wsgi:app"""
+from app import create_app
+from app.stats_engine import stats_engine
+
+app = create_app()
+
+# Load the statistics windows now rather than during the first request. With
+# preload_app this runs once in the gunicorn master and workers inherit it.
+if stats_engine.enabled:
+    with app.app_context():
+        stats_engine.warm()